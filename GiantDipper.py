@@ -1,14 +1,53 @@
-from datetime import datetime
+import asyncio
+from functools import partial
 from os.path import exists
 from sys import argv
 
 import yaml
 
-from giant_dipper.OrderManager import OrderManager
-from giant_dipper.OrderServices import RobinHoodOrderService, RealQuoteFakeOrderService
+from giant_dipper.AsyncOrderServices import AsyncLocalOrderService, AsyncRobinHoodOrderService
+from giant_dipper.Daemon import DEFAULT_TICK_INTERVAL, Daemon, DaemonTask
+from giant_dipper.OrderManager import OrderManager, DEFAULT_FETCH_TIMEOUT
+from giant_dipper.OrderServices import DEFAULT_CANCEL_TIMEOUT, RealQuoteFakeOrderService
 from giant_dipper.StateManagers import FileStateManager
-from giant_dipper.RobinHoodAuth import robinhood_auth
+from giant_dipper.RobinHoodAuth import RobinHoodSession
 
+
+# order manager placing real orders, and the state it keeps in files
+def load_order_manager(service_config, state_config, order_manager_config):
+    state = FileStateManager(state_config['orders_file'], state_config['historical_orders_file'])
+
+    manager = OrderManager.from_config(
+        order_service=AsyncRobinHoodOrderService(
+            service_config['symbol'],
+            cancel_timeout=service_config.get('cancel_timeout', DEFAULT_CANCEL_TIMEOUT)
+        ),
+        state_manager=state,
+        order_manager_config=order_manager_config,
+        fetch_timeout=service_config.get('fetch_timeout', DEFAULT_FETCH_TIMEOUT)
+    )
+
+    return manager, [state]
+
+
+# comparison order manager using a fake order state with real quotes, and the state it keeps in files
+def load_comparison(symbol, comparison_service_config, comparison_state_config, comparison_order_manager_config):
+    comparison_state = FileStateManager(comparison_state_config['orders_file'],
+                                        comparison_state_config['historical_orders_file'])
+    comparison_service = RealQuoteFakeOrderService(symbol, comparison_service_config['state_file'])
+
+    comparison_manager = OrderManager.from_config(
+        order_service=AsyncLocalOrderService(comparison_service),
+        state_manager=comparison_state,
+        order_manager_config=comparison_order_manager_config,
+        silent=True
+    )
+
+    return comparison_manager, [comparison_service, comparison_state]
+
+
+# Runs once per invocation by default, e.g. from a cron job. With --daemon, keeps running every daemon.tick_interval
+# seconds (60 by default) until interrupted or terminated.
 if len(argv) > 1 and exists(argv[1]):
     with open(argv[1]) as configuration_file:
         configuration = yaml.safe_load(configuration_file)
@@ -18,25 +57,11 @@ if len(argv) > 1 and exists(argv[1]):
             order_manager_config = configuration.get('order_manager')
 
             if service_config and state_config and order_manager_config:
-                robinhood_auth()
-
-                print(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                state = FileStateManager(state_config['orders_file'], state_config['historical_orders_file'])
-
-                manager = OrderManager(
-                    order_service=RobinHoodOrderService(service_config['symbol']),
-                    state_manager=state,
-                    price_increment_ratio=order_manager_config['price_increment_ratio'],
-                    order_quantity_ratio=order_manager_config['order_holdings_threshold'] /
-                    order_manager_config['quantity_threshold_ratio'],
-                    order_holdings_threshold=order_manager_config['order_holdings_threshold'],
-                    window_duration=order_manager_config.get('window_duration'),
-                    window_factor=order_manager_config.get('window_factor', 1),
-                    rebalance_interval=order_manager_config.get('rebalance_interval'),
-                    rebalance_threshold=order_manager_config.get('rebalance_threshold')
-                )
-                manager.run()
-                state.save()
+                session = RobinHoodSession()
+                session.ensure_logged_in()
+
+                tasks = [DaemonTask(partial(load_order_manager, service_config, state_config, order_manager_config),
+                                    print_metrics=True)]
 
                 # optional comparison configs allow for using a fake order state with real quotes and account holdings
                 # to test out alternative configurations
@@ -46,29 +71,19 @@ if len(argv) > 1 and exists(argv[1]):
                     comparison_order_manager_config = comparison_config.get('order_manager')
 
                     if comparison_service_config and comparison_state_config and comparison_order_manager_config:
-                        comparison_state = FileStateManager(comparison_state_config['orders_file'],
-                                                            comparison_state_config['historical_orders_file'])
-
                         # comparison can optionally specify its own symbol, otherwise fall back to the parent config
                         symbol = (comparison_service_config or {}).get('symbol', service_config['symbol'])
 
-                        comparison_service = RealQuoteFakeOrderService(symbol, comparison_service_config['state_file'])
-
-                        comparison_manager = OrderManager(
-                            order_service=comparison_service,
-                            state_manager=comparison_state,
-                            price_increment_ratio=comparison_order_manager_config['price_increment_ratio'],
-                            order_quantity_ratio=comparison_order_manager_config['order_holdings_threshold'] /
-                            comparison_order_manager_config['quantity_threshold_ratio'],
-                            order_holdings_threshold=comparison_order_manager_config['order_holdings_threshold'],
-                            window_duration=comparison_order_manager_config.get('window_duration'),
-                            window_factor=comparison_order_manager_config.get('window_factor', 1),
-                            rebalance_interval=comparison_order_manager_config.get('rebalance_interval'),
-                            rebalance_threshold=comparison_order_manager_config.get('rebalance_threshold'),
-                            silent=True
-                        )
-                        comparison_manager.run()
-                        comparison_service.save()
-                        comparison_state.save(silent=True)
-
-                print("")
+                        tasks.append(DaemonTask(partial(load_comparison, symbol, comparison_service_config,
+                                                        comparison_state_config, comparison_order_manager_config)))
+
+                # the live orders and the comparisons all run at once on one event loop
+                try:
+                    if '--daemon' in argv[2:]:
+                        daemon_config = configuration.get('daemon') or {}
+                        asyncio.run(Daemon(tasks, daemon_config.get('tick_interval', DEFAULT_TICK_INTERVAL),
+                                           session).run())
+                    else:
+                        asyncio.run(Daemon(tasks, session=session).run_once())
+                finally:
+                    session.close()
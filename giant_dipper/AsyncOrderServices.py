@@ -0,0 +1,117 @@
+import asyncio
+
+import robin_stocks
+
+from giant_dipper.Orders import Order
+from giant_dipper.OrderServices import DEFAULT_CANCEL_TIMEOUT, RobinHoodOrderService, cancel_poll_delays, \
+    robinhood_order
+from giant_dipper.OrderStatuses import OPEN_ORDER_STATUSES
+
+# seconds between checks of an order that's being waited on, e.g. until a cancel or market order completes
+DEFAULT_POLL_INTERVAL = 1
+
+
+# Async counterpart of RobinHoodOrderService, for OrderManager.run_async. robin_stocks only makes blocking requests, so
+# each one runs in the event loop's default executor; waits on orders to complete or cancel are asyncio sleeps, so
+# they don't hold up anything else driven by the event loop (e.g. other symbols or comparison strategies).
+class AsyncRobinHoodOrderService:
+    def __init__(self, symbol, disallow_orders=False, poll_interval=DEFAULT_POLL_INTERVAL,
+                 cancel_timeout=DEFAULT_CANCEL_TIMEOUT):
+        self.order_service = RobinHoodOrderService(symbol, disallow_orders, cancel_timeout)
+        self.symbol = symbol
+        self.disallow_orders = disallow_orders
+        self.poll_interval = poll_interval
+        self.cancel_timeout = cancel_timeout
+
+    async def get_quote(self):
+        return await asyncio.to_thread(self.order_service.get_quote)
+
+    async def get_order_info(self, order_id):
+        return await asyncio.to_thread(self.order_service.get_order_info, order_id)
+
+    async def get_holdings(self):
+        return await asyncio.to_thread(self.order_service.get_holdings)
+
+    async def get_buying_power(self):
+        return await asyncio.to_thread(self.order_service.get_buying_power)
+
+    def _check_order_allowed(self, call_name):
+        if self.disallow_orders:
+            raise Exception("AsyncRobinHoodOrderService.{} call not allowed".format(call_name))
+
+    async def cancel_order(self, order_id):
+        self._check_order_allowed('cancel_order')
+        await asyncio.to_thread(robin_stocks.robinhood.cancel_crypto_order, order_id)
+
+        # same backoff and timeout as RobinHoodOrderService.cancel_order
+        order = await asyncio.to_thread(robin_stocks.robinhood.get_crypto_order_info, order_id)
+        for delay in cancel_poll_delays(self.cancel_timeout):
+            if order['state'] not in OPEN_ORDER_STATUSES:
+                break
+
+            await asyncio.sleep(delay)
+            order = await asyncio.to_thread(robin_stocks.robinhood.get_crypto_order_info, order_id)
+
+        return Order.from_dict(order)
+
+    async def order_sell_limit(self, quantity, limit_price):
+        self._check_order_allowed('order_sell_limit')
+        return robinhood_order(await asyncio.to_thread(robin_stocks.robinhood.order_sell_crypto_limit, self.symbol,
+                                                       quantity, limit_price))
+
+    async def order_sell(self, quantity):
+        self._check_order_allowed('order_sell')
+        return await self._wait_for_order_complete(
+            await asyncio.to_thread(robin_stocks.robinhood.order_sell_crypto_by_quantity, self.symbol, quantity))
+
+    async def order_buy_limit(self, quantity, limit_price):
+        self._check_order_allowed('order_buy_limit')
+        return robinhood_order(await asyncio.to_thread(robin_stocks.robinhood.order_buy_crypto_limit, self.symbol,
+                                                       quantity, limit_price))
+
+    async def order_buy(self, buy_value):
+        self._check_order_allowed('order_buy')
+        return await self._wait_for_order_complete(
+            await asyncio.to_thread(robin_stocks.robinhood.order_buy_crypto_by_price, self.symbol, buy_value))
+
+    async def _wait_for_order_complete(self, order):
+        while 'id' in order and order['state'] in OPEN_ORDER_STATUSES:
+            await asyncio.sleep(self.poll_interval)
+            order = await asyncio.to_thread(robin_stocks.robinhood.get_crypto_order_info, order['id'])
+
+        return robinhood_order(order)
+
+
+# Async interface over an order service that keeps its account state locally (LocalAccountStateOrderService and its
+# subclasses, e.g. CSVFileOrderService or RealQuoteFakeOrderService). Their calls don't wait on anything, so they're
+# made directly; the wrapped service is still used for everything else, e.g. ticking through quotes or saving.
+class AsyncLocalOrderService:
+    def __init__(self, order_service):
+        self.order_service = order_service
+
+    async def get_quote(self):
+        return self.order_service.get_quote()
+
+    async def get_order_info(self, order_id):
+        return self.order_service.get_order_info(order_id)
+
+    async def get_holdings(self):
+        return self.order_service.get_holdings()
+
+    async def get_buying_power(self):
+        return self.order_service.get_buying_power()
+
+    async def cancel_order(self, order_id):
+        return self.order_service.cancel_order(order_id)
+
+    async def order_sell_limit(self, quantity, limit_price):
+        return self.order_service.order_sell_limit(quantity, limit_price)
+
+    async def order_sell(self, quantity):
+        return self.order_service.order_sell(quantity)
+
+    async def order_buy_limit(self, quantity, limit_price):
+        return self.order_service.order_buy_limit(quantity, limit_price)
+
+    async def order_buy(self, buy_value):
+        return self.order_service.order_buy(buy_value)
@@ -0,0 +1,509 @@
+import pickle
+import time
+
+import numpy
+
+from giant_dipper.Files import write_file_atomically
+from giant_dipper.OrderManager import BUY_ORDER_COLLAR, SELL_ORDER_COLLAR
+from giant_dipper.OrderSides import OrderSide
+from giant_dipper.OrderStatuses import OPEN_ORDER_STATUSES
+from giant_dipper.StateManagers import BaseStateManager
+
+# relative margin used when bounding the rebalance imbalance by its values at the lowest and highest prices, well above
+# any floating point error in computing it
+REBALANCE_BOUND_MARGIN = 1e-9
+
+# default number of seconds between checkpoints written by Backtest.run
+DEFAULT_CHECKPOINT_INTERVAL = 60
+
+# default number of upcoming ticks BatchBacktest checks for quiet ticks in each pass
+DEFAULT_BLOCK_TICKS = 64
+
+# default number of configurations BatchBacktest needs left to keep running them together, the rest are finished
+# through their own Backtest
+DEFAULT_MIN_BATCH = 4
+
+# position of needs_run in the states of BatchBacktest._state
+NEEDS_RUN = 8
+
+
+# Drives an OrderManager over the quotes of a CSVFileOrderService until the data runs out.
+#
+# In event-driven mode, after each run the backtest determines how many of the upcoming ticks are "quiet": no order
+# can be filled, no window shrinks enough to replace an order, and no rebalance starts or executes. Those ticks are
+# skipped in a single step, with only their bookkeeping (tick counters, window countdowns, rebalance price samples)
+# applied, so results match the per-tick loop.
+#
+# A checkpoint is a pickled snapshot of the whole simulation (the order manager, its state manager, and the order
+# service's account, orders and position in the quotes), without the quotes themselves. Backtests restored from a
+# checkpoint continue exactly where the original left off, and several can be restored from one checkpoint to branch
+# what-if runs from a shared warm-up. Checkpoints are pickles, so only load ones you wrote.
+class Backtest:
+    def __init__(self, order_manager):
+        self.order_manager = order_manager
+        self.order_service = order_manager.order_service
+        self.state_manager = order_manager.state_manager
+        # whether the order manager has run at the current minute
+        self.started = False
+        self.end_checkpoint = None
+
+    # run the order manager at the first minute, if it hasn't already
+    def start(self):
+        if not self.started:
+            self.order_manager.run()
+            self.started = True
+
+    # run to the end of the data, returns the final metrics; if checkpoint_file is provided, a checkpoint is written
+    # to it every checkpoint_interval seconds
+    #
+    # If keep_end_checkpoint is set, a checkpoint of the last minute the order manager ran at, before the final tick
+    # ran out of data, is kept as end_checkpoint. Restoring it with quotes that have had rows appended continues the
+    # run over the new rows only, with the same results as a full run over all of them.
+    def run(self, event_driven=False, checkpoint_file=None, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+            keep_end_checkpoint=False):
+        self.start()
+        last_checkpoint = time.monotonic()
+        while True:
+            if event_driven:
+                self.skip_quiet_ticks()
+
+            if checkpoint_file and time.monotonic() - last_checkpoint >= checkpoint_interval:
+                self.save_checkpoint(checkpoint_file)
+                last_checkpoint = time.monotonic()
+
+            # the next tick reaches the end of the data (or, when streaming, of the current chunk)
+            if keep_end_checkpoint and not self.order_service.remaining_ticks():
+                self.end_checkpoint = self.checkpoint()
+
+            if not self.order_service.tick():
+                break
+
+            self.order_manager.run()
+
+        return self.state_manager.compute_metrics()
+
+    def checkpoint(self):
+        return pickle.dumps(self, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # checkpoints don't include an earlier end_checkpoint
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['end_checkpoint'] = None
+
+        return state
+
+    def save_checkpoint(self, checkpoint_file):
+        write_file_atomically(checkpoint_file, self.checkpoint())
+
+    # restore a backtest from a checkpoint, with quotes attached by CSVFileOrderService.restore_tick_data
+    @classmethod
+    def from_checkpoint(cls, checkpoint, tick_data=None):
+        backtest = pickle.loads(checkpoint)
+        backtest.order_service.restore_tick_data(tick_data)
+
+        return backtest
+
+    @classmethod
+    def load_checkpoint(cls, checkpoint_file, tick_data=None):
+        with open(checkpoint_file, 'rb') as file:
+            return cls.from_checkpoint(file.read(), tick_data)
+
+    # independent copy of this backtest at its current position, sharing its quotes; the copy's order manager
+    # settings can be changed before running it
+    def fork(self):
+        return self.from_checkpoint(self.checkpoint(), self.order_service.tick_data)
+
+    # advance by the given number of ticks (each a tick of the order service followed by a run), skipping quiet
+    # ticks; returns false if the data ran out first
+    def advance(self, ticks):
+        self.start()
+        minute_increments = self.order_service.minute_increments
+        target_minute = self.order_service.minute_index + ticks * minute_increments
+        while True:
+            self.skip_quiet_ticks((target_minute - self.order_service.minute_index) // minute_increments)
+            if self.order_service.minute_index >= target_minute:
+                return True
+
+            if not self.order_service.tick():
+                return False
+
+            self.order_manager.run()
+
+    # fast-forward over upcoming ticks at which OrderManager.run would only update bookkeeping
+    def skip_quiet_ticks(self, max_ticks=None):
+        ticks = self.quiet_ticks()
+        if max_ticks is not None:
+            ticks = min(ticks, max_ticks)
+
+        if ticks:
+            coin_prices = self.order_service.skip_ticks(ticks)
+            self.state_manager.record_quiet_ticks(coin_prices, self.order_service.get_holdings(),
+                                                  self.order_service.get_buying_power())
+            self.order_manager.skip_window_ticks(ticks)
+            if self.order_manager.rebalance_interval:
+                self.state_manager.record_quiet_rebalance_ticks(coin_prices, self.order_manager.rebalance_interval,
+                                                                self.order_manager.rebalance_estimator)
+
+        return ticks
+
+    # number of upcoming ticks that are guaranteed to be quiet
+    def quiet_ticks(self):
+        open_orders = self.state_manager.open_orders
+        if not open_orders:
+            return 0
+
+        ticks = self.order_service.remaining_ticks()
+        for side in [OrderSide.BUY, OrderSide.SELL]:
+            if side in open_orders:
+                order = self.order_service.get_order_info(open_orders[side].id)
+                if not order or order.state not in OPEN_ORDER_STATUSES:
+                    return 0
+
+                window_ticks = self.order_manager.ticks_until_window_replace(side)
+                if window_ticks is not None:
+                    ticks = min(ticks, window_ticks)
+
+        rebalance_interval = self.order_manager.rebalance_interval
+        rebalance = self.state_manager.metrics.get('rebalance')
+        if rebalance_interval and rebalance:
+            ticks = min(ticks, rebalance_interval - rebalance['count'] - 1)
+
+        if ticks <= 0:
+            return 0
+
+        # the tick that fills an order isn't quiet, nor is any tick after it
+        minute_increments = self.order_service.minute_increments
+        minute_index = self.order_service.minute_index
+        fill_minute = self.order_service.next_fill_minute(minute_index + ticks * minute_increments)
+        ticks = min(ticks, (fill_minute - minute_index) // minute_increments)
+
+        if ticks > 0 and rebalance_interval and not rebalance:
+            start_index = self.state_manager.rebalance_start_index(self.order_service.upcoming_quotes(ticks),
+                                                                   self.order_manager.rebalance_threshold)
+            if start_index is not None:
+                ticks = start_index
+
+        return ticks
+
+
+# Runs many OrderManager configurations over the same quotes in one pass, with the same results as running each
+# through its own event-driven Backtest. The configurations' CSVFileOrderServices must share loaded (not streamed)
+# tick data, start_minute and minute_increments.
+#
+# The state that quiet ticks touch (tick counters, peak account value and drawdown, open limit prices, window
+# countdowns and rebalance samples, along with the holdings and buying power behind them) is kept in arrays, one
+# entry per configuration. Each pass finds how many of the next block_ticks ticks are quiet for every configuration
+# at once, from the lows, highs and quotes of each tick worked out up front, and applies their bookkeeping with a
+# handful of array operations. Configurations that then reach a tick that isn't quiet run their OrderManager for it,
+# as a single backtest would, and their arrays are refreshed from it. So finding and skipping quiet ticks costs a few
+# array operations per pass for the whole batch, rather than several for each configuration every time it runs.
+#
+# Configurations whose quiet ticks can't be applied in bulk (state managers that record every tick, window durations
+# that aren't whole numbers of ticks, or rebalance estimates) are run through their own event-driven Backtest instead.
+class BatchBacktest:
+    def __init__(self, order_managers, block_ticks=DEFAULT_BLOCK_TICKS, min_batch=DEFAULT_MIN_BATCH):
+        self.backtests = [Backtest(order_manager) for order_manager in order_managers]
+        self.block_ticks = block_ticks
+        self.min_batch = min_batch
+
+        first_service = self.backtests[0].order_service
+        tick_data = first_service.tick_data
+        self.minute_increments = first_service.minute_increments
+        self.start_minute = first_service.minute_index
+        for backtest in self.backtests:
+            service = backtest.order_service
+            if service.tick_data is not tick_data or service.tick_chunks or \
+                    service.minute_increments != self.minute_increments or service.minute_index != self.start_minute:
+                raise Exception('All configurations in a batch must share loaded (not streamed) quotes, start_minute '
+                                'and minute_increments')
+
+        # the rest are run through their own Backtest
+        self.batched = [backtest for backtest in self.backtests if self.batchable(backtest.order_manager)]
+
+        # ticks are numbered from start_minute; tick i moves from the quote of tick i to that of tick i + 1, checking
+        # for fills at each minute in between, and filling a buy order priced over buy_fill_prices[i] or a sell order
+        # priced under sell_fill_prices[i] (the lowest low and highest high of those minutes with the collar applied,
+        # which are the same as the lowest and highest of each minute's with it applied)
+        self.tick_count = (len(tick_data) - 1 - self.start_minute) // self.minute_increments
+        tick_minutes = self.tick_count * self.minute_increments
+        lows = tick_data.low[self.start_minute:self.start_minute + tick_minutes]
+        highs = tick_data.high[self.start_minute:self.start_minute + tick_minutes]
+        if self.minute_increments > 1 and self.tick_count:
+            tick_starts = numpy.arange(0, tick_minutes, self.minute_increments)
+            lows = numpy.minimum.reduceat(lows, tick_starts)
+            highs = numpy.maximum.reduceat(highs, tick_starts)
+        self.buy_fill_prices = lows * BUY_ORDER_COLLAR
+        self.sell_fill_prices = highs * SELL_ORDER_COLLAR
+        self.quotes = tick_data.open[self.start_minute:self.start_minute + tick_minutes + 1:self.minute_increments]
+
+        # ticks until a window shrinks or a rebalance executes are set to this when there isn't one coming, more than
+        # are ever skipped
+        self.no_limit = self.tick_count + 1
+
+        config_count = len(self.batched)
+        self.rebalance_interval = numpy.array([backtest.order_manager.rebalance_interval or 0
+                                               for backtest in self.batched], dtype=numpy.int64)
+        self.rebalance_threshold = numpy.array([backtest.order_manager.rebalance_threshold or 0
+                                                for backtest in self.batched], dtype=numpy.float64)
+        self.tick = numpy.zeros(config_count, dtype=numpy.int64)
+        # whether the arrays hold bookkeeping that hasn't been copied back to the configuration yet
+        self.skipped = numpy.zeros(config_count, dtype=bool)
+
+        # refreshed from each configuration by _load
+        self.ticks_from_start = numpy.zeros(config_count, dtype=numpy.int64)
+        self.ticks_since_last_order = numpy.zeros(config_count, dtype=numpy.int64)
+        self.longest_ticks_between_orders = numpy.zeros(config_count, dtype=numpy.int64)
+        self.last_price = numpy.zeros(config_count)
+        self.peak_account_value = numpy.zeros(config_count)
+        self.max_drawdown = numpy.zeros(config_count)
+        self.holdings = numpy.zeros(config_count)
+        self.buying_power = numpy.zeros(config_count)
+        self.needs_run = numpy.zeros(config_count, dtype=bool)
+        self.buy_limit = numpy.zeros(config_count)
+        self.sell_limit = numpy.zeros(config_count)
+        self.rebalancing = numpy.zeros(config_count, dtype=bool)
+        self.rebalance_count = numpy.zeros(config_count, dtype=numpy.int64)
+        self.rebalance_total = numpy.zeros(config_count)
+        self.rebalance_ticks = numpy.zeros(config_count, dtype=numpy.int64)
+        self.window_remaining = {side: numpy.zeros(config_count, dtype=numpy.int64)
+                                 for side in [OrderSide.BUY, OrderSide.SELL]}
+        self.window_ticks = {side: numpy.zeros(config_count, dtype=numpy.int64)
+                             for side in [OrderSide.BUY, OrderSide.SELL]}
+
+    # whether an order manager's quiet ticks can be applied by the batch
+    @staticmethod
+    def batchable(order_manager):
+        window_duration = order_manager.window_duration
+        return type(order_manager.state_manager).record_quiet_ticks is BaseStateManager.record_quiet_ticks and \
+            (not window_duration or isinstance(window_duration, int)) and order_manager.rebalance_estimator is None
+
+    # run all configurations to the end of the data, returns the final metrics of each
+    def run(self):
+        for backtest in self.backtests:
+            if not self.batchable(backtest.order_manager):
+                backtest.run(event_driven=True)
+
+        for backtest in self.batched:
+            backtest.start()
+        active = numpy.arange(len(self.batched))
+        self._load(active, [self._state(backtest, 0) for backtest in self.batched])
+
+        while len(active) >= self.min_batch:
+            remaining = self.tick_count - self.tick[active]
+            quiet = self._quiet_ticks(active, remaining)
+            self._skip(active, quiet)
+
+            # the rest of the data is quiet, only the final tick (which runs out of data) is left
+            finished = quiet == remaining
+            for index in self._store(active[finished]):
+                self.batched[index].order_service.tick()
+
+            running = active[~finished & (quiet < self.block_ticks)]
+            runs = [self._run(self.batched[index], tick)
+                    for index, tick in zip(self._store(running), self.tick[running].tolist())]
+            self.tick[running] = [tick for tick, state in runs]
+            self._load(running, [state for tick, state in runs])
+
+            active = active[~finished]
+
+        # too few are left for array operations to pay off
+        for index in self._store(active):
+            self.batched[index].run(event_driven=True)
+
+        return [backtest.state_manager.compute_metrics() for backtest in self.backtests]
+
+    # run a configuration at the tick after the given one, and at each after that which can't be quiet either; returns
+    # the tick reached and the configuration's state there (see _state)
+    def _run(self, backtest, tick):
+        while True:
+            backtest.order_service.tick()
+            backtest.order_manager.run()
+            tick += 1
+            state = self._state(backtest, tick)
+            if not state[NEEDS_RUN] or tick == self.tick_count:
+                return tick, state
+
+    # number of the next ticks, up to block_ticks, that are quiet for each of the given configurations (see
+    # Backtest.quiet_ticks), given the number of ticks remaining for each
+    def _quiet_ticks(self, indexes, remaining):
+        quiet = numpy.minimum(remaining, self.block_ticks)
+        quiet[self.needs_run[indexes]] = 0
+        for side in [OrderSide.BUY, OrderSide.SELL]:
+            quiet = numpy.minimum(quiet, self.window_ticks[side][indexes])
+        quiet = numpy.maximum(numpy.minimum(quiet, self.rebalance_ticks[indexes]), 0)
+        if not self.tick_count:
+            return quiet
+
+        ticks = numpy.minimum(self.tick[indexes, None] + numpy.arange(self.block_ticks), self.tick_count - 1)
+        fills = (self.buy_limit[indexes, None] > self.buy_fill_prices[ticks]) | \
+            (self.sell_limit[indexes, None] < self.sell_fill_prices[ticks])
+        quiet = numpy.minimum(quiet, numpy.where(fills.any(axis=1), fills.argmax(axis=1), self.block_ticks))
+
+        # rebalances start when the imbalance at a quote exceeds the threshold, right away without one
+        starting = (quiet > 0) & (self.rebalance_interval[indexes] > 0) & ~self.rebalancing[indexes]
+        if starting.any():
+            starting_indexes = indexes[starting]
+            holdings_values = self.holdings[starting_indexes, None] * self.quotes[ticks[starting] + 1]
+            account_values = holdings_values + self.buying_power[starting_indexes, None]
+            exceeded = numpy.abs(self.buying_power[starting_indexes, None] / account_values -
+                                 holdings_values / account_values) > self.rebalance_threshold[starting_indexes, None]
+            exceeded |= (self.rebalance_threshold[starting_indexes] == 0)[:, None]
+            quiet[starting] = numpy.minimum(
+                quiet[starting], numpy.where(exceeded.any(axis=1), exceeded.argmax(axis=1), self.block_ticks))
+
+        return quiet
+
+    # apply the bookkeeping of the given number of quiet ticks to each of the given configurations, as
+    # Backtest.skip_quiet_ticks does
+    def _skip(self, indexes, quiet):
+        skipping = quiet > 0
+        indexes = indexes[skipping]
+        quiet = quiet[skipping]
+        if not len(indexes):
+            return
+
+        tick = self.tick[indexes]
+        in_skip = numpy.arange(quiet.max()) < quiet[:, None]
+        coin_prices = self.quotes[numpy.minimum(tick[:, None] + 1 + numpy.arange(quiet.max()), self.tick_count)]
+
+        self.ticks_from_start[indexes] += quiet
+        self.ticks_since_last_order[indexes] += quiet
+        self.longest_ticks_between_orders[indexes] = numpy.maximum(self.longest_ticks_between_orders[indexes],
+                                                                   self.ticks_since_last_order[indexes])
+        self.last_price[indexes] = self.quotes[tick + quiet]
+
+        # same as running_drawdown over each configuration's own skipped ticks
+        account_values = numpy.where(in_skip, self.holdings[indexes, None] * coin_prices +
+                                     self.buying_power[indexes, None], -numpy.inf)
+        peaks = numpy.maximum.accumulate(
+            numpy.concatenate((self.peak_account_value[indexes, None], account_values), axis=1), axis=1)[:, 1:]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            drawdowns = numpy.where(in_skip & (peaks > 0), 1 - account_values / peaks, 0)
+        self.peak_account_value[indexes] = peaks[:, -1]
+        self.max_drawdown[indexes] = numpy.maximum(self.max_drawdown[indexes], drawdowns.max(axis=1))
+
+        for side in [OrderSide.BUY, OrderSide.SELL]:
+            self.window_remaining[side][indexes] = numpy.maximum(self.window_remaining[side][indexes] - quiet, 0)
+            self.window_ticks[side][indexes] -= quiet
+
+        # prices are added one at a time, in order, exactly as they are when sampled one tick at a time; adding 0 for
+        # the ticks past each configuration's own leaves its total unchanged
+        counting = self.rebalancing[indexes] & (self.rebalance_interval[indexes] > 0)
+        if counting.any():
+            counting_indexes = indexes[counting]
+            self.rebalance_count[counting_indexes] += quiet[counting]
+            self.rebalance_ticks[counting_indexes] -= quiet[counting]
+            totals = numpy.concatenate((self.rebalance_total[counting_indexes, None],
+                                        numpy.where(in_skip[counting], coin_prices[counting], 0.0)), axis=1)
+            self.rebalance_total[counting_indexes] = numpy.add.accumulate(totals, axis=1)[:, -1]
+
+        self.tick[indexes] += quiet
+        self.skipped[indexes] = True
+
+    # copy the bookkeeping applied by _skip back into each of the given configurations, with their services moved to
+    # the minute reached; returns the indexes as a list
+    def _store(self, indexes):
+        stored = indexes[self.skipped[indexes]]
+        self.skipped[stored] = False
+        columns = zip(stored.tolist(), self.tick[stored].tolist(), self.ticks_from_start[stored].tolist(),
+                      self.ticks_since_last_order[stored].tolist(),
+                      self.longest_ticks_between_orders[stored].tolist(), self.last_price[stored].tolist(),
+                      self.peak_account_value[stored].tolist(), self.max_drawdown[stored].tolist(),
+                      self.rebalance_count[stored].tolist(), self.rebalance_total[stored].tolist(),
+                      self.window_remaining[OrderSide.BUY][stored].tolist(),
+                      self.window_remaining[OrderSide.SELL][stored].tolist())
+        for index, tick, ticks_from_start, ticks_since_last_order, longest_ticks_between_orders, last_price, \
+                peak_account_value, max_drawdown, rebalance_count, rebalance_total, buy_remaining, \
+                sell_remaining in columns:
+            backtest = self.batched[index]
+            backtest.order_service.minute_index = self.start_minute + tick * self.minute_increments
+
+            metrics = backtest.state_manager.metrics
+            metrics['ticks_from_start'] = ticks_from_start
+            metrics['ticks_since_last_order_execution'] = ticks_since_last_order
+            metrics['longest_ticks_between_orders'] = longest_ticks_between_orders
+            metrics['last_price'] = last_price
+            metrics['peak_account_value'] = peak_account_value
+            metrics['max_drawdown'] = max_drawdown
+            if 'rebalance' in metrics:
+                metrics['rebalance']['count'] = rebalance_count
+                metrics['rebalance']['total_price'] = rebalance_total
+
+            if backtest.order_manager.window_duration:
+                open_orders = backtest.state_manager.open_orders
+                if OrderSide.BUY in open_orders:
+                    open_orders[OrderSide.BUY].window_duration_remaining = buy_remaining
+                if OrderSide.SELL in open_orders:
+                    open_orders[OrderSide.SELL].window_duration_remaining = sell_remaining
+
+        return indexes.tolist()
+
+    # refresh the arrays from the states (see _state) of each of the given configurations, after they've run
+    def _load(self, indexes, states):
+        if not len(indexes):
+            return
+
+        arrays = [self.ticks_from_start, self.ticks_since_last_order, self.longest_ticks_between_orders,
+                  self.last_price, self.peak_account_value, self.max_drawdown, self.holdings, self.buying_power,
+                  self.needs_run, self.buy_limit, self.sell_limit, self.rebalancing, self.rebalance_count,
+                  self.rebalance_total, self.rebalance_ticks, self.window_remaining[OrderSide.BUY],
+                  self.window_remaining[OrderSide.SELL], self.window_ticks[OrderSide.BUY],
+                  self.window_ticks[OrderSide.SELL]]
+        for array, column in zip(arrays, zip(*states)):
+            array[indexes] = column
+
+    # Values of a configuration at the given tick for each of the arrays refreshed by _load. needs_run is set when the
+    # next tick is known not to be quiet from a few checks of the configuration on its own: it has no open orders, one
+    # of them isn't open anymore or is due to be replaced, a rebalance is due, or either order fills or a rebalance
+    # starts at the next tick (when that can be told without dividing by zero). The rest are left for _quiet_ticks.
+    def _state(self, backtest, tick):
+        order_manager = backtest.order_manager
+        state_manager = backtest.state_manager
+        order_service = backtest.order_service
+        metrics = state_manager.metrics
+        order_totals = state_manager.account_order_totals()
+        holdings = order_totals.holdings
+        buying_power = order_totals.buying_power
+
+        # open limit prices at the service, NaN (which never fills) for a side without one
+        buy_limit, sell_limit = order_service._open_limit_prices()
+        buy_limit = numpy.nan if buy_limit is None else buy_limit
+        sell_limit = numpy.nan if sell_limit is None else sell_limit
+
+        rebalance = metrics.get('rebalance')
+        rebalance_interval = order_manager.rebalance_interval
+        rebalance_ticks = self.no_limit
+        if rebalance is not None and rebalance_interval:
+            rebalance_ticks = rebalance_interval - rebalance['count'] - 1
+
+        open_orders = state_manager.open_orders
+        needs_run = not open_orders or rebalance_ticks <= 0
+        window_remaining = {OrderSide.BUY: 0, OrderSide.SELL: 0}
+        window_ticks = {OrderSide.BUY: self.no_limit, OrderSide.SELL: self.no_limit}
+        for side, open_order in (open_orders or {}).items():
+            order = order_service.get_order_info(open_order.id)
+            if not order or order.state not in OPEN_ORDER_STATUSES:
+                needs_run = True
+                continue
+
+            window_remaining[side] = open_order.window_duration_remaining
+            ticks = order_manager.ticks_until_window_replace(side)
+            if ticks is not None:
+                window_ticks[side] = ticks
+                needs_run = needs_run or ticks <= 0
+
+        if not needs_run and tick < self.tick_count:
+            needs_run = buy_limit > self.buy_fill_prices.item(tick) or sell_limit < self.sell_fill_prices.item(tick)
+            if not needs_run and rebalance is None and rebalance_interval:
+                rebalance_threshold = order_manager.rebalance_threshold
+                holdings_value = holdings * self.quotes.item(tick + 1)
+                account_value = holdings_value + buying_power
+                needs_run = not rebalance_threshold or (account_value != 0 and abs(
+                    buying_power / account_value - holdings_value / account_value) > rebalance_threshold)
+
+        return (metrics['ticks_from_start'], metrics['ticks_since_last_order_execution'],
+                metrics['longest_ticks_between_orders'], metrics['last_price'], metrics['peak_account_value'],
+                metrics['max_drawdown'], holdings, buying_power, needs_run, buy_limit, sell_limit,
+                rebalance is not None, rebalance['count'] if rebalance else 0,
+                rebalance['total_price'] if rebalance else 0.0, rebalance_ticks, window_remaining[OrderSide.BUY],
+                window_remaining[OrderSide.SELL], window_ticks[OrderSide.BUY], window_ticks[OrderSide.SELL])
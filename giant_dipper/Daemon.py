@@ -0,0 +1,203 @@
+import asyncio
+import math
+import signal
+import time
+import traceback
+from datetime import datetime
+
+from giant_dipper.OrderManager import run_order_managers
+
+# default number of seconds between the ticks of a Daemon, the same as a per-minute cron job
+DEFAULT_TICK_INTERVAL = 60
+
+
+# Times ticks at whole multiples of interval seconds after a start time on a monotonic clock, so time spent running
+# one tick doesn't push back the ones after it. A tick that's already due runs right away, but if others have also
+# come due in the meantime, only the latest runs rather than all of them back to back.
+class TickSchedule:
+    def __init__(self, interval, clock=time.monotonic):
+        if interval <= 0:
+            raise Exception('Tick interval must be greater than 0, got {}'.format(interval))
+
+        self.interval = interval
+        self.clock = clock
+        self.start = clock()
+        self.tick = 0
+
+    # move on to the next tick, returns the number of seconds until it's due and the number of ticks skipped to get
+    # to it
+    def next_tick(self):
+        elapsed = self.clock() - self.start
+        next_tick = max(self.tick + 1, math.floor(elapsed / self.interval))
+        skipped = next_tick - self.tick - 1
+        self.tick = next_tick
+
+        return max(next_tick * self.interval - elapsed, 0), skipped
+
+
+# An order manager kept running by a Daemon. load builds it from its files, returning the OrderManager along with the
+# objects keeping its state in files (e.g. a FileStateManager and a RealQuoteFakeOrderService); their state_data is
+# taken after every successful run, and written with write_state. Those with a refresh method (e.g.
+# RealQuoteFakeOrderService) have it called before every run, except the first after loading.
+#
+# If a run fails, the order manager is loaded again from its files before the next one, as if the process had been
+# restarted. Its state is still written if the run placed an order before failing (e.g. one side's replacement when the
+# other side's cancel failed), since the order manager's state is the only record of it. If print_metrics is set, the
+# state manager's metrics are printed after every successful run.
+class DaemonTask:
+    def __init__(self, load, print_metrics=False):
+        self.load = load
+        self.print_metrics = print_metrics
+        self.order_manager, self.stores = load()
+        self.loaded = True
+
+    # get ready for the next run: load the order manager again if its last run failed, otherwise refresh the stores;
+    # both happen in worker threads since they may wait on the network. Returns the failure if either fails.
+    async def prepare(self):
+        try:
+            if self.order_manager is None:
+                self.order_manager, self.stores = await asyncio.to_thread(self.load)
+                self.loaded = True
+
+            if not self.loaded:
+                for store in self.stores:
+                    if hasattr(store, 'refresh'):
+                        await asyncio.to_thread(store.refresh)
+            self.loaded = False
+        except Exception as exception:
+            return exception
+
+        return None
+
+
+# Runs the order managers of the given DaemonTasks together, every interval seconds (see TickSchedule), keeping them
+# in memory rather than loading configuration, state and a Robinhood session for every run as a cron job does.
+#
+# After each tick, the state of every order manager that ran successfully is written to its files in a worker thread,
+# so writing doesn't hold up the event loop; the state is taken before then, so it's consistent with the tick even as
+# later ticks change it. The next tick waits for the writes to finish before running anything, so if they fail, it
+# stops there.
+#
+# If a RobinHoodSession is given, it's kept logged in before every tick, and the time that took is printed. If Robinhood
+# rejects its token during a tick, it logs in again and the order managers that failed are run once more, reloaded from
+# their files, rather than waiting for the next tick.
+#
+# run continues until stop is called, or the process gets SIGINT or SIGTERM. The tick in progress, if any, is
+# finished and its state written before returning, so the files are left consistent.
+class Daemon:
+    def __init__(self, tasks, interval=DEFAULT_TICK_INTERVAL, session=None):
+        self.tasks = tasks
+        self.interval = interval
+        self.session = session
+        self.loop = None
+        self.stopping = None
+        self.writes = None
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        for signal_number in [signal.SIGINT, signal.SIGTERM]:
+            self.loop.add_signal_handler(signal_number, self.stop)
+
+        try:
+            schedule = TickSchedule(self.interval)
+            while not self.stopping.is_set():
+                for failure in await self.tick():
+                    if failure is not None:
+                        traceback.print_exception(type(failure), failure, failure.__traceback__)
+
+                delay, skipped = schedule.next_tick()
+                if skipped:
+                    print("Skipped {} ticks while the last one ran".format(skipped))
+
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.written()
+            for signal_number in [signal.SIGINT, signal.SIGTERM]:
+                self.loop.remove_signal_handler(signal_number)
+
+    # run a single tick and write its state, as a cron job would; raises the first failure once all have finished
+    async def run_once(self):
+        failures = await self.tick()
+        await self.written()
+        for failure in failures:
+            if failure is not None:
+                raise failure
+
+    # stop after the tick in progress, can be called from any thread
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+
+    # run every task's order manager once, starts writing the state of those that succeeded; returns the failure of
+    # each task, None for those that succeeded
+    async def tick(self):
+        await self.written()
+        print(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        rejected = await self.log_in()
+
+        snapshots = []
+        failures = await self.run_tasks(self.tasks, snapshots)
+        if self.session is not None and self.session.rejected and not rejected:
+            retried = [index for index, failure in enumerate(failures) if failure is not None]
+            await self.log_in()
+
+            # the retried tasks are loaded from their files, so write what their failed runs kept first
+            await asyncio.to_thread(write_snapshots, snapshots)
+            snapshots.clear()
+            for index, failure in zip(retried, await self.run_tasks([self.tasks[i] for i in retried], snapshots)):
+                failures[index] = failure
+
+        self.writes = asyncio.ensure_future(asyncio.to_thread(write_snapshots, snapshots))
+        print("")
+
+        return failures
+
+    # keep the session logged in, if there's one; returns whether its token is still rejected afterwards
+    async def log_in(self):
+        if self.session is None:
+            return False
+
+        await asyncio.to_thread(self.session.ensure_logged_in)
+        auth_seconds = self.session.take_auth_seconds()
+        if auth_seconds:
+            print("\tAuthenticated in {:.3f}s".format(auth_seconds))
+
+        return self.session.rejected
+
+    # run the order managers of the given tasks once, adding the state of those that succeeded to snapshots; returns
+    # the failure of each task, None for those that succeeded
+    async def run_tasks(self, tasks, snapshots):
+        failures = list(await asyncio.gather(*[task.prepare() for task in tasks]))
+        prepared = [task for task, failure in zip(tasks, failures) if failure is None]
+        run_failures = iter(await run_order_managers([task.order_manager for task in prepared]))
+        for index, task in enumerate(tasks):
+            if failures[index] is None:
+                failures[index] = next(run_failures)
+                if failures[index] is None:
+                    if task.print_metrics:
+                        task.order_manager.state_manager.print_metrics()
+                    snapshots.extend((store, store.state_data()) for store in task.stores)
+                else:
+                    if task.order_manager.placed_order:
+                        snapshots.extend((store, store.state_data()) for store in task.stores)
+
+                    # loaded from its files again before it runs next, once the last tick's writes are done
+                    task.order_manager = None
+
+        return failures
+
+    # wait until the state of the last tick is written
+    async def written(self):
+        if self.writes is not None:
+            writes = self.writes
+            self.writes = None
+            await writes
+
+
+def write_snapshots(snapshots):
+    for store, data in snapshots:
+        store.write_state(data)
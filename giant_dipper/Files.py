@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+
+# write data to a file, replacing any earlier version only once it's complete; data is bytes, or an iterable of bytes
+# written one after another so large files don't need to be joined in memory first
+def write_file_atomically(file_path, data):
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            if isinstance(data, bytes):
+                file.write(data)
+            else:
+                file.writelines(data)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
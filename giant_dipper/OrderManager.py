@@ -1,8 +1,13 @@
+import asyncio
+import inspect
 import math
 import sys
+import time
 
+from giant_dipper.Orders import Order
 from giant_dipper.OrderSides import OrderSide
 from giant_dipper.OrderStatuses import OrderStatus, OPEN_ORDER_STATUSES, REPLACE_ORDER_STATUSES
+from giant_dipper.RebalanceEstimators import REBALANCE_ESTIMATORS
 
 BUY_ORDER_COLLAR = 1.0025
 SELL_ORDER_COLLAR = 1 / BUY_ORDER_COLLAR
@@ -12,8 +17,46 @@ def opposite_side(side):
     return OrderSide.SELL if side == OrderSide.BUY else OrderSide.BUY
 
 
+# run the given order managers (see OrderManager.run_async) at once on the running event loop, returns the exceptions
+# of those that failed (None for the others) once all have finished, so one failing doesn't interrupt the rest
+async def run_order_managers(order_managers):
+    results = await asyncio.gather(*[order_manager.run_async() for order_manager in order_managers],
+                                   return_exceptions=True)
+
+    return [result if isinstance(result, BaseException) else None for result in results]
+
+
+# Wraps a value that's already available so it can be awaited, which returns the value without suspending. OrderManager
+# awaits the results of sync order services through it, so one implementation serves both kinds of service.
+class Ready:
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+    def __await__(self):
+        yield from ()
+        return self.value
+
+
+# the result of an order service call, ready to await whether the service is async (a coroutine) or sync (the value)
+def awaitable(result):
+    return result if inspect.iscoroutine(result) else Ready(result)
+
+
 PRICE_FLOOR_MULTIPLIER = pow(10, 5)  # we'll floor prices to 5 digits for ordering
 
+# most steps kept in an OrderManager's ladder, multipliers beyond this many are computed without being kept
+MAX_LADDER_STEPS = 256
+
+# what OrderManager.place_order does about the open order for a side (see OrderManager.open_order_action)
+PLACE_ORDER = 'place'
+KEEP_ORDER = 'keep'
+CANCEL_ORDER = 'cancel'
+
+# seconds to wait for the service calls of an async order service when fetching service values
+DEFAULT_FETCH_TIMEOUT = 10
+
 
 # floors the price to 5 digits, don't want to round as that may result in rounding up beyond the bounds of our current
 # holdings/buying power
@@ -21,11 +64,39 @@ def price_floor(price):
     return math.floor(price * PRICE_FLOOR_MULTIPLIER) / PRICE_FLOOR_MULTIPLIER
 
 
+# price and quantity ratios an OrderManager applies with a given multiplier (see OrderManager.ladder_step)
+class LadderStep:
+    def __init__(self, order_manager, multiplier):
+        self.multiplier = multiplier
+        self.price_ratios = {
+            OrderSide.SELL: pow(order_manager.sell_ratio, multiplier),
+            OrderSide.BUY: pow(order_manager.buy_ratio, multiplier)
+        }
+        self.order_ratio = order_manager.apply_multiplier_to_ratio(order_manager.order_quantity_ratio, multiplier)[0]
+        self.total_threshold, self.complementary_total_threshold = \
+            order_manager.apply_multiplier_to_ratio(order_manager.order_holdings_threshold, multiplier)
+
+        # total threshold for a window size of 1 less, used to adjust terminal quantities
+        self.stepped_down_total_threshold = None
+        if multiplier > 1:
+            self.stepped_down_total_threshold = \
+                order_manager.apply_multiplier_to_ratio(order_manager.order_holdings_threshold, multiplier - 1)[0]
+
+
 class OrderManager:
     def __init__(self, order_service, state_manager, price_increment_ratio, order_quantity_ratio,
                  order_holdings_threshold, window_duration=None, window_factor=1, silent=False,
-                 rebalance_interval=None, round_quantity_digits=0, rebalance_threshold=None):
+                 rebalance_interval=None, round_quantity_digits=0, rebalance_threshold=None, rebalance_estimator=None,
+                 fetch_timeout=DEFAULT_FETCH_TIMEOUT, replace_after_cancel=False):
+        if rebalance_estimator is not None:
+            if rebalance_estimator not in REBALANCE_ESTIMATORS:
+                raise Exception('Unknown rebalance_estimator {}, expected one of {}'.format(
+                    rebalance_estimator, REBALANCE_ESTIMATORS))
+            if not rebalance_interval or not rebalance_threshold:
+                raise Exception('rebalance_estimator requires rebalance_interval and rebalance_threshold')
+
         self.rh_orders = {}
+        self.service_values_as_of = None
         self.current_price = None
         self.current_holdings = None
         self.current_buying_power = None
@@ -42,29 +113,113 @@ class OrderManager:
         self.round_quantity_digits = round_quantity_digits
         self.minimum_quantity = pow(10, -self.round_quantity_digits)
         self.rebalance_threshold = rebalance_threshold
+        self.rebalance_estimator = rebalance_estimator
+        self.ladder = {}
+        self.fetch_timeout = fetch_timeout
+        self.replace_after_cancel = replace_after_cancel
+        self.async_service = False
+        self.placed_order = False
+
+    # build an OrderManager from the values of an order_manager configuration section
+    @classmethod
+    def from_config(cls, order_service, state_manager, order_manager_config, silent=False,
+                    fetch_timeout=DEFAULT_FETCH_TIMEOUT):
+        return cls(
+            order_service=order_service,
+            state_manager=state_manager,
+            silent=silent,
+            fetch_timeout=fetch_timeout,
+            **cls.config_arguments(order_manager_config)
+        )
+
+    # arguments for an OrderManager with the settings of an order_manager configuration section, defaults included
+    @staticmethod
+    def config_arguments(order_manager_config):
+        return {
+            'price_increment_ratio': order_manager_config['price_increment_ratio'],
+            'order_quantity_ratio': order_manager_config['order_holdings_threshold'] /
+            order_manager_config['quantity_threshold_ratio'],
+            'order_holdings_threshold': order_manager_config['order_holdings_threshold'],
+            'window_duration': order_manager_config.get('window_duration'),
+            'window_factor': order_manager_config.get('window_factor', 1),
+            'rebalance_interval': order_manager_config.get('rebalance_interval'),
+            'rebalance_threshold': order_manager_config.get('rebalance_threshold'),
+            'rebalance_estimator': order_manager_config.get('rebalance_estimator'),
+            'replace_after_cancel': order_manager_config.get('replace_after_cancel', False)
+        }
 
-    # retrieve and cache all values from the service that are needed for a single run
+    # retrieve and cache all values from the service that are needed for a single run, service_values_as_of is the
+    # time (seconds since the epoch) the fetch started
     def cache_service_values(self):
-        self.current_price = self.order_service.get_quote()
-        self.current_holdings = self.order_service.get_holdings()
-        self.current_buying_power = self.order_service.get_buying_power()
-        if self.state_manager.open_orders:
-            self.rh_orders = {
-                OrderSide.SELL: self.order_service.get_order_info(
-                    self.state_manager.open_orders[OrderSide.SELL][
-                        'id']) if OrderSide.SELL in self.state_manager.open_orders else None,
-                OrderSide.BUY: self.order_service.get_order_info(
-                    self.state_manager.open_orders[OrderSide.BUY][
-                        'id']) if OrderSide.BUY in self.state_manager.open_orders else None
-            }
+        self.run_ready(self.cache_service_values_async())
+
+    # cache_service_values for either kind of order service. An async service's calls are awaited together, raising
+    # if they take longer than fetch_timeout; a sync service's are made one after another. No values are cached if any
+    # call fails.
+    async def cache_service_values_async(self):
+        self.service_values_as_of = time.time()
+        open_orders = self.state_manager.open_orders
+        sell_order = open_orders.get(OrderSide.SELL) if open_orders else None
+        buy_order = open_orders.get(OrderSide.BUY) if open_orders else None
+        order_service = self.order_service
+        values = (
+            order_service.get_quote(),
+            order_service.get_holdings(),
+            order_service.get_buying_power(),
+            order_service.get_order_info(sell_order.id) if sell_order else None,
+            order_service.get_order_info(buy_order.id) if buy_order else None
+        )
+
+        self.async_service = inspect.iscoroutine(values[0])
+        if self.async_service:
+            values = await self.gather_service_values(values)
+
+        self.current_price, self.current_holdings, self.current_buying_power, rh_sell_order, rh_buy_order = values
+        if open_orders:
+            self.rh_orders = {OrderSide.SELL: rh_sell_order, OrderSide.BUY: rh_buy_order}
+
+    # await the calls to an async order service made by cache_service_values_async together, returning their results
+    async def gather_service_values(self, values):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            for value in values:
+                if value is not None:
+                    value.close()
+            raise Exception('An order manager with an async order service can only be run with run_async')
+
+        try:
+            return await asyncio.wait_for(asyncio.gather(*[awaitable(value) for value in values]), self.fetch_timeout)
+        except asyncio.TimeoutError:
+            raise Exception('Timed out after {} seconds fetching values from the order service'.format(
+                self.fetch_timeout))
 
     # primary method to be invoked at each interval
     def run(self):
-        self.cache_service_values()
+        self.run_ready(self.run_async())
+
+    # Same as run, for either kind of order service. With an async order service (see AsyncOrderServices), the service
+    # calls are awaited, so one event loop can drive several order managers at once (see run_order_managers); a sync
+    # service's results are awaited through Ready, so for it this never suspends and run drives it without an event
+    # loop. async_service notes which kind of service the last fetch was from, placed_order whether the last run placed
+    # any order, even if it failed afterwards.
+    async def run_async(self):
+        self.placed_order = False
+        await self.cache_service_values_async()
 
         self.state_manager.record_base_metrics(self.current_price, self.current_holdings, self.current_buying_power)
-        self.check_orders()
-        self.check_rebalance()
+        await self.check_orders()
+        await self.check_rebalance()
+
+    # run one of the async methods to completion for a sync order service, returning its result
+    def run_ready(self, coroutine):
+        try:
+            coroutine.send(None)
+        except StopIteration as stop:
+            return stop.value
+
+        coroutine.close()
+        raise Exception('An order manager with an async order service can only be run with run_async')
 
     # current buy price quote including collar
     def current_buy_price(self):
@@ -87,22 +242,30 @@ class OrderManager:
 
         return total_ratio, complementary_ratio
 
+    # the LadderStep for a multiplier, computed once per multiplier since orders are placed with a handful of window
+    # sizes over and over
+    def ladder_step(self, multiplier):
+        step = self.ladder.get(multiplier)
+        if step is None:
+            step = LadderStep(self, multiplier)
+            if len(self.ladder) < MAX_LADDER_STEPS:
+                self.ladder[multiplier] = step
+
+        return step
+
     # return the next quantity given the price and multiplier, taking into account the order holdings threshold
     # and whether the opposite side has recently run against limits
     def next_quantity(self, side, base_price, for_price, multiplier):  # noqa: C901
         if side == OrderSide.BUY and self.current_buying_power / for_price <= self.minimum_quantity:
             return 0
 
-        multiplied_order_ratio = self.apply_multiplier_to_ratio(self.order_quantity_ratio, multiplier)[0]
-        default_quantity = self.total_holdings(for_price) * multiplied_order_ratio
-        total_threshold, complementary_total_threshold = self.apply_multiplier_to_ratio(self.order_holdings_threshold,
-                                                                                        multiplier)
+        ladder_step = self.ladder_step(multiplier)
+        default_quantity = self.total_holdings(for_price) * ladder_step.order_ratio
+        total_threshold = ladder_step.total_threshold
+        complementary_total_threshold = ladder_step.complementary_total_threshold
 
         # determine the max quantity when applying the order_holdings_threshold to this order side
-        if side == OrderSide.SELL:
-            this_max_quantity = self.current_holdings * total_threshold
-        else:
-            this_max_quantity = (self.current_buying_power * total_threshold) / for_price
+        this_max_quantity = self.max_quantity(side, for_price, ladder_step)
 
         if opposite_side(side) == OrderSide.SELL:
             opposite_side_quantity_available = self.current_holdings * base_price / for_price
@@ -131,14 +294,8 @@ class OrderManager:
             adjusted_terminal_quantity = next_quantity
             if multiplier > 1:
                 # window was greater than 1, adjust the terminal quantity so it represents a window size of 1
-                stepped_down_multiplier = multiplier - 1
-                stepped_down_total_threshold = self.apply_multiplier_to_ratio(
-                    self.order_holdings_threshold,
-                    stepped_down_multiplier
-                )[0]
-
                 # find the percentage difference between a window size of 1 and the current window size
-                stepped_down_threshold_delta = 1 - (stepped_down_total_threshold / total_threshold)
+                stepped_down_threshold_delta = 1 - (ladder_step.stepped_down_total_threshold / total_threshold)
                 adjusted_terminal_quantity = self.quantity_floor(stepped_down_threshold_delta * next_quantity)
                 adjusted_terminal_quantity = max(adjusted_terminal_quantity, self.minimum_quantity)
 
@@ -156,6 +313,14 @@ class OrderManager:
 
         return next_quantity
 
+    # most that can be ordered on a side at the given price under the order_holdings_threshold, which only grows as the
+    # window widens
+    def max_quantity(self, side, for_price, ladder_step):
+        if side == OrderSide.SELL:
+            return self.current_holdings * ladder_step.total_threshold
+
+        return (self.current_buying_power * ladder_step.total_threshold) / for_price
+
     # floors the quantity to the appropriate number of digits, don't want to round as that may result in rounding up
     # beyond the bounds of our current holdings/buying power
     def quantity_floor(self, quantity):
@@ -163,91 +328,137 @@ class OrderManager:
         return math.floor(quantity * digits_multiplier) / digits_multiplier
 
     # check whether any orders are filled or need to be replaced with a narrower window size
-    def check_orders(self):
+    async def check_orders(self):
         if self.state_manager.open_orders:
-            rh_sell_order = self.rh_orders[OrderSide.SELL]
-            rh_buy_order = self.rh_orders[OrderSide.BUY]
-            if rh_sell_order and rh_sell_order['state'] == OrderStatus.FILLED:
-                filled_side = OrderSide.SELL
-                self.order_filled(rh_sell_order)
-                if rh_buy_order and rh_buy_order['state'] == OrderStatus.FILLED:
-                    self.order_filled(rh_buy_order)
-                    if rh_buy_order['last_transaction_at'] > rh_sell_order['last_transaction_at']:
-                        filled_side = OrderSide.BUY
-
-                self.replace_orders(filled_side)
-            elif rh_buy_order and rh_buy_order['state'] == OrderStatus.FILLED:
-                self.order_filled(rh_buy_order)
-                self.replace_orders(OrderSide.BUY)
+            filled_side = self.record_filled_orders()
+            if filled_side:
+                await self.replace_orders(filled_side)
             else:
-                if not self.silent:
-                    print("\tNo orders filled")
-
+                sides = []
                 for side in [OrderSide.BUY, OrderSide.SELL]:
                     if self.decrement_window(side):
-                        open_order = self.state_manager.open_orders[side]
-
-                        base_price, price, quantity, price_ratio, next_window_size = \
-                            self.get_next_order_details(
-                                side=side,
-                                base_price=open_order['base_price'],
-                                window_size=self.window_size(open_order['window_duration_remaining'])
-                            )
-                        self.place_order(side, base_price, price, quantity, next_window_size)
+                        sides.append(side)
+                if sides:
+                    await self.place_orders((side, self.narrower_window_order_details(side)) for side in sides)
         else:
             self.state_manager.open_orders = {}
-            self.create_new_orders()
+            await self.create_new_orders()
+
+    # record any filled orders, returns the side to replace orders from (the later fill if both filled), or None if
+    # neither was filled
+    def record_filled_orders(self):
+        rh_sell_order = self.rh_orders[OrderSide.SELL]
+        rh_buy_order = self.rh_orders[OrderSide.BUY]
+        if rh_sell_order and rh_sell_order.state == OrderStatus.FILLED:
+            filled_side = OrderSide.SELL
+            self.order_filled(rh_sell_order)
+            if rh_buy_order and rh_buy_order.state == OrderStatus.FILLED:
+                self.order_filled(rh_buy_order)
+                if rh_buy_order.last_transaction_at > rh_sell_order.last_transaction_at:
+                    filled_side = OrderSide.BUY
+
+            return filled_side
+        elif rh_buy_order and rh_buy_order.state == OrderStatus.FILLED:
+            self.order_filled(rh_buy_order)
+            return OrderSide.BUY
+
+        if not self.silent:
+            print("\tNo orders filled")
+
+        return None
+
+    # base price, price, quantity and window size to replace the open order for a side with once its window narrows
+    def narrower_window_order_details(self, side):
+        open_order = self.state_manager.open_orders[side]
+
+        base_price, price, quantity, price_ratio, next_window_size = \
+            self.get_next_order_details(
+                side=side,
+                base_price=open_order.base_price,
+                window_size=self.window_size(open_order.window_duration_remaining)
+            )
+
+        return base_price, price, quantity, next_window_size
 
     def window_size(self, duration_remaining):
         return math.ceil(duration_remaining / self.window_duration) if self.window_duration else 0
 
     # checks whether rebalancing is needed, and executes if necessary
-    def check_rebalance(self):  # noqa: C901
-        if self.rebalance_interval:
-            rebalance_to_price = self.state_manager.record_check_rebalance(self.current_price, self.rebalance_interval,
-                                                                           self.rebalance_threshold)
-            if rebalance_to_price:
+    async def check_rebalance(self):
+        rebalance_to_price = self.rebalance_to_price()
+        if rebalance_to_price:
+            # cancel open orders before attempting to place new ones, otherwise they'll probably get rejected
+            for order_id in self.rebalance_cancel_order_ids():
+                await awaitable(self.order_service.cancel_order(order_id))
+
+            rh_order = None
+            order_function, amount = self.rebalance_order(rebalance_to_price)
+            if order_function:
+                rh_order = await awaitable(getattr(self.order_service, order_function)(amount))
+
+            if self.rebalance_order_placed(rh_order):
+                # re-cache values from the service, as they've changed after rebalancing
+                await self.cache_service_values_async()
+                await self.create_new_orders()
+
+    # price to rebalance at if rebalancing is needed at this run, otherwise None
+    def rebalance_to_price(self):
+        if not self.rebalance_interval:
+            return None
+
+        rebalance_to_price = self.state_manager.record_check_rebalance(self.current_price, self.rebalance_interval,
+                                                                       self.rebalance_threshold,
+                                                                       self.rebalance_estimator)
+        if rebalance_to_price and not self.silent:
+            print("\tRebalance; holdings: {}, buying_power: ${}, to_price: ${}".format(
+                self.current_holdings, self.current_buying_power, rebalance_to_price
+            ))
+
+        return rebalance_to_price
+
+    # ids of the open orders to cancel before rebalancing
+    def rebalance_cancel_order_ids(self):
+        order_ids = []
+        for side in [OrderSide.BUY, OrderSide.SELL]:
+            if side in self.rh_orders and self.rh_orders[side] and self.rh_orders[side].state in OPEN_ORDER_STATUSES:
                 if not self.silent:
-                    print("\tRebalance; holdings: {}, buying_power: ${}, to_price: ${}".format(
-                        self.current_holdings, self.current_buying_power, rebalance_to_price
-                    ))
+                    print("\tCanceling {} order: {}".format(side, self.rh_orders[side]))
+                order_ids.append(self.rh_orders[side].id)
 
-                # rebalance to half holdings and half cash
-                target_holdings = self.total_holdings(rebalance_to_price) / 2
-                target_cash_value = self.account_value(rebalance_to_price) / 2
+        return order_ids
 
-                # cancel open orders before attempting to place new ones, otherwise they'll probably get rejected
-                for side in [OrderSide.BUY, OrderSide.SELL]:
-                    if side in self.rh_orders and self.rh_orders[side] and \
-                            self.rh_orders[side]['state'] in OPEN_ORDER_STATUSES:
-                        if not self.silent:
-                            print("\tCanceling {} order: {}".format(side, self.rh_orders[side]))
-                        self.order_service.cancel_order(self.rh_orders[side]['id'])
-
-                rh_order = None
-                if self.current_buying_power > target_cash_value:
-                    buy_value = self.current_buying_power - target_cash_value
-                    if not self.silent:
-                        print("\tRebalance: purchasing ${}".format(buy_value))
-
-                    rh_order = self.order_service.order_buy(buy_value)
-                elif target_holdings < self.current_holdings:
-                    sell_quantity = self.current_holdings - target_holdings
-                    if not self.silent:
-                        print("\tRebalance: selling {}".format(sell_quantity))
-
-                    rh_order = self.order_service.order_sell(self.quantity_floor(sell_quantity))
-
-                if rh_order:
-                    if 'id' in rh_order and rh_order['state'] == OrderStatus.FILLED:
-                        self.state_manager.record_order(rh_order, for_rebalance=True)
-
-                        # re-cache values from the service, as they've changed after rebalancing
-                        self.cache_service_values()
-                        self.create_new_orders()
-                    else:
-                        if not self.silent:
-                            print("\tError placing {} order: {}".format(rh_order['side'], rh_order))
+    # name of the order service function to rebalance with and the amount to pass it, rebalancing to half holdings
+    # and half cash; (None, None) if already balanced
+    def rebalance_order(self, rebalance_to_price):
+        target_holdings = self.total_holdings(rebalance_to_price) / 2
+        target_cash_value = self.account_value(rebalance_to_price) / 2
+
+        if self.current_buying_power > target_cash_value:
+            buy_value = self.current_buying_power - target_cash_value
+            if not self.silent:
+                print("\tRebalance: purchasing ${}".format(buy_value))
+
+            return 'order_buy', buy_value
+        elif target_holdings < self.current_holdings:
+            sell_quantity = self.current_holdings - target_holdings
+            if not self.silent:
+                print("\tRebalance: selling {}".format(sell_quantity))
+
+            return 'order_sell', self.quantity_floor(sell_quantity)
+
+        return None, None
+
+    # record the rebalancing order, returns true if it was filled and new orders should be created
+    def rebalance_order_placed(self, rh_order):
+        if rh_order:
+            if rh_order.id is not None and rh_order.state == OrderStatus.FILLED:
+                self.state_manager.record_order(rh_order, for_rebalance=True)
+                return True
+
+            if not self.silent:
+                print("\tError placing {} order: {}".format(rh_order.side, rh_order))
+
+        return False
 
     # decrements the window size, returns true if order should be canceled and re-created with a narrower price window
     def decrement_window(self, side):
@@ -256,41 +467,61 @@ class OrderManager:
 
         if self.window_duration:
             open_order = self.state_manager.open_orders[side]
-            window_duration_remaining = open_order['window_duration_remaining']
-            open_order['window_duration_remaining'] = \
+            window_duration_remaining = open_order.window_duration_remaining
+            open_order.window_duration_remaining = \
                 window_duration_remaining - 1 if window_duration_remaining > 0 else 0
 
         return self.should_replace_order(side)
 
+    # number of consecutive calls to decrement_window for this side that would return False, assuming the order
+    # isn't filled or replaced in the meantime; None if there's no limit
+    def ticks_until_window_replace(self, side):
+        order = self.state_manager.open_orders[side]
+        if order.force_replace or self.rh_orders[side].state in REPLACE_ORDER_STATUSES:
+            return 0
+
+        if not self.window_duration or order.window_size < 1:
+            return None
+
+        # replacement happens once the remaining duration drops to the point where the window size shrinks by one
+        return max(math.ceil(order.window_duration_remaining - (order.window_size - 1) * self.window_duration),
+                   1) - 1
+
+    # equivalent to calling decrement_window the given number of times, for ticks that won't trigger a replacement
+    def skip_window_ticks(self, ticks):
+        if self.window_duration:
+            for open_order in self.state_manager.open_orders.values():
+                open_order.window_duration_remaining = max(open_order.window_duration_remaining - ticks, 0)
+
     def should_replace_order(self, side):
         order = self.state_manager.open_orders[side]
-        if order.get('force_replace') or self.rh_orders[side]['state'] in REPLACE_ORDER_STATUSES:
+        if order.force_replace or self.rh_orders[side].state in REPLACE_ORDER_STATUSES:
             return True
 
         if not self.window_duration:
             return False
 
-        duration_remaining = order['window_duration_remaining']
-        return order['window_size'] - self.window_size(duration_remaining) >= 1
+        duration_remaining = order.window_duration_remaining
+        return order.window_size - self.window_size(duration_remaining) >= 1
 
     # builds next order details from a filled_request
     def get_next_order_details_for_filled(self, side, filled_request, filled_side):
         open_order = self.state_manager.open_orders[side] if side in self.state_manager.open_orders else None
-        window_size = self.window_size(open_order['window_duration_remaining']) if open_order else 0
+        window_size = self.window_size(open_order.window_duration_remaining) if open_order else 0
         if side == filled_side and self.window_duration:
             window_size += 1
 
         return self.get_next_order_details(
             side=side,
             window_size=window_size,
-            base_price=filled_request['price']
+            base_price=filled_request.price
         )
 
     # check if the proposed sell price is too low; use a window size of 1 for our check so the resulting limit price
     # can be allowed to remain one step under the current price, triggering an immediate sell at the optimum price
     # in the case of a large jump in price since the last order was filled
     def sell_price_too_low(self, price):
-        if (price * pow(self.sell_ratio, self.multiplier_for_window(1))) < self.current_price:
+        if self.price_outside_window(OrderSide.SELL, price):
             if not self.silent:
                 print("\tNext sell price was too low (${} vs ${})".format(price, self.current_price))
             return True
@@ -301,23 +532,93 @@ class OrderManager:
     # can be allowed to remain one step above the current price, triggering an immediate buy at the optimum price
     # in the case of a large jump in price since the last order was filled
     def buy_price_too_high(self, price):
-        if (price * pow(self.buy_ratio, self.multiplier_for_window(1))) > self.current_price:
+        if self.price_outside_window(OrderSide.BUY, price):
             if not self.silent:
                 print("\tNext buy price was too high (${} vs ${})".format(price, self.current_price))
             return True
 
         return False
 
-    # builds next orders details for a side given a base price (the last order price) and window size
+    # sell_price_too_low or buy_price_too_high for the side, without printing anything
+    def price_outside_window(self, side, price):
+        next_price = price * self.ladder_step(self.multiplier_for_window(1)).price_ratios[side]
+        if side == OrderSide.SELL:
+            return next_price < self.current_price
+
+        return next_price > self.current_price
+
+    # builds next orders details for a side given a base price (the last order price) and window size; the window size
+    # is grown as needed to accommodate large price movements, with the same results as
+    # get_next_order_details_iterative
     def get_next_order_details(self, side, base_price, window_size):
+        next_window_size = self.required_window_size(side, base_price, window_size)
+        if next_window_size is None:
+            return self.get_next_order_details_iterative(side, base_price, window_size)
+
+        multiplier = self.multiplier_for_window(next_window_size)
+        next_price_ratio = self.ladder_step(multiplier).price_ratios[side]
+        next_price = base_price * next_price_ratio
+        next_quantity = self.next_quantity(side, base_price, next_price, multiplier)
+        if next_window_size > window_size:
+            if next_quantity == 0:
+                self.narrower_terminal_quantity(side, base_price, window_size, next_window_size, next_price)
+
+            # report the widest window that was too narrow, the one just below next_window_size
+            price_needs_fix = self.sell_price_too_low if side == OrderSide.SELL else self.buy_price_too_high
+            narrower_price_ratio = self.ladder_step(self.multiplier_for_window(next_window_size - 1)).price_ratios[side]
+            price_needs_fix(base_price * narrower_price_ratio)
+
+        return base_price, next_price, next_quantity, next_price_ratio, next_window_size if self.window_duration else 0
+
+    # smallest window size of at least window_size whose price isn't outside the window (see price_outside_window),
+    # computed from the log of the price movement since base_price; None if wider windows don't move prices, i.e. the
+    # window_factor doesn't grow them or the price_increment_ratio is 1
+    def required_window_size(self, side, base_price, window_size):
         price_ratio = self.sell_ratio if side == OrderSide.SELL else self.buy_ratio
+        if self.window_factor <= 0 or price_ratio == 1:
+            return None
+
+        def outside_window(size):
+            return self.price_outside_window(
+                side, base_price * self.ladder_step(self.multiplier_for_window(size)).price_ratios[side])
+
+        # price_ratio ^ (multiplier_for_window(size) + multiplier_for_window(1)) reaches current_price / base_price
+        steps = math.log(self.current_price / base_price) / math.log(price_ratio)
+        next_window_size = max(window_size, math.ceil((steps - self.multiplier_for_window(1) - 1) / self.window_factor))
+
+        # step past any floating point error in the estimate
+        while outside_window(next_window_size):
+            next_window_size += 1
+        while next_window_size > window_size and not outside_window(next_window_size - 1):
+            next_window_size -= 1
+
+        return next_window_size
+
+    # next_quantity gave no quantity at next_window_size, so it didn't update terminal_quantity; leave it as set by the
+    # widest narrower window that gave one, as get_next_order_details_iterative does. No narrower window gives one when
+    # nothing can be ordered at next_window_size under the order_holdings_threshold (e.g. there are no holdings or no
+    # buying power), since that only grows with the window; otherwise they're checked from the widest down.
+    def narrower_terminal_quantity(self, side, base_price, window_size, next_window_size, next_price):
+        ladder_step = self.ladder_step(self.multiplier_for_window(next_window_size))
+        if (side == OrderSide.BUY and self.current_buying_power / next_price <= self.minimum_quantity) or \
+                self.quantity_floor(self.max_quantity(side, next_price, ladder_step)) == 0:
+            return
+
+        for narrower_window_size in range(next_window_size - 1, window_size - 1, -1):
+            multiplier = self.multiplier_for_window(narrower_window_size)
+            narrower_price = base_price * self.ladder_step(multiplier).price_ratios[side]
+            if self.next_quantity(side, base_price, narrower_price, multiplier) > 0:
+                return
+
+    # reference implementation of get_next_order_details, growing the window size one step at a time
+    def get_next_order_details_iterative(self, side, base_price, window_size):
         price_needs_fix = self.sell_price_too_low if side == OrderSide.SELL else self.buy_price_too_high
         next_window_size = window_size
 
         # grow the window size as needed to accommodate large price movements
         while True:
             multiplier = self.multiplier_for_window(next_window_size)
-            next_price_ratio = pow(price_ratio, multiplier)
+            next_price_ratio = self.ladder_step(multiplier).price_ratios[side]
             next_price = base_price * next_price_ratio
             next_quantity = self.next_quantity(side, base_price, next_price, multiplier)
 
@@ -332,21 +633,33 @@ class OrderManager:
     # process a filled order,
     def order_filled(self, rh_order):
         if not self.silent:
-            print("\tOrder ({}) filled: {}".format(rh_order['side'], rh_order['id']))
+            print("\tOrder ({}) filled: {}".format(rh_order.side, rh_order.id))
 
         self.state_manager.record_order(rh_order)
 
     # attempt to place new buy and sell orders (place_order function may choose not to act)
-    def replace_orders(self, filled_side):
+    async def replace_orders(self, filled_side):
         filled_request = self.state_manager.open_orders[filled_side]
 
-        for side in [OrderSide.BUY, OrderSide.SELL]:
-            base_price, price, quantity, price_ratio, window_size = \
-                self.get_next_order_details_for_filled(side, filled_request, filled_side)
-            self.place_order(side, base_price, price, quantity, window_size)
+        await self.place_orders(
+            (side, self.replacement_order_details(side, filled_request, filled_side))
+            for side in [OrderSide.BUY, OrderSide.SELL]
+        )
+
+    # base price, price, quantity and window size of the order to place for a side after filled_side was filled
+    def replacement_order_details(self, side, filled_request, filled_side):
+        base_price, price, quantity, price_ratio, window_size = \
+            self.get_next_order_details_for_filled(side, filled_request, filled_side)
+
+        return base_price, price, quantity, window_size
 
     # create new orders from a freshly computed base price
-    def create_new_orders(self, base_price=None):
+    async def create_new_orders(self, base_price=None):
+        await self.place_orders(self.new_order_details(base_price))
+
+    # base price, price, quantity and window size of the sell and buy orders to place from a freshly computed base
+    # price
+    def new_order_details(self, base_price=None):
         base_sell_price, sell_price, sell_quantity, sell_ratio, next_sell_window_size = \
             self.get_next_order_details(
                 side=OrderSide.SELL,
@@ -363,43 +676,106 @@ class OrderManager:
 
         if not self.silent:
             print("\tFound buy price {} and sell price {}".format(buy_price, sell_price))
-        self.place_order(OrderSide.SELL, base_sell_price, sell_price, sell_quantity, next_sell_window_size)
-        self.place_order(OrderSide.BUY, base_buy_price, buy_price, buy_quantity, next_buy_window_size)
+
+        return [
+            (OrderSide.SELL, (base_sell_price, sell_price, sell_quantity, next_sell_window_size)),
+            (OrderSide.BUY, (base_buy_price, buy_price, buy_quantity, next_buy_window_size))
+        ]
+
+    # Place orders for each of the given sides and their order details. A sync order service places them in turn,
+    # with each side's details computed just before its order is placed. An async one places both sides at once, since
+    # neither affects the details of the other (e.g. canceling and replacing both orders takes as long as the slower
+    # side); if either side fails, the other still finishes, so any order it placed is recorded, before the failure is
+    # raised.
+    async def place_orders(self, order_details_by_side):
+        if not self.async_service:
+            for side, order_details in order_details_by_side:
+                await self.place_order_async(side, *order_details)
+            return
+
+        results = await asyncio.gather(*[self.place_order_async(side, *order_details)
+                                         for side, order_details in order_details_by_side], return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
 
     # create a new order given order details
     def place_order(self, side, base_price, price, quantity, window_size):
+        self.run_ready(self.place_order_async(side, base_price, price, quantity, window_size))
+
+    async def place_order_async(self, side, base_price, price, quantity, window_size):
+        action = self.open_order_action(side, base_price, quantity)
+        if action == CANCEL_ORDER:
+            open_order = self.state_manager.open_orders[side]
+            if self.order_canceled(side, base_price, await awaitable(self.order_service.cancel_order(open_order.id))):
+                action = PLACE_ORDER
+
+        if action == PLACE_ORDER:
+            order = self.new_order(base_price, price, quantity, window_size)
+            order_function = self.order_service.order_sell_limit if side == OrderSide.SELL \
+                else self.order_service.order_buy_limit
+            self.order_placed(side, order, await awaitable(order_function(order.quantity, price_floor(order.price))))
+
+    # what place_order does about the open order for a side, if there is one:
+    # * PLACE_ORDER - place a new order
+    # * KEEP_ORDER - nothing, the open order stays as it is (or is dropped, for a quantity of 0)
+    # * CANCEL_ORDER - cancel the order and record the new base price (see order_canceled)
+    def open_order_action(self, side, base_price, quantity):
         if side in self.state_manager.open_orders:
             open_order = self.state_manager.open_orders[side]
             if quantity == 0:
                 del self.state_manager.open_orders[side]
-                return
+                return KEEP_ORDER
 
-            if base_price == open_order['base_price'] and not self.should_replace_order(side):
-                return
+            if base_price == open_order.base_price and not self.should_replace_order(side):
+                return KEEP_ORDER
 
-            if self.rh_orders[side]['state'] in OPEN_ORDER_STATUSES:
-                # cancel the order, record the new base price, and return without placing a new order,
-                # on the next run it will be replaced assuming the status has changed by then
+            if self.rh_orders[side].state in OPEN_ORDER_STATUSES:
                 if not self.silent:
                     print("\tCanceling {} order: {}".format(side, self.rh_orders[side]))
-                self.order_service.cancel_order(open_order['id'])
-                open_order['base_price'] = base_price
-                return
+                return CANCEL_ORDER
+
+        return PLACE_ORDER
+
+    # Record the new base price of an order that was canceled for replacement, returns true if the replacement should
+    # be placed right away. That's only with replace_after_cancel, once the service confirms the order was canceled;
+    # otherwise it's placed on the next run, assuming the status has changed by then (and an order filled before the
+    # cancel went through is recorded then, like any other fill).
+    #
+    # An order the service reports as still open (its wait for the cancel ran out) stays the open order, with
+    # force_replace set so the next run replaces it whatever its status is then.
+    def order_canceled(self, side, base_price, rh_order):
+        open_order = self.state_manager.open_orders[side]
+        open_order.base_price = base_price
+        if rh_order is not None and rh_order.state in OPEN_ORDER_STATUSES:
+            open_order.force_replace = True
+            if not self.silent:
+                print("\tCancel of {} order not confirmed, replacing it next run: {}".format(side, rh_order))
+            return False
 
-        # don't round price in our internal dict, we'll round when calling the order function
-        order = {
-            'base_price': base_price,
-            'price': price,
-            'quantity': quantity,
-            'window_size': window_size,
-            'window_duration_remaining': window_size * self.window_duration if self.window_duration else 0
-        }
-        order_function = self.order_service.order_sell_limit if side == OrderSide.SELL \
-            else self.order_service.order_buy_limit
-        rh_order = order_function(order['quantity'], price_floor(order['price']))
-        if 'id' in rh_order:
-            order['id'] = rh_order['id']
+        if self.replace_after_cancel and rh_order is not None and rh_order.state in REPLACE_ORDER_STATUSES:
+            self.rh_orders[side] = rh_order
+            return True
+
+        return False
+
+    # our internal record of an order about to be placed
+    def new_order(self, base_price, price, quantity, window_size):
+        # don't round price in our internal order, we'll round when calling the order function
+        return Order(
+            base_price=base_price,
+            price=price,
+            quantity=quantity,
+            window_size=window_size,
+            window_duration_remaining=window_size * self.window_duration if self.window_duration else 0
+        )
+
+    # record the service's response to placing an order for the side
+    def order_placed(self, side, order, rh_order):
+        if rh_order.id is not None:
+            order.id = rh_order.id
             self.state_manager.open_orders[side] = order
+            self.placed_order = True
             self.rh_orders[side] = rh_order
             if not self.silent:
                 print("\tNew {} order: {}".format(side, order))
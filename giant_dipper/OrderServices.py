@@ -1,23 +1,59 @@
-import csv
+import math
 from datetime import datetime
 from os.path import exists
 from time import sleep
 
+import numpy
 import robin_stocks
 import yaml
 
+from giant_dipper.Files import write_file_atomically
 from giant_dipper.OrderManager import BUY_ORDER_COLLAR, SELL_ORDER_COLLAR
+from giant_dipper.Orders import Order
 from giant_dipper.OrderSides import OrderSide
 from giant_dipper.OrderStatuses import OPEN_ORDER_STATUSES, OrderStatus
+from giant_dipper.TickData import TickData, format_epoch_seconds
+
+# seconds to wait for a canceled order to stop being open before giving up
+DEFAULT_CANCEL_TIMEOUT = 30
+
+# seconds between the first checks on an order being canceled, doubling up to CANCEL_POLL_MAX_DELAY
+CANCEL_POLL_INITIAL_DELAY = 0.25
+CANCEL_POLL_MAX_DELAY = 2
+
+
+# delays between checks on an order being canceled, backing off from CANCEL_POLL_INITIAL_DELAY until they add up to
+# timeout
+def cancel_poll_delays(timeout):
+    delay = CANCEL_POLL_INITIAL_DELAY
+    remaining = timeout
+    while remaining > 0:
+        yield min(delay, remaining)
+        remaining -= delay
+        delay = min(delay * 2, CANCEL_POLL_MAX_DELAY)
+
+
+# Order for RobinHood's response to placing an order. Order only keeps an order's fields, so the errors of a failed one
+# (which has no id, only errors) are printed here.
+def robinhood_order(response):
+    if response is not None and 'id' not in response:
+        print("\tRobinHood order failed: {}".format(response))
+
+    return Order.from_dict(response)
 
 
 # All calls delegate to RobinHood APIs. if disallow_orders is set, an Exception will be raised if any attempts to
 # cancel or create orders are made through this class, useful for implementations that want to use real account
-# or quote data without accidentally creating orders.
+# or quote data without accidentally creating orders. Orders are returned as Order objects holding the fields of what
+# RobinHood returned for them.
+#
+# cancel_order waits up to cancel_timeout seconds for the order to stop being open, returning it as it is by then
+# (still open if the cancel hasn't gone through).
 class RobinHoodOrderService:
-    def __init__(self, symbol, disallow_orders=False):
+    def __init__(self, symbol, disallow_orders=False, cancel_timeout=DEFAULT_CANCEL_TIMEOUT):
         self.symbol = symbol
         self.disallow_orders = disallow_orders
+        self.cancel_timeout = cancel_timeout
 
     def get_quote(self):
         return float(robin_stocks.robinhood.get_crypto_quote(self.symbol)['mark_price'])
@@ -26,7 +62,7 @@ class RobinHoodOrderService:
         order = robin_stocks.robinhood.get_crypto_order_info(order_id)
         order['last_transaction_at'] = datetime.fromisoformat(order['last_transaction_at'])
 
-        return order
+        return Order.from_dict(order)
 
     def get_holdings(self):
         for position in robin_stocks.robinhood.get_crypto_positions():
@@ -46,16 +82,20 @@ class RobinHoodOrderService:
         self.__check_order_allowed('cancel_order')
         robin_stocks.robinhood.cancel_crypto_order(order_id)
 
+        # the order may be filled before the cancel goes through, which also ends the wait
         order = robin_stocks.robinhood.get_crypto_order_info(order_id)
-        while order['state'] != OrderStatus.CANCELLED:
-            sleep(1)
+        for delay in cancel_poll_delays(self.cancel_timeout):
+            if order['state'] not in OPEN_ORDER_STATUSES:
+                break
+
+            sleep(delay)
             order = robin_stocks.robinhood.get_crypto_order_info(order_id)
 
-        return order
+        return Order.from_dict(order)
 
     def order_sell_limit(self, quantity, limit_price):
         self.__check_order_allowed('order_sell_limit')
-        return robin_stocks.robinhood.order_sell_crypto_limit(self.symbol, quantity, limit_price)
+        return robinhood_order(robin_stocks.robinhood.order_sell_crypto_limit(self.symbol, quantity, limit_price))
 
     def order_sell(self, quantity):
         self.__check_order_allowed('order_sell')
@@ -64,7 +104,7 @@ class RobinHoodOrderService:
 
     def order_buy_limit(self, quantity, limit_price):
         self.__check_order_allowed('order_buy_limit')
-        return robin_stocks.robinhood.order_buy_crypto_limit(self.symbol, quantity, limit_price)
+        return robinhood_order(robin_stocks.robinhood.order_buy_crypto_limit(self.symbol, quantity, limit_price))
 
     def order_buy(self, buy_value):
         self.__check_order_allowed('order_buy')
@@ -76,7 +116,7 @@ class RobinHoodOrderService:
             sleep(1)
             order = robin_stocks.robinhood.get_crypto_order_info(order['id'])
 
-        return order
+        return robinhood_order(order)
 
 
 # all account state values (including outstanding buy/sell orders) are stored locally
@@ -97,17 +137,19 @@ class LocalAccountStateOrderService:
         return self.buying_power
 
     def get_order_info(self, order_id):
-        if self.buy_order and self.buy_order['id'] == order_id:
+        if self.buy_order and self.buy_order.id == order_id:
             return self.buy_order
-        elif self.sell_order and self.sell_order['id'] == order_id:
+        elif self.sell_order and self.sell_order.id == order_id:
             return self.sell_order
 
         return None
 
     def cancel_order(self, order_id):
         order = self.get_order_info(order_id)
-        if order and order['state'] in OPEN_ORDER_STATUSES:
-            order['state'] = OrderStatus.CANCELLED
+        if order and order.is_open():
+            order.state = OrderStatus.CANCELLED
+
+        return order
 
     def order_sell_limit(self, quantity, price):
         self._check_holdings(quantity)
@@ -123,10 +165,10 @@ class LocalAccountStateOrderService:
         self.buying_power += sell_value
 
         order = self._create_next_order(OrderSide.SELL, sell_price, quantity)
-        order['rounded_executed_notional'] = sell_value
-        order['average_price'] = sell_price
-        order['state'] = OrderStatus.FILLED
-        order['last_transaction_at'] = self._get_date()
+        order.rounded_executed_notional = sell_value
+        order.average_price = sell_price
+        order.state = OrderStatus.FILLED
+        order.last_transaction_at = self._get_date()
 
         return order
 
@@ -144,48 +186,42 @@ class LocalAccountStateOrderService:
         self.holdings += quantity
 
         order = self._create_next_order(OrderSide.BUY, buy_price, quantity)
-        order['rounded_executed_notional'] = buy_value
-        order['average_price'] = buy_price
-        order['state'] = OrderStatus.FILLED
-        order['last_transaction_at'] = self._get_date()
+        order.rounded_executed_notional = buy_value
+        order.average_price = buy_price
+        order.state = OrderStatus.FILLED
+        order.last_transaction_at = self._get_date()
 
         return order
 
     def _create_next_order(self, side, price, quantity):
         self.next_order_id += 1
-        return {
-            'id': self.next_order_id,
-            'quantity': quantity,
-            'price': price,
-            'state': OrderStatus.OPEN,
-            'side': side
-        }
+        return Order(id=self.next_order_id, quantity=quantity, price=price, state=OrderStatus.OPEN, side=side)
 
     # checks current buy/sell orders against the current low/high prices and fills the orders as necessary
     def _check_orders(self, low, high):
         order = self.buy_order
-        if order and order['state'] in OPEN_ORDER_STATUSES:
-            price = order['price']
-            quantity = order['quantity']
+        if order and order.state in OPEN_ORDER_STATUSES:
+            price = order.price
+            quantity = order.quantity
             if price > (low * BUY_ORDER_COLLAR):
-                order['state'] = OrderStatus.FILLED
-                order['last_transaction_at'] = self._get_date()
-                order['average_price'] = price
-                order['rounded_executed_notional'] = price * quantity
-                self._check_and_decrement_buying_power(order['rounded_executed_notional'])
+                order.state = OrderStatus.FILLED
+                order.last_transaction_at = self._get_date()
+                order.average_price = price
+                order.rounded_executed_notional = price * quantity
+                self._check_and_decrement_buying_power(order.rounded_executed_notional)
                 self.holdings += quantity
 
         order = self.sell_order
-        if order and order['state'] in OPEN_ORDER_STATUSES:
-            price = order['price']
-            quantity = order['quantity']
+        if order and order.state in OPEN_ORDER_STATUSES:
+            price = order.price
+            quantity = order.quantity
             if price < (high * SELL_ORDER_COLLAR):
-                order['state'] = OrderStatus.FILLED
-                order['last_transaction_at'] = self._get_date()
-                order['average_price'] = price
-                order['rounded_executed_notional'] = price * quantity
+                order.state = OrderStatus.FILLED
+                order.last_transaction_at = self._get_date()
+                order.average_price = price
+                order.rounded_executed_notional = price * quantity
                 self._check_and_decrement_holdings(quantity)
-                self.buying_power += order['rounded_executed_notional']
+                self.buying_power += order.rounded_executed_notional
 
     def _check_holdings(self, quantity):
         if quantity > self.holdings:
@@ -209,58 +245,275 @@ class LocalAccountStateOrderService:
 # Use a CSV file to provide quotes w/ local account state
 #
 # Required CSV spreadsheet headings:
-# * "date" - date of quote, with minute granularity, in the format of csv_datetime_format
+# * "date" - date of quote, with minute granularity, in the format of csv_datetime_format; order dates are formatted
+#   back from the parsed date in UTC, so they're normalized rather than copied from the CSV
 # * "open", "low", and "high" - opening, low, and high prices for the given time increment
+#
+# If tick_cache_file is provided, quotes are memory-mapped from a binary cache of the CSV file (see
+# TickData.convert_csv), which is created or refreshed first if it's missing or out of date with the CSV. Already
+# loaded TickData (e.g. attached from shared memory) can be provided as tick_data instead, in which case csv_file is
+# ignored.
+#
+# For series too large to load at once, a TickStream can be provided as tick_stream instead; its chunks are read as
+# tick() reaches them, so only the current chunk is held in memory.
+#
+# If price_grid_ratio is provided (the order manager's price_increment_ratio), each minute's low and high are placed on
+# a log-space grid for that ratio (see TickData.price_grid), so the minutes of a tick that could fill an order are
+# found with one integer comparison over all of them, and only those are checked exactly. Grids are cached on the
+# tick data and shared by every service reading it with the same ratio.
+#
+# If end_minute is provided, quotes at and after that minute are ignored, as if the data ended there.
 class CSVFileOrderService(LocalAccountStateOrderService):
-    # cache this as a static variable in the class
-    all_minutes = None
-
-    def __init__(self, csv_file, minute_increments, cash_holdings_percentage, csv_datetime_format, start_minute=0):
-        if not CSVFileOrderService.all_minutes:
-            with open(csv_file) as file:
-                reader = csv.DictReader(file)
-                print("Caching values from the file {}".format(csv_file))
-
-                CSVFileOrderService.all_minutes = []
-                while True:
-                    next_minute = next(reader, None)
-                    if not next_minute:
-                        break
-
-                    CSVFileOrderService.all_minutes.append(next_minute)
-
-                print("Done caching CSV values")
-
+    # tick data already loaded by this process, keyed by the file it was loaded from, so it can be shared across
+    # instances; it's never modified once loaded
+    loaded_tick_data = {}
+
+    def __init__(self, csv_file, minute_increments, cash_holdings_percentage, csv_datetime_format, start_minute=0,
+                 tick_cache_file=None, tick_data=None, tick_stream=None, price_grid_ratio=None, end_minute=None):
+        if end_minute is not None and end_minute <= start_minute:
+            raise Exception('end_minute {} must be after start_minute {}'.format(end_minute, start_minute))
+
+        self.end_minute = end_minute
+
+        self.price_grid_ratio = price_grid_ratio
+        # highest low level at which the last buy limit order could fill and lowest high level at which the last sell
+        # limit order could fill; orders that are no longer open are still covered, which only costs an exact check
+        self.buy_level_bound = -math.inf
+        self.sell_level_bound = math.inf
+        self.csv_file = csv_file
+        self.tick_cache_file = tick_cache_file
+        self.tick_stream = tick_stream
         self.minute_increments = minute_increments
         self.csv_datetime_format = csv_datetime_format
         self.minute_index = start_minute
-        self.current_minute = CSVFileOrderService.all_minutes[self.minute_index]
+        self.restore_tick_data(tick_data)
         buying_power = round(cash_holdings_percentage * self.DEFAULT_START_ACCOUNT_VALUE, 2)
         super().__init__(
             buying_power=buying_power,
             holdings=round((self.DEFAULT_START_ACCOUNT_VALUE - buying_power) / self.get_quote())
         )
 
+    # attach quotes from the given tick_data, otherwise from the tick stream or CSV file the service was created with;
+    # streams are reopened at minute_index and ignore tick_data
+    def restore_tick_data(self, tick_data=None):
+        # minute index of the first row of tick_data, which only holds the current chunk when streaming
+        self.chunk_start = 0
+        self.tick_chunks = None
+        if self.tick_stream is not None:
+            self.tick_chunks = self.tick_stream.chunks(self.minute_index)
+            first_chunk = self._bound_chunk(next(self.tick_chunks, None))
+            if first_chunk is None:
+                raise Exception('No quotes found at or after minute {}'.format(self.minute_index))
+
+            self.chunk_start, self.tick_data = first_chunk
+        elif tick_data is not None:
+            self.tick_data = tick_data
+        elif self.csv_file is not None:
+            self.tick_data = self.load_tick_data(self.csv_file, self.csv_datetime_format, self.tick_cache_file)
+        else:
+            raise Exception('tick_data is required for a service without a csv_file or tick_stream')
+
+        if self.tick_stream is None and self.end_minute is not None:
+            self.tick_data = self.tick_data.head(self.end_minute)
+        self._load_price_grid()
+
+    # a tick stream chunk cut off at end_minute, None if it starts at or after end_minute (or is None)
+    def _bound_chunk(self, chunk):
+        if chunk is None or self.end_minute is None:
+            return chunk
+
+        chunk_start, tick_data = chunk
+        if chunk_start >= self.end_minute:
+            return None
+
+        return chunk_start, tick_data.head(self.end_minute - chunk_start)
+
+    # quotes are left out when pickling (e.g. for Backtest checkpoints), restore_tick_data attaches them again
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attribute in ['tick_data', 'tick_chunks', 'price_grid']:
+            state[attribute] = None
+
+        return state
+
+    @classmethod
+    def load_tick_data(cls, csv_file, csv_datetime_format, tick_cache_file=None):
+        key = (csv_file, csv_datetime_format, tick_cache_file)
+        if key not in cls.loaded_tick_data:
+            if tick_cache_file:
+                cls.loaded_tick_data[key] = TickData.from_csv_cached(csv_file, csv_datetime_format, tick_cache_file)
+            else:
+                print("Caching values from the file {}".format(csv_file))
+                cls.loaded_tick_data[key] = TickData.from_csv(csv_file, csv_datetime_format)
+                print("Done caching CSV values")
+
+        return cls.loaded_tick_data[key]
+
     def get_quote(self):
-        return float(self.current_minute['open'])
+        return self.tick_data.open.item(self.minute_index - self.chunk_start)
 
+    # date of the current quote, normalized from its timestamp (see TickData.format_epoch_seconds) rather than the CSV's
+    # own text, since the tick data may come from a cache or shared memory; normalized dates also compare in order
     def _get_date(self):
-        return self.current_minute['date']
+        return format_epoch_seconds(self.tick_data.timestamps.item(self.minute_index - self.chunk_start),
+                                    self.csv_datetime_format)
+
+    # number of whole ticks that can be taken before reaching the last row of the CSV (or of the current chunk, when
+    # streaming)
+    def remaining_ticks(self):
+        return (self.chunk_start + len(self.tick_data) - 1 - self.minute_index) // self.minute_increments
+
+    # first minute in [minute_index, end_minute) at which _check_orders would fill an open order, or end_minute if
+    # there isn't one; searches in growing chunks since fills are usually either close by or very far away
+    def next_fill_minute(self, end_minute):
+        buy_price, sell_price = self._open_limit_prices()
+        if buy_price is None and sell_price is None:
+            return end_minute
+
+        tick_data = self.tick_data
+        start = self.minute_index - self.chunk_start
+        end = end_minute - self.chunk_start
+        chunk_size = 64
+        while start < end:
+            stop = min(start + chunk_size, end)
+            fills = numpy.zeros(stop - start, dtype=bool)
+            if buy_price is not None:
+                fills |= buy_price > (tick_data.low[start:stop] * BUY_ORDER_COLLAR)
+            if sell_price is not None:
+                fills |= sell_price < (tick_data.high[start:stop] * SELL_ORDER_COLLAR)
+
+            if fills.any():
+                return self.chunk_start + start + int(fills.argmax())
+
+            start = stop
+            chunk_size *= 2
+
+        return end_minute
+
+    # limit prices of the open buy and sell orders, None for either side without an open order
+    def _open_limit_prices(self):
+        buy_price = self.buy_order.price if self.buy_order and self.buy_order.state in OPEN_ORDER_STATUSES else None
+        sell_price = self.sell_order.price if self.sell_order and self.sell_order.state in OPEN_ORDER_STATUSES else None
+
+        return buy_price, sell_price
+
+    # whether _check_orders would fill either order at any of the rows in [start, end) of the current tick data
+    def _can_fill(self, start, end, buy_price, sell_price):
+        range_index = self.tick_data.range_index()
+        return (buy_price is not None and buy_price > range_index.lowest(start, end) * BUY_ORDER_COLLAR) or \
+            (sell_price is not None and sell_price < range_index.highest(start, end) * SELL_ORDER_COLLAR)
+
+    # number of leading minutes out of the next number of minutes at which no order can be filled, found with range
+    # queries rather than checking each minute
+    def _quiet_minutes(self, minutes):
+        start = self.minute_index - self.chunk_start
+        end = start + minutes
+        if end > len(self.tick_data):
+            return 0
+
+        buy_price, sell_price = self._open_limit_prices()
+        if not self._can_fill(start, end, buy_price, sell_price):
+            return minutes
+
+        # binary search for the first minute that can fill, [start, first_fill) never contains a fill
+        first_fill = start
+        while end - first_fill > 1:
+            middle = (first_fill + end) // 2
+            if self._can_fill(first_fill, middle, buy_price, sell_price):
+                end = middle
+            else:
+                first_fill = middle
+
+        return first_fill - start
+
+    # quotes at each of the next number of ticks
+    def upcoming_quotes(self, ticks):
+        row = self.minute_index - self.chunk_start
+        return self.tick_data.open[
+            row + self.minute_increments:
+            row + ticks * self.minute_increments + 1:
+            self.minute_increments
+        ]
+
+    # move forward by the given number of ticks, which the caller has determined won't fill any orders; returns the
+    # quotes at each of the skipped ticks
+    def skip_ticks(self, ticks):
+        coin_prices = self.upcoming_quotes(ticks)
+        self.minute_index += ticks * self.minute_increments
+
+        return coin_prices
 
     # move forward by minute_increments, return true if there are still more rows from the CSV
     def tick(self):
-        for i in range(self.minute_increments):
-            super()._check_orders(
-                low=float(self.current_minute['low']),
-                high=float(self.current_minute['high'])
-            )
+        minutes = self.minute_increments
+        if minutes > 1 and self.price_grid is None:
+            quiet_minutes = self._quiet_minutes(minutes)
+            self.minute_index += quiet_minutes
+            minutes -= quiet_minutes
+            if not minutes:
+                return self.minute_index - self.chunk_start < len(self.tick_data) or self._next_chunk()
+
+        while True:
+            row = self.minute_index - self.chunk_start
+            rows = min(minutes, len(self.tick_data) - row)
+            for offset in self._fill_candidates(row, rows):
+                self.minute_index = self.chunk_start + row + offset
+                super()._check_orders(
+                    low=self.tick_data.low.item(row + offset),
+                    high=self.tick_data.high.item(row + offset)
+                )
 
-            self.minute_index += 1
-            if len(CSVFileOrderService.all_minutes) == self.minute_index:
+            self.minute_index = self.chunk_start + row + rows
+            minutes -= rows
+            if row + rows == len(self.tick_data) and not self._next_chunk():
                 return False
 
-            self.current_minute = CSVFileOrderService.all_minutes[self.minute_index]
+            if not minutes:
+                return True
+
+    # offsets of the rows in [row, row + rows) of the current tick data at which an order could fill, all of them
+    # without a price grid
+    def _fill_candidates(self, row, rows):
+        price_grid = self.price_grid
+        if price_grid is None:
+            return range(rows)
+
+        if rows == 1:
+            if price_grid.low_levels.item(row) <= self.buy_level_bound or \
+                    price_grid.high_levels.item(row) >= self.sell_level_bound:
+                return [0]
+            return []
+
+        return numpy.flatnonzero((price_grid.low_levels[row:row + rows] <= self.buy_level_bound) |
+                                 (price_grid.high_levels[row:row + rows] >= self.sell_level_bound)).tolist()
+
+    def order_sell_limit(self, quantity, price):
+        order = super().order_sell_limit(quantity, price)
+        if self.price_grid is not None:
+            self.sell_level_bound = self.price_grid.level(price) - 1
+
+        return order
+
+    def order_buy_limit(self, quantity, price):
+        order = super().order_buy_limit(quantity, price)
+        if self.price_grid is not None:
+            self.buy_level_bound = self.price_grid.level(price) + 1
+
+        return order
+
+    # grid for the current tick data, if price_grid_ratio is set
+    def _load_price_grid(self):
+        self.price_grid = self.tick_data.price_grid(self.price_grid_ratio, BUY_ORDER_COLLAR, SELL_ORDER_COLLAR) \
+            if self.price_grid_ratio else None
+
+    # move on to the next chunk of a tick stream, return false if there are no more
+    def _next_chunk(self):
+        next_chunk = self._bound_chunk(next(self.tick_chunks, None)) if self.tick_chunks else None
+        if next_chunk is None:
+            return False
 
+        self.chunk_start, self.tick_data = next_chunk
+        self._load_price_grid()
         return True
 
 
@@ -278,8 +531,8 @@ class RealQuoteFakeOrderService(LocalAccountStateOrderService, RobinHoodOrderSer
                     self,
                     holdings=state['holdings'],
                     buying_power=state['buying_power'],
-                    buy_order=state['buy_order'],
-                    sell_order=state['sell_order'],
+                    buy_order=Order.from_dict(state['buy_order']),
+                    sell_order=Order.from_dict(state['sell_order']),
                     next_order_id=state['next_order_id']
                 )
         else:
@@ -304,26 +557,33 @@ class RealQuoteFakeOrderService(LocalAccountStateOrderService, RobinHoodOrderSer
 
         return self.current_quote
 
-    def save(self):
-        with open(self.state_file_path, 'w') as state_file:
-            yaml.safe_dump(
-                {
-                    'holdings': self.holdings,
-                    'buying_power': self.buying_power,
-                    'buy_order': self.buy_order,
-                    'sell_order': self.sell_order,
-                    'next_order_id': self.next_order_id
-                }, state_file)
+    # fetch a new quote and fill orders against it, as when the service is created, for a service kept between runs
+    # (e.g. by a Daemon)
+    def refresh(self):
+        self.current_quote = None
+        LocalAccountStateOrderService._check_orders(
+            self=self,
+            low=self.get_quote(),
+            high=self.get_quote()
+        )
 
-    def _create_next_order(self, side, price, quantity):
-        self.next_order_id += 1
-        return {
-            'id': self.next_order_id,
-            'quantity': quantity,
-            'price': price,
-            'state': OrderStatus.OPEN,
-            'side': side
-        }
+    def save(self):
+        self.write_state(self.state_data())
+
+    # contents of the state file for the current account state, a snapshot that later changes don't affect
+    def state_data(self):
+        return yaml.safe_dump(
+            {
+                'holdings': self.holdings,
+                'buying_power': self.buying_power,
+                'buy_order': self.buy_order.to_dict() if self.buy_order else None,
+                'sell_order': self.sell_order.to_dict() if self.sell_order else None,
+                'next_order_id': self.next_order_id
+            }).encode()
+
+    # write state_data to the state file, which is only replaced once it's complete
+    def write_state(self, data):
+        write_file_atomically(self.state_file_path, data)
 
     def _get_date(self):
         return datetime.now()
@@ -0,0 +1,59 @@
+from giant_dipper.OrderStatuses import OPEN_ORDER_STATUSES
+
+# fields of an Order, named as the keys of its dict form (see Order.to_dict)
+ORDER_FIELDS = ('id', 'side', 'price', 'base_price', 'quantity', 'window_size', 'window_duration_remaining', 'state',
+                'last_transaction_at', 'average_price', 'rounded_executed_notional', 'force_replace')
+
+
+# An order placed with an order service, or the record of one kept in a state manager's open_orders. Fields that
+# aren't set are None. Only the fields are kept from an order's dict form, so to_dict leaves out anything else it had
+# (e.g. the rest of a Robinhood order).
+class Order:
+    __slots__ = ORDER_FIELDS
+
+    def __init__(self, id=None, side=None, price=None, base_price=None, quantity=None, window_size=None,
+                 window_duration_remaining=None, state=None, last_transaction_at=None, average_price=None,
+                 rounded_executed_notional=None, force_replace=None):
+        self.id = id
+        self.side = side
+        self.price = price
+        self.base_price = base_price
+        self.quantity = quantity
+        self.window_size = window_size
+        self.window_duration_remaining = window_duration_remaining
+        self.state = state
+        self.last_transaction_at = last_transaction_at
+        self.average_price = average_price
+        self.rounded_executed_notional = rounded_executed_notional
+        self.force_replace = force_replace
+
+    # build from the dict form of an order (e.g. loaded from YAML, or returned by Robinhood), None stays None
+    @classmethod
+    def from_dict(cls, values):
+        if values is None:
+            return None
+
+        return cls(**{field: values[field] for field in ORDER_FIELDS if field in values})
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in ORDER_FIELDS if getattr(self, field) is not None}
+
+    def is_open(self):
+        return self.state in OPEN_ORDER_STATUSES
+
+    def __eq__(self, other):
+        if isinstance(other, Order):
+            return self.to_dict() == other.to_dict()
+
+        return NotImplemented
+
+    # orders are updated in place (e.g. window_duration_remaining every run), so they're compared by value but can't
+    # be hashed
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Order({})'.format(self.to_dict())
+
+    # pickle as the constructor arguments, more compact than the default for slotted objects (e.g. in checkpoints)
+    def __reduce__(self):
+        return Order, tuple(getattr(self, field) for field in self.__slots__)
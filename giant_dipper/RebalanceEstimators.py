@@ -0,0 +1,9 @@
+# how the rebalance price is estimated when an order_manager has a rebalance_estimator:
+# * ROLLING - average of the last rebalance_interval prices
+# * EMA - exponential moving average of prices, with a span of rebalance_interval prices
+class RebalanceEstimator:
+    ROLLING = 'rolling'
+    EMA = 'ema'
+
+
+REBALANCE_ESTIMATORS = [RebalanceEstimator.ROLLING, RebalanceEstimator.EMA]
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import sqlite3
+
+from giant_dipper.OrderManager import OrderManager
+
+# default limit on the size of the stored results, in bytes
+DEFAULT_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# part of every key, bump whenever a change to the simulation would change the results of a backtest so results
+# cached before the change are no longer found
+RESULT_CACHE_VERSION = 2
+
+# SQL for the value of last_used when a result is used, counting up from the most recent use
+NEXT_USE = 'SELECT COALESCE(MAX(last_used), 0) + 1 FROM results'
+
+
+# Persistent cache of backtest results in an SQLite file: the final compute_metrics() values and the state manager's
+# summary metrics, keyed by the quotes and settings that produced them (see result_key). Once the stored results grow
+# past max_bytes, the least recently used are evicted.
+class ResultCache:
+    def __init__(self, cache_file, max_bytes=DEFAULT_RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(cache_file)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results '
+                                    '(key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL, '
+                                    'last_used INTEGER NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+
+    # the (metrics, summary) stored for the key, or None
+    def get(self, key):
+        with self.connection:
+            row = self.connection.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+
+            self.connection.execute('UPDATE results SET last_used = ({}) WHERE key = ?'.format(NEXT_USE), (key,))
+
+        result = json.loads(row[0])
+        return tuple(result['metrics']), result['summary']
+
+    def put(self, key, metrics, summary):
+        result = json.dumps({'metrics': list(metrics), 'summary': summary})
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ({}))'.format(NEXT_USE),
+                                    (key, result, len(result)))
+            self._evict()
+
+    # remove the least recently used results until the rest fit within max_bytes
+    def _evict(self):
+        total_size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        evicted_keys = []
+        for key, size in self.connection.execute('SELECT key, size FROM results ORDER BY last_used'):
+            if total_size <= self.max_bytes:
+                break
+
+            evicted_keys.append((key,))
+            total_size -= size
+
+        self.connection.executemany('DELETE FROM results WHERE key = ?', evicted_keys)
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+# key for the results of backtesting an order_manager configuration over tick_data; configurations are compared by
+# the OrderManager arguments they produce, so equivalent ones (e.g. with or without default values) share results
+def result_key(tick_data, order_manager_config, minute_increments, cash_holdings_percentage, start_minute=0):
+    arguments = {
+        name: float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+        for name, value in OrderManager.config_arguments(order_manager_config).items()
+    }
+    key = json.dumps([RESULT_CACHE_VERSION, tick_data.content_hash(), start_minute, minute_increments,
+                      float(cash_holdings_percentage), arguments], sort_keys=True)
+
+    return hashlib.sha256(key.encode()).hexdigest()
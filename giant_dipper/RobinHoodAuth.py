@@ -1,29 +1,169 @@
+import os
+import time
+
 import pyotp
 import robin_stocks
 import yaml
 
+from giant_dipper.Files import write_file_atomically
+
 LOGIN_EXPIRATION_SECS = 60 * 60 * 24 * 7  # 1 week
 
+# where RobinHoodSession keeps the token from its last login, next to robin_stocks' own session file
+DEFAULT_SESSION_FILE = os.path.join('~', '.tokens', 'giant_dipper_session.yml')
 
-def robinhood_auth():
-    with open('credentials.yml', 'r') as credentials_file:
-        credentials = yaml.safe_load(credentials_file)
+# name robin_stocks gives its session file for RobinHoodSession's logins (robinhood<name>.pickle), so it's kept apart
+# from the one used by other robin_stocks logins
+ROBIN_STOCKS_PICKLE_NAME = '_giant_dipper'
 
-    rh_credentials = credentials.get('robinhood')
-    if rh_credentials:
-        otp_secret = rh_credentials.get('otp_secret')
-        otp = pyotp.TOTP(otp_secret).now() if otp_secret else None
+# a token is treated as expired this many seconds early, so it doesn't expire in the middle of a run
+SESSION_EXPIRATION_MARGIN = 60 * 60
 
-        try:
-            robin_stocks.robinhood.login(
-                rh_credentials['username'],
-                rh_credentials['password'],
-                LOGIN_EXPIRATION_SECS,
-                mfa_code=otp
-            )
+# login attempts made before giving up, waiting LOGIN_RETRY_DELAY seconds after the first failure, doubling after each
+LOGIN_ATTEMPTS = 3
+LOGIN_RETRY_DELAY = 2
+
+
+# Keeps a Robinhood session logged in for robin_stocks, logging in as rarely as possible:
+# * once logged in, ensure_logged_in does nothing until the token is close to expiring or Robinhood rejects it
+# * a new process (e.g. each cron run) reuses the token from the last login, kept in session_file, without checking
+#   it with Robinhood first
+# * otherwise, credentials are read from credentials_file and login is attempted up to LOGIN_ATTEMPTS times
+#
+# A token is rejected when any request made by robin_stocks gets a 401 response; the next call to ensure_logged_in
+# logs in again. auth_seconds adds up the time spent authenticating, see take_auth_seconds.
+#
+# The response hook watching for 401s is added to robin_stocks' requests session, shared by the whole process, so close
+# should be called once the session is no longer needed.
+class RobinHoodSession:
+    def __init__(self, credentials_file='credentials.yml', session_file=DEFAULT_SESSION_FILE,
+                 expiration_seconds=LOGIN_EXPIRATION_SECS):
+        self.credentials_file = credentials_file
+        self.session_file = os.path.abspath(os.path.expanduser(session_file))
+        self.expiration_seconds = expiration_seconds
+        self.expires_at = None
+        self.rejected = False
+        self.auth_seconds = 0.0
+
+        hooks = robin_stocks.robinhood.helper.SESSION.hooks['response']
+        if self.check_response not in hooks:
+            hooks.append(self.check_response)
+
+    # stop watching robin_stocks' responses
+    def close(self):
+        hooks = robin_stocks.robinhood.helper.SESSION.hooks['response']
+        if self.check_response in hooks:
+            hooks.remove(self.check_response)
+
+    # log in if there's no usable token, returns true if logged in
+    def ensure_logged_in(self):
+        if self.usable(self.expires_at):
             return True
-        except Exception as err:
-            print(err)
+
+        start = time.monotonic()
+        try:
+            return self.load_session() or self.login()
+        finally:
+            self.auth_seconds += time.monotonic() - start
+
+    # seconds spent authenticating since the last call
+    def take_auth_seconds(self):
+        auth_seconds = self.auth_seconds
+        self.auth_seconds = 0.0
+
+        return auth_seconds
+
+    # whether a token expiring at expires_at (seconds since the epoch) can still be used
+    def usable(self, expires_at):
+        return not self.rejected and expires_at is not None and \
+            expires_at - SESSION_EXPIRATION_MARGIN > time.time()
+
+    # use the token from the last login, if there's one that can still be used
+    def load_session(self):
+        if self.rejected or not os.path.exists(self.session_file):
             return False
 
-    return False
+        with open(self.session_file) as session_file:
+            session = yaml.safe_load(session_file) or {}
+
+        if not self.usable(session.get('expires_at')):
+            return False
+
+        self.use_token(session['token_type'], session['access_token'], session['expires_at'])
+        return True
+
+    # log in with the credentials from credentials_file, writing the new token to session_file
+    #
+    # robin_stocks hands back the token in its own session file instead of logging in, as long as Robinhood still
+    # accepts it, with an expires_in that's just the one asked for rather than what's left of it. Logging in only
+    # happens once the token from the last login is close to expiring or was rejected, which is the one robin_stocks
+    # would hand back, so its session file is removed first and the expiry is always that of a newly issued token.
+    def login(self):
+        with open(self.credentials_file, 'r') as credentials_file:
+            credentials = yaml.safe_load(credentials_file)
+
+        rh_credentials = credentials.get('robinhood')
+        if not rh_credentials:
+            return False
+
+        session_directory = os.path.dirname(self.session_file)
+        try:
+            os.remove(os.path.join(session_directory, 'robinhood{}.pickle'.format(ROBIN_STOCKS_PICKLE_NAME)))
+        except FileNotFoundError:
+            pass
+
+        delay = LOGIN_RETRY_DELAY
+        for attempt in range(LOGIN_ATTEMPTS):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+
+            # codes only last 30 seconds, so each attempt gets its own
+            otp_secret = rh_credentials.get('otp_secret')
+            otp = pyotp.TOTP(otp_secret).now() if otp_secret else None
+
+            try:
+                login = robin_stocks.robinhood.login(
+                    rh_credentials['username'],
+                    rh_credentials['password'],
+                    self.expiration_seconds,
+                    mfa_code=otp,
+                    pickle_path=session_directory,
+                    pickle_name=ROBIN_STOCKS_PICKLE_NAME
+                )
+            except Exception as err:
+                print(err)
+                continue
+
+            if login and 'access_token' in login:
+                expires_at = time.time() + login.get('expires_in', self.expiration_seconds)
+                self.use_token(login['token_type'], login['access_token'], expires_at)
+                os.makedirs(session_directory, exist_ok=True)
+                write_file_atomically(self.session_file, yaml.safe_dump({
+                    'token_type': login['token_type'],
+                    'access_token': login['access_token'],
+                    'expires_at': expires_at
+                }).encode())
+                return True
+
+        return False
+
+    def use_token(self, token_type, access_token, expires_at):
+        robin_stocks.robinhood.helper.update_session('Authorization', '{0} {1}'.format(token_type, access_token))
+        robin_stocks.robinhood.helper.set_login_state(True)
+        self.expires_at = expires_at
+        self.rejected = False
+
+    # response hook for robin_stocks' requests session, notes when the token is rejected and drops it from
+    # session_file, so the next process doesn't use it either
+    def check_response(self, response, *args, **kwargs):
+        if response.status_code == 401:
+            self.rejected = True
+            try:
+                os.remove(self.session_file)
+            except FileNotFoundError:
+                pass
+
+
+def robinhood_auth():
+    return RobinHoodSession().ensure_logged_in()
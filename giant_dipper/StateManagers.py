@@ -1,18 +1,84 @@
+import math
+import os
 from os.path import exists
 
+import numpy
 import yaml
 
+from giant_dipper.Files import write_file_atomically
+from giant_dipper.Orders import Order
 from giant_dipper.OrderSides import OrderSide
+from giant_dipper.RebalanceEstimators import RebalanceEstimator
 
 
 def empty_metrics():
     return {'count': 0, 'order_value': 0.0, 'quantity': 0}
 
 
+# peak account value and max drawdown after the given account values (along the first axis, e.g. one column per
+# configuration), following the given peak and max drawdown; the same as BaseStateManager.record_account_value for
+# one value at a time
+def running_drawdown(account_values, peak_account_value, max_drawdown):
+    peaks = numpy.maximum.accumulate(numpy.concatenate((numpy.expand_dims(peak_account_value, 0), account_values)))
+    peaks = peaks[1:]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = numpy.where(peaks > 0, 1 - account_values / peaks, 0)
+
+    return peaks[-1], numpy.maximum(max_drawdown, drawdowns.max(axis=0))
+
+
+# Totals of the orders recorded in a metrics dict, as account_values needs them. Built from the metrics once (e.g.
+# after loading them from a file), then kept up as each order is recorded. Each side's order value and quantity are
+# added up in the same order as in the metrics, so the totals are the same as if they were built from them again.
+class OrderTotals:
+    def __init__(self, metrics):
+        buys = metrics.get(OrderSide.BUY, empty_metrics())
+        sells = metrics.get(OrderSide.SELL, empty_metrics())
+        self.initial_holdings = metrics['initial_holdings']
+        self.initial_buying_power = metrics['initial_buying_power']
+        self.order_values = {OrderSide.BUY: buys['order_value'], OrderSide.SELL: sells['order_value']}
+        self.quantities = {OrderSide.BUY: buys['quantity'], OrderSide.SELL: sells['quantity']}
+        self.usd_gained = None
+        self.coin_gained = None
+        self.holdings = None
+        self.buying_power = None
+        self.update_account()
+
+    # add an order's executed value and quantity to its side's totals
+    def record_order(self, side, order_value, quantity):
+        self.order_values[side] += order_value
+        self.quantities[side] += quantity
+        self.update_account()
+
+    def update_account(self):
+        self.usd_gained = self.order_values[OrderSide.SELL] - self.order_values[OrderSide.BUY]
+        self.coin_gained = self.quantities[OrderSide.BUY] - self.quantities[OrderSide.SELL]
+        self.holdings = self.initial_holdings + self.coin_gained
+        self.buying_power = self.initial_buying_power + self.usd_gained
+
+
 class BaseStateManager:
+    # built from metrics by account_values when first needed, then kept up by record_order
+    order_totals = None
 
     # record baseline values for future comparison
     def record_base_metrics(self, coin_price, holdings, buying_power):
+        metrics = self.metrics
+        if 'max_drawdown' in metrics:
+            metrics['ticks_from_start'] += 1
+            metrics['ticks_since_last_order_execution'] += 1
+        else:
+            self._start_metrics(coin_price, holdings, buying_power)
+
+        if metrics['ticks_since_last_order_execution'] > metrics['longest_ticks_between_orders']:
+            metrics['longest_ticks_between_orders'] = metrics['ticks_since_last_order_execution']
+
+        metrics['last_price'] = coin_price
+        self.record_account_value(self.account_values()[5])
+
+    # set up the metrics on the first tick; metrics from before some of them existed (e.g. loaded from a file) are
+    # filled in too
+    def _start_metrics(self, coin_price, holdings, buying_power):
         if 'initial_price' not in self.metrics:
             self.metrics['initial_price'] = coin_price
 
@@ -35,10 +101,36 @@ class BaseStateManager:
         else:
             self.metrics['ticks_since_last_order_execution'] += 1
 
+        self.metrics['peak_account_value'] = 0.0
+        self.metrics['max_drawdown'] = 0.0
+
+    # track the highest account value, and the largest drop from it (as a fraction of it)
+    def record_account_value(self, account_value):
+        metrics = self.metrics
+        if account_value > metrics['peak_account_value']:
+            metrics['peak_account_value'] = account_value
+        elif metrics['peak_account_value'] > 0:
+            drawdown = 1 - account_value / metrics['peak_account_value']
+            if drawdown > metrics['max_drawdown']:
+                metrics['max_drawdown'] = drawdown
+
+    # equivalent to calling record_base_metrics once for each of the coin prices, for consecutive ticks at which no
+    # orders were executed
+    def record_quiet_ticks(self, coin_prices, holdings, buying_power):
+        tick_count = len(coin_prices)
+        self.metrics['ticks_from_start'] += tick_count
+        self.metrics['ticks_since_last_order_execution'] += tick_count
         if self.metrics['ticks_since_last_order_execution'] > self.metrics['longest_ticks_between_orders']:
             self.metrics['longest_ticks_between_orders'] = self.metrics['ticks_since_last_order_execution']
 
-        self.metrics['last_price'] = coin_price
+        self.metrics['last_price'] = float(coin_prices[-1])
+
+        order_totals = self.account_order_totals()
+        peak_account_value, max_drawdown = running_drawdown(
+            order_totals.holdings * coin_prices + order_totals.buying_power, self.metrics['peak_account_value'],
+            self.metrics['max_drawdown'])
+        self.metrics['peak_account_value'] = float(peak_account_value)
+        self.metrics['max_drawdown'] = float(max_drawdown)
 
     def record_order(self, rh_order, for_rebalance=False):
         self._record_order_metrics(rh_order, for_rebalance)
@@ -51,25 +143,35 @@ class BaseStateManager:
         if not for_rebalance:
             self.metrics['ticks_since_last_order_execution'] = 0
 
-        if rh_order['side'] in self.metrics:
-            side_metrics = self.metrics[rh_order['side']]
+        if rh_order.side in self.metrics:
+            side_metrics = self.metrics[rh_order.side]
         else:
             side_metrics = empty_metrics()
-            self.metrics[rh_order['side']] = side_metrics
+            self.metrics[rh_order.side] = side_metrics
 
+        order_value = float(rh_order.rounded_executed_notional)
+        quantity = round(float(rh_order.quantity))
         if not for_rebalance:
             side_metrics['count'] += 1
-        side_metrics['order_value'] += float(rh_order['rounded_executed_notional'])
-        side_metrics['quantity'] += round(float(rh_order['quantity']))
+        side_metrics['order_value'] += order_value
+        side_metrics['quantity'] += quantity
+        if self.order_totals is not None:
+            self.order_totals.record_order(rh_order.side, order_value, quantity)
+
+    # record the current price, return the average price if a rebalance should occur, otherwise None; with a
+    # rebalance_estimator, every price is recorded in the estimate and a rebalance occurs as soon as the threshold is
+    # exceeded, at the estimated price, rather than averaging the next rebalance_interval prices first
+    def record_check_rebalance(self, current_price, rebalance_interval, rebalance_threshold,
+                               rebalance_estimator=None):
+        if rebalance_estimator:
+            self.record_rebalance_price(current_price, rebalance_interval, rebalance_estimator)
+            if self.rebalance_threshold_exceeded(current_price, rebalance_threshold):
+                return self.rebalance_price_estimate(rebalance_interval, rebalance_estimator)
+
+            return None
 
-    # record the current price, return the average price if a rebalance should occur, otherwise None
-    def record_check_rebalance(self, current_price, rebalance_interval, rebalance_threshold):
         if 'rebalance' not in self.metrics:
-            usd_gained, coin_gained, last_price, current_holdings, current_buying_power, current_account_value = \
-                self.account_values()
-            buying_power_perc = current_buying_power / current_account_value
-            holdings_perc = (current_holdings * current_price) / current_account_value
-            if not rebalance_threshold or abs(buying_power_perc - holdings_perc) > rebalance_threshold:
+            if not rebalance_threshold or self.rebalance_threshold_exceeded(current_price, rebalance_threshold):
                 self.reset_rebalance_metrics()
 
         if 'rebalance' in self.metrics:
@@ -80,24 +182,114 @@ class BaseStateManager:
             if rebalance['count'] >= rebalance_interval:
                 return rebalance['total_price'] / rebalance['count']
 
+    # whether the difference between the percentages of the account in cash and in coin is over the threshold
+    def rebalance_threshold_exceeded(self, current_price, rebalance_threshold):
+        usd_gained, coin_gained, last_price, current_holdings, current_buying_power, current_account_value = \
+            self.account_values()
+        buying_power_perc = current_buying_power / current_account_value
+        holdings_perc = (current_holdings * current_price) / current_account_value
+
+        return abs(buying_power_perc - holdings_perc) > rebalance_threshold
+
+    # Add a price to the rebalance price estimate (see RebalanceEstimator), kept in the metrics so it's saved with
+    # them. The rolling estimate keeps the last rebalance_interval prices in a ring, where the price recorded n-th is
+    # at index n % rebalance_interval.
+    def record_rebalance_price(self, current_price, rebalance_interval, rebalance_estimator):
+        estimate = self.metrics.get('rebalance_estimate')
+        if estimate is None or estimate.get('estimator') != rebalance_estimator or \
+                len(estimate.get('prices', [])) > rebalance_interval:
+            estimate = {'estimator': rebalance_estimator, 'count': 0}
+            if rebalance_estimator == RebalanceEstimator.ROLLING:
+                estimate['prices'] = []
+            self.metrics['rebalance_estimate'] = estimate
+
+        if rebalance_estimator == RebalanceEstimator.ROLLING:
+            prices = estimate['prices']
+            if len(prices) < rebalance_interval:
+                prices.append(current_price)
+            else:
+                prices[estimate['count'] % rebalance_interval] = current_price
+        elif estimate['count'] == 0:
+            estimate['price'] = current_price
+        else:
+            estimate['price'] += 2 / (rebalance_interval + 1) * (current_price - estimate['price'])
+
+        estimate['count'] += 1
+
+    # the estimated rebalance price, or None until rebalance_interval prices have been recorded
+    def rebalance_price_estimate(self, rebalance_interval, rebalance_estimator):
+        estimate = self.metrics.get('rebalance_estimate')
+        if estimate is None or estimate['count'] < rebalance_interval:
+            return None
+
+        if rebalance_estimator == RebalanceEstimator.ROLLING:
+            # sum oldest to newest, so the estimate doesn't depend on where the ring starts
+            prices = estimate['prices']
+            oldest = estimate['count'] % rebalance_interval
+            return sum(prices[oldest:] + prices[:oldest]) / rebalance_interval
+
+        return estimate['price']
+
+    # index of the first of the given prices at which record_check_rebalance would start tracking a rebalance, or None
+    # if it wouldn't be started at any of them; assumes no orders are executed in the meantime
+    def rebalance_start_index(self, coin_prices, rebalance_threshold):
+        if 'rebalance' in self.metrics or not len(coin_prices):
+            return None
+
+        if not rebalance_threshold:
+            return 0
+
+        usd_gained, coin_gained, last_price, current_holdings, current_buying_power, current_account_value = \
+            self.account_values()
+        holdings_values = current_holdings * coin_prices
+        account_values = holdings_values + current_buying_power
+        exceeded = numpy.abs(current_buying_power / account_values - holdings_values / account_values) > \
+            rebalance_threshold
+
+        return int(exceeded.argmax()) if exceeded.any() else None
+
+    # equivalent to calling record_check_rebalance once for each of the coin prices, for consecutive ticks at which no
+    # rebalance would be started or executed
+    def record_quiet_rebalance_ticks(self, coin_prices, rebalance_interval=None, rebalance_estimator=None):
+        if rebalance_estimator:
+            skipped_prices = 0
+            if rebalance_estimator == RebalanceEstimator.ROLLING:
+                # only the last rebalance_interval prices are kept, the rest would be overwritten
+                skipped_prices = max(len(coin_prices) - rebalance_interval, 0)
+                if skipped_prices and len(self.metrics.get('rebalance_estimate', {}).get('prices', [])) == \
+                        rebalance_interval:
+                    self.metrics['rebalance_estimate']['count'] += skipped_prices
+                else:
+                    skipped_prices = 0
+
+            for coin_price in coin_prices[skipped_prices:].tolist():
+                self.record_rebalance_price(coin_price, rebalance_interval, rebalance_estimator)
+        elif 'rebalance' in self.metrics:
+            rebalance = self.metrics['rebalance']
+            rebalance['count'] += len(coin_prices)
+            for coin_price in coin_prices.tolist():
+                rebalance['total_price'] += coin_price
+
     def reset_rebalance_metrics(self):
         self.metrics['rebalance'] = {
             'count': 0,
             'total_price': 0.0
         }
 
+    def account_order_totals(self):
+        if self.order_totals is None:
+            self.order_totals = OrderTotals(self.metrics)
+
+        return self.order_totals
+
     def account_values(self):
         if self.metrics:
-            buys = self.metrics.get(OrderSide.BUY, empty_metrics())
-            sells = self.metrics.get(OrderSide.SELL, empty_metrics())
-            usd_gained = sells['order_value'] - buys['order_value']
-            coin_gained = buys['quantity'] - sells['quantity']
+            order_totals = self.account_order_totals()
             last_price = self.metrics['last_price']
-            current_holdings = self.metrics['initial_holdings'] + coin_gained
-            current_buying_power = self.metrics['initial_buying_power'] + usd_gained
-            current_account_value = current_holdings * last_price + current_buying_power
+            current_account_value = order_totals.holdings * last_price + order_totals.buying_power
 
-            return usd_gained, coin_gained, last_price, current_holdings, current_buying_power, current_account_value
+            return order_totals.usd_gained, order_totals.coin_gained, last_price, order_totals.holdings, \
+                order_totals.buying_power, current_account_value
 
         return 0, 0, 0, 0, 0, 0
 
@@ -117,6 +309,20 @@ class BaseStateManager:
 
         return 0, 0, 0, 0
 
+    # compute_metrics for the ticks since account_values() returned the given baseline values, e.g. leaving out a
+    # warm-up period
+    def compute_metrics_since(self, baseline_account_values):
+        if self.metrics:
+            usd_gained, coin_gained, last_price, current_holdings, current_buying_power, current_account_value = \
+                self.account_values()
+            baseline_usd_gained, baseline_coin_gained, baseline_price, baseline_holdings, baseline_buying_power, \
+                baseline_account_value = baseline_account_values
+
+            return round(usd_gained - baseline_usd_gained, 2), round(coin_gained - baseline_coin_gained), \
+                round(current_account_value / baseline_account_value, 5), round(last_price / baseline_price, 5)
+
+        return 0, 0, 0, 0
+
     # prints collected metrics
     def print_metrics(self):
         if self.metrics and self.open_orders:
@@ -127,6 +333,8 @@ class BaseStateManager:
             print("\t\tNet change in coin: {}".format(coin_gained))
             print("\t\tAccount value change percent: {}%".format(round(account_value_change_percent * 100, 1)))
             print("\t\tCoin price change percent: {}%".format(round(price_change_percent * 100, 1)))
+            if 'max_drawdown' in self.metrics:
+                print("\t\tMax drawdown: {}%".format(round(self.metrics['max_drawdown'] * 100, 1)))
 
 
 class FileStateManager(BaseStateManager):
@@ -140,7 +348,9 @@ class FileStateManager(BaseStateManager):
         if exists(orders_file_path):
             with open(orders_file_path, 'r') as orders_file:
                 orders = yaml.safe_load(orders_file) or {}
-                self.open_orders = orders.get('orders')
+                open_orders = orders.get('orders')
+                if open_orders is not None:
+                    self.open_orders = {side: Order.from_dict(order) for side, order in open_orders.items()}
                 self.metrics = orders.get('metrics', {})
                 self.terminal_quantity = orders.get('terminal_quantity') or self.terminal_quantity
 
@@ -149,18 +359,28 @@ class FileStateManager(BaseStateManager):
 
         # TODO - rewrite the whole file as valid yaml, split files after X number of orders to keep file size low
         with open(self.historical_orders_file_path, 'a') as historical_orders_file:
-            yaml.safe_dump({'order': rh_order}, historical_orders_file)
+            yaml.safe_dump({'order': rh_order.to_dict()}, historical_orders_file)
 
     # dump order state to file
     def save(self, silent=False):
         if not silent:
             self.print_metrics()
 
-        with open(self.orders_file_path, 'w') as orders_file:
-            yaml.safe_dump(
-                {'orders': self.open_orders, 'metrics': self.metrics, 'terminal_quantity': self.terminal_quantity},
-                orders_file
-            )
+        self.write_state(self.state_data())
+
+    # contents of the orders file for the current state, a snapshot that later changes to the state don't affect
+    def state_data(self):
+        open_orders = None
+        if self.open_orders is not None:
+            open_orders = {side: order.to_dict() for side, order in self.open_orders.items()}
+
+        return yaml.safe_dump(
+            {'orders': open_orders, 'metrics': self.metrics, 'terminal_quantity': self.terminal_quantity}
+        ).encode()
+
+    # write state_data to the orders file, which is only replaced once it's complete
+    def write_state(self, data):
+        write_file_atomically(self.orders_file_path, data)
 
 
 # for testing
@@ -174,26 +394,146 @@ class InMemoryStateManager(BaseStateManager):
         super().record_order(rh_order, for_rebalance)
 
 
-# keeps track of the state of each tick for the purposes of visual plotting of data
+# columns recorded for every tick by GraphingStateManager, limit prices are NaN while there's no order on that side
+TICK_COLUMNS = ['coin_price', 'holdings', 'buying_power', 'account_value', 'sell_limit', 'buy_limit']
+
+# initial number of ticks GraphingStateManager has room for, when it isn't told how many to expect
+DEFAULT_GRAPHING_CAPACITY = 4096
+
+
+# Keeps track of the state of each tick for the purposes of visual plotting of data. Ticks are recorded in typed
+# arrays (see TICK_COLUMNS) with room for capacity ticks to start with, growing as needed; filled orders are kept in a
+# separate list of (tick, for_rebalance, order), as only a few ticks have them.
 class GraphingStateManager(InMemoryStateManager):
-    def __init__(self):
+    def __init__(self, capacity=DEFAULT_GRAPHING_CAPACITY):
         super().__init__()
-        self.all_tick_data = []
+        self.tick_count = 0
+        self.columns = {column: numpy.empty(max(capacity, 1)) for column in TICK_COLUMNS}
+        self.fills = []
+
+    # make room for the given number of ticks, returns the index of the first
+    def _add_ticks(self, ticks):
+        start = self.tick_count
+        capacity = len(self.columns['coin_price'])
+        if start + ticks > capacity:
+            capacity = max(capacity * 2, start + ticks)
+            for column, values in self.columns.items():
+                self.columns[column] = numpy.empty(capacity)
+                self.columns[column][:start] = values[:start]
+
+        self.tick_count += ticks
+        return start
+
+    def _limit_price(self, side):
+        return self.open_orders[side].price if self.open_orders and side in self.open_orders else numpy.nan
 
     def record_base_metrics(self, coin_price, holdings, buying_power):
         super().record_base_metrics(coin_price, holdings, buying_power)
-        self.all_tick_data.append({
-            'coin_price': coin_price,
-            'holdings': holdings,
-            'buying_power': buying_power,
-            'account_value': (holdings * coin_price) + buying_power,
-            'sell_limit': self.open_orders[OrderSide.SELL][
-                'price'] if self.open_orders and OrderSide.SELL in self.open_orders else None,
-            'buy_limit': self.open_orders[OrderSide.BUY][
-                'price'] if self.open_orders and OrderSide.BUY in self.open_orders else None
-        })
+        index = self._add_ticks(1)
+        self.columns['coin_price'][index] = coin_price
+        self.columns['holdings'][index] = holdings
+        self.columns['buying_power'][index] = buying_power
+        self.columns['account_value'][index] = (holdings * coin_price) + buying_power
+        self.columns['sell_limit'][index] = self._limit_price(OrderSide.SELL)
+        self.columns['buy_limit'][index] = self._limit_price(OrderSide.BUY)
+
+    def record_quiet_ticks(self, coin_prices, holdings, buying_power):
+        super().record_quiet_ticks(coin_prices, holdings, buying_power)
+        start = self._add_ticks(len(coin_prices))
+        ticks = slice(start, self.tick_count)
+        self.columns['coin_price'][ticks] = coin_prices
+        self.columns['holdings'][ticks] = holdings
+        self.columns['buying_power'][ticks] = buying_power
+        self.columns['account_value'][ticks] = (holdings * coin_prices) + buying_power
+        self.columns['sell_limit'][ticks] = self._limit_price(OrderSide.SELL)
+        self.columns['buy_limit'][ticks] = self._limit_price(OrderSide.BUY)
 
     def record_order(self, rh_order, for_rebalance=False):
         super().record_order(rh_order, for_rebalance)
-        self.all_tick_data[-1]['rebalance'] = for_rebalance
-        self.all_tick_data[-1]['filled_order'] = rh_order
+        self.fills.append((self.tick_count - 1, for_rebalance, rh_order))
+
+    # the recorded columns, without the room left for more ticks
+    def tick_columns(self):
+        return {column: values[:self.tick_count] for column, values in self.columns.items()}
+
+    # the filled orders as columns: the "fill_tick" they were filled at, whether they were "fill_rebalance" orders,
+    # and their "fill_side", "fill_price" and "fill_quantity"
+    def fill_columns(self):
+        return {
+            'fill_tick': numpy.array([tick for tick, for_rebalance, order in self.fills], dtype=numpy.int64),
+            'fill_rebalance': numpy.array([for_rebalance for tick, for_rebalance, order in self.fills], dtype=bool),
+            'fill_side': numpy.array([order.side for tick, for_rebalance, order in self.fills], dtype='U4'),
+            'fill_price': numpy.array([float(order.average_price or order.price)
+                                       for tick, for_rebalance, order in self.fills]),
+            'fill_quantity': numpy.array([float(order.quantity) for tick, for_rebalance, order in self.fills])
+        }
+
+    # Indexes of the ticks to keep when downsampling to about max_points ticks while keeping the shape of a column:
+    # the ticks are split into max_points / 2 buckets, and the lowest and highest tick of each is kept, so spikes
+    # aren't lost the way they would be by taking every n-th tick.
+    def downsample_indexes(self, max_points, column='coin_price'):
+        values = self.columns[column][:self.tick_count]
+        if len(values) <= max_points:
+            return numpy.arange(len(values))
+
+        bucket_size = -(-len(values) // max(max_points // 2, 1))
+        buckets = -(-len(values) // bucket_size)
+        padded = numpy.full(buckets * bucket_size, numpy.nan)
+        padded[:len(values)] = values
+        padded = padded.reshape(buckets, bucket_size)
+        lowest = numpy.where(numpy.isnan(padded), numpy.inf, padded).argmin(axis=1)
+        highest = numpy.where(numpy.isnan(padded), -numpy.inf, padded).argmax(axis=1)
+        offsets = numpy.arange(buckets) * bucket_size
+
+        return numpy.unique(numpy.concatenate((offsets + lowest, offsets + highest)))
+
+    # the recorded columns (see tick_columns), downsampled with downsample_indexes if max_points is set, along with
+    # the "tick" index of each
+    def downsampled(self, max_points=None, column='coin_price'):
+        indexes = numpy.arange(self.tick_count) if max_points is None else \
+            self.downsample_indexes(max_points, column)
+        columns = {name: values[indexes] for name, values in self.tick_columns().items()}
+        columns['tick'] = indexes
+
+        return columns
+
+    # save the (optionally downsampled, see downsampled) tick columns and fill columns to an .npz file
+    def save_npz(self, file_path, max_points=None, column='coin_price'):
+        numpy.savez(file_path, **self.downsampled(max_points, column), **self.fill_columns())
+
+    # save every column (see save_npz) to its own .npy file in a directory, these can be memory-mapped with
+    # numpy.load(..., mmap_mode='r')
+    def save_npy(self, directory, max_points=None, column='coin_price'):
+        os.makedirs(directory, exist_ok=True)
+        for name, values in {**self.downsampled(max_points, column), **self.fill_columns()}.items():
+            numpy.save(os.path.join(directory, name + '.npy'), values)
+
+    # a dict per tick as recorded by earlier versions, with limit prices of None when there was no order, and the
+    # "filled_order" and whether it was for a "rebalance" at ticks with a filled order
+    @property
+    def all_tick_data(self):
+        columns = {column: values.tolist() for column, values in self.tick_columns().items()}
+        all_tick_data = [
+            {
+                'coin_price': coin_price,
+                'holdings': holdings,
+                'buying_power': buying_power,
+                'account_value': account_value,
+                'sell_limit': None if math.isnan(sell_limit) else sell_limit,
+                'buy_limit': None if math.isnan(buy_limit) else buy_limit
+            }
+            for coin_price, holdings, buying_power, account_value, sell_limit, buy_limit in
+            zip(*(columns[column] for column in TICK_COLUMNS))
+        ]
+        for tick, for_rebalance, order in self.fills:
+            all_tick_data[tick]['rebalance'] = for_rebalance
+            all_tick_data[tick]['filled_order'] = order
+
+        return all_tick_data
+
+    # leave out the room for more ticks when pickling (e.g. for Backtest checkpoints)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['columns'] = {column: values.copy() for column, values in self.tick_columns().items()}
+
+        return state
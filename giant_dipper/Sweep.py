@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from giant_dipper.Backtest import DEFAULT_CHECKPOINT_INTERVAL, Backtest
+from giant_dipper.Files import write_file_atomically
+from giant_dipper.OrderManager import OrderManager
+from giant_dipper.OrderServices import CSVFileOrderService
+from giant_dipper.ResultCache import result_key
+from giant_dipper.StateManagers import InMemoryStateManager
+from giant_dipper.TickData import TickData
+
+# tick data attached from shared memory, set in each worker process by the pool initializer
+worker_tick_data = None
+
+
+def attach_worker_tick_data(shared_memory_name):
+    global worker_tick_data
+    worker_tick_data = TickData.from_shared_memory(shared_memory_name)
+
+
+# backtest a single order_manager configuration, returns its final metrics; if checkpoint_file is provided, the
+# backtest resumes from it when it exists, is checkpointed to it while running, and it's removed once finished
+#
+# If state_directory is provided, the end state of the backtest is saved there along with a hash of the quotes it
+# covered. When the configuration is run again on the same quotes with more rows appended, it continues from that
+# state over the new rows only, with the same metrics as a full rerun.
+#
+# If a ResultCache is provided as result_cache, results already stored for the same quotes and settings are returned
+# without simulating, and new results are stored.
+def run_config(tick_data, order_manager_config, minute_increments, cash_holdings_percentage, csv_datetime_format,
+               start_minute=0, event_driven=True, checkpoint_file=None,
+               checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, state_directory=None, result_cache=None):
+    key = None
+    if result_cache is not None:
+        key = result_key(tick_data, order_manager_config, minute_increments, cash_holdings_percentage, start_minute)
+        cached_result = result_cache.get(key)
+        if cached_result is not None:
+            return cached_result[0]
+
+    result = run_config_summary(tick_data, order_manager_config, minute_increments, cash_holdings_percentage,
+                                csv_datetime_format, start_minute, event_driven, checkpoint_file,
+                                checkpoint_interval, state_directory)
+    if result_cache is not None:
+        result_cache.put(key, *result)
+
+    return result[0]
+
+
+# backtest a single order_manager configuration as run_config does, returns its final metrics along with the state
+# manager's summary metrics
+def run_config_summary(tick_data, order_manager_config, minute_increments, cash_holdings_percentage,
+                       csv_datetime_format, start_minute=0, event_driven=True, checkpoint_file=None,
+                       checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, state_directory=None):
+    state_file = config_file(state_directory, '.state', order_manager_config, minute_increments,
+                             cash_holdings_percentage, csv_datetime_format, start_minute) if state_directory else None
+    backtest = None
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        backtest = Backtest.load_checkpoint(checkpoint_file, tick_data)
+    elif state_file and os.path.exists(state_file):
+        backtest = load_end_state(state_file, tick_data)
+
+    if backtest is None:
+        backtest = new_backtest(tick_data, order_manager_config, minute_increments, cash_holdings_percentage,
+                                csv_datetime_format, start_minute)
+
+    metrics = backtest.run(event_driven=event_driven, checkpoint_file=checkpoint_file,
+                           checkpoint_interval=checkpoint_interval, keep_end_checkpoint=state_file is not None)
+    if state_file:
+        write_file_atomically(state_file, pickle.dumps({
+            'rows': len(tick_data),
+            'content_hash': tick_data.content_hash(),
+            'checkpoint': backtest.end_checkpoint
+        }, protocol=pickle.HIGHEST_PROTOCOL))
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    return metrics, backtest.state_manager.metrics
+
+
+# backtest of an order_manager configuration over tick_data, ready to run
+def new_backtest(tick_data, order_manager_config, minute_increments, cash_holdings_percentage, csv_datetime_format,
+                 start_minute=0, end_minute=None):
+    order_service = CSVFileOrderService(None, minute_increments, cash_holdings_percentage, csv_datetime_format,
+                                        start_minute=start_minute, tick_data=tick_data, end_minute=end_minute,
+                                        price_grid_ratio=order_manager_config['price_increment_ratio'])
+
+    return Backtest(OrderManager.from_config(order_service, InMemoryStateManager(), order_manager_config, silent=True))
+
+
+# restore the backtest saved by run_config in state_file, or None if it doesn't cover a prefix of tick_data
+def load_end_state(state_file, tick_data):
+    with open(state_file, 'rb') as file:
+        state = pickle.load(file)
+
+    if state['rows'] > len(tick_data) or tick_data.content_hash(state['rows']) != state['content_hash']:
+        return None
+
+    return Backtest.from_checkpoint(state['checkpoint'], tick_data)
+
+
+# file within directory for a configuration's backtest, named by a hash of the given values
+def config_file(directory, suffix, *values):
+    key = json.dumps(values, sort_keys=True)
+    return os.path.join(directory, hashlib.sha256(key.encode()).hexdigest() + suffix)
+
+
+# checkpoint file within checkpoint_directory for a configuration's backtest, named by a hash of everything its results
+# depend on
+def config_checkpoint_file(checkpoint_directory, tick_data, order_manager_config, minute_increments,
+                           cash_holdings_percentage, csv_datetime_format, start_minute=0):
+    return config_file(checkpoint_directory, '.checkpoint', order_manager_config, minute_increments,
+                       cash_holdings_percentage, csv_datetime_format, start_minute, len(tick_data),
+                       tick_data.timestamps[:1].tolist(), tick_data.timestamps[-1:].tolist())
+
+
+def run_worker_config(*args, **kwargs):
+    return run_config_summary(worker_tick_data, *args, **kwargs)
+
+
+# Backtest every order_manager configuration across a pool of worker processes, see worker_pool.
+#
+# Yields (configuration, metrics) pairs in the order the backtests finish; backtests that haven't started yet are
+# cancelled if iteration stops early.
+#
+# If checkpoint_directory is provided, each backtest is checkpointed there while it runs, so a sweep that's
+# interrupted and started again with the same arguments resumes its unfinished backtests rather than starting over.
+#
+# If state_directory is provided, each configuration continues from its end state from an earlier sweep over a prefix
+# of the same quotes, see run_config.
+#
+# If a ResultCache is provided as result_cache, configurations with stored results are yielded first without being
+# simulated, and the results of the rest are stored as they finish.
+def run_sweep(tick_data, order_manager_configs, minute_increments=1, cash_holdings_percentage=0.5,
+              csv_datetime_format='%Y-%m-%d %H:%M:%S', start_minute=0, processes=None, event_driven=True,
+              checkpoint_directory=None, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, state_directory=None,
+              result_cache=None):
+    # configurations to simulate, each with its result cache key
+    uncached_configs = []
+    for config in order_manager_configs:
+        key = None
+        if result_cache is not None:
+            key = result_key(tick_data, config, minute_increments, cash_holdings_percentage, start_minute)
+            cached_result = result_cache.get(key)
+            if cached_result is not None:
+                yield config, cached_result[0]
+                continue
+
+        uncached_configs.append((config, key))
+
+    if not uncached_configs:
+        return
+
+    with worker_pool(tick_data, processes) as executor:
+        futures = {
+            executor.submit(
+                run_worker_config, config, minute_increments, cash_holdings_percentage, csv_datetime_format,
+                start_minute=start_minute, event_driven=event_driven, checkpoint_interval=checkpoint_interval,
+                state_directory=state_directory,
+                checkpoint_file=config_checkpoint_file(checkpoint_directory, tick_data, config, minute_increments,
+                                                       cash_holdings_percentage, csv_datetime_format, start_minute)
+                if checkpoint_directory else None
+            ): (config, key)
+            for config, key in uncached_configs
+        }
+        for future in as_completed(futures):
+            config, key = futures[future]
+            metrics, summary = future.result()
+            if result_cache is not None:
+                result_cache.put(key, metrics, summary)
+
+            yield config, metrics
+
+
+# Pool of worker processes (one per core by default) that can read tick_data as worker_tick_data. The quotes are
+# copied once into shared memory that every worker attaches to, rather than each worker loading its own copy. Work
+# that hasn't started yet is cancelled on exit.
+@contextmanager
+def worker_pool(tick_data, processes=None):
+    shared_memory = tick_data.to_shared_memory()
+    executor = ProcessPoolExecutor(max_workers=processes, initializer=attach_worker_tick_data,
+                                   initargs=(shared_memory.name,))
+    try:
+        yield executor
+    finally:
+        executor.shutdown(cancel_futures=True)
+        shared_memory.close()
+        shared_memory.unlink()
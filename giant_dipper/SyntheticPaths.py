@@ -0,0 +1,106 @@
+from concurrent.futures import as_completed
+
+import numpy
+
+from giant_dipper import Sweep
+from giant_dipper.Backtest import BatchBacktest
+from giant_dipper.TickData import TickData
+
+# default number of paths generated together, and handed to a worker process at a time
+DEFAULT_PATH_BATCH_SIZE = 64
+
+# percentiles reported by distribution_summary
+SUMMARY_PERCENTILES = [5, 25, 50, 75, 95]
+
+
+# Synthetic minute quotes made by block bootstrap of historical quotes: each path strings together randomly chosen
+# blocks of block_minutes consecutive minutes, taking each minute's open-to-open return and its low and high relative
+# to its open. Blocks keep the short-range structure of the original (volatility clustering, intraminute ranges) while
+# the order of moves is reshuffled. Paths start at start_price (the first historical open by default) and are
+# generated a batch at a time with array operations.
+class BlockBootstrap:
+    def __init__(self, tick_data, block_minutes=60, start_price=None):
+        if len(tick_data) < block_minutes + 1:
+            raise Exception('At least {} minutes of quotes are needed for blocks of {} minutes'.format(
+                block_minutes + 1, block_minutes))
+
+        opens = tick_data.open[:-1]
+        self.returns = numpy.log(tick_data.open[1:] / opens)
+        self.low_ratios = tick_data.low[:-1] / opens
+        self.high_ratios = tick_data.high[:-1] / opens
+        self.block_minutes = block_minutes
+        self.start_price = tick_data.open.item(0) if start_price is None else start_price
+        self.start_timestamp = tick_data.timestamps.item(0)
+
+    # count paths of the given number of minutes, as TickData; the same seed always gives the same paths
+    def paths(self, count, minutes, seed=None, batch_size=DEFAULT_PATH_BATCH_SIZE):
+        batch_seeds = numpy.random.SeedSequence(seed).spawn((count + batch_size - 1) // batch_size)
+        for batch, batch_seed in enumerate(batch_seeds):
+            yield from self.batch(batch_seed, min(batch_size, count - batch * batch_size), minutes)
+
+    def batch(self, batch_seed, count, minutes):
+        generator = numpy.random.default_rng(batch_seed)
+        blocks = -(-minutes // self.block_minutes)
+        block_starts = generator.integers(0, len(self.returns) - self.block_minutes + 1, (count, blocks, 1))
+        minute_indexes = (block_starts + numpy.arange(self.block_minutes)).reshape(count, -1)[:, :minutes]
+
+        log_prices = numpy.zeros((count, minutes))
+        numpy.cumsum(self.returns[minute_indexes[:, :-1]], axis=1, out=log_prices[:, 1:])
+        opens = self.start_price * numpy.exp(log_prices)
+        lows = opens * self.low_ratios[minute_indexes]
+        highs = opens * self.high_ratios[minute_indexes]
+        timestamps = self.start_timestamp + 60 * numpy.arange(minutes, dtype=numpy.int64)
+
+        return [TickData(timestamps, opens[path], lows[path], highs[path]) for path in range(count)]
+
+
+# account value change of each configuration on a batch of paths in a worker process, as a (configs, paths) array;
+# the configurations are run over each path together (see BatchBacktest)
+def score_worker_batch(batch_seed, count, minutes, block_minutes, order_manager_configs, minute_increments,
+                       cash_holdings_percentage):
+    paths = BlockBootstrap(Sweep.worker_tick_data, block_minutes).batch(batch_seed, count, minutes)
+    scores = numpy.empty((len(order_manager_configs), count))
+    for path_index, path in enumerate(paths):
+        order_managers = [Sweep.new_backtest(path, config, minute_increments, cash_holdings_percentage,
+                                             '%Y-%m-%d %H:%M:%S').order_manager for config in order_manager_configs]
+        scores[:, path_index] = [metrics[2] for metrics in BatchBacktest(order_managers).run()]
+
+    return scores
+
+
+# Backtest each order_manager configuration on path_count synthetic paths of path_minutes minutes, bootstrapped from
+# tick_data (see BlockBootstrap), across a pool of worker processes (see Sweep.worker_pool). Paths are generated by
+# the workers, a batch at a time, rather than sent to them.
+#
+# Returns a (configs, paths) array of the account value change percent from compute_metrics(), the same for a given
+# seed as backtesting the paths of BlockBootstrap.paths with that seed and batch_size one at a time.
+def score_configs(tick_data, order_manager_configs, path_count, path_minutes, block_minutes=60, seed=None,
+                  minute_increments=1, cash_holdings_percentage=0.5, processes=None,
+                  batch_size=DEFAULT_PATH_BATCH_SIZE):
+    scores = numpy.empty((len(order_manager_configs), path_count))
+    batch_seeds = numpy.random.SeedSequence(seed).spawn((path_count + batch_size - 1) // batch_size)
+    with Sweep.worker_pool(tick_data, processes) as executor:
+        futures = {
+            executor.submit(score_worker_batch, batch_seed, min(batch_size, path_count - batch * batch_size),
+                            path_minutes, block_minutes, order_manager_configs, minute_increments,
+                            cash_holdings_percentage): batch * batch_size
+            for batch, batch_seed in enumerate(batch_seeds)
+        }
+        for future in as_completed(futures):
+            batch_scores = future.result()
+            scores[:, futures[future]:futures[future] + batch_scores.shape[1]] = batch_scores
+
+    return scores
+
+
+# summary of the distribution of one configuration's scores across paths
+def distribution_summary(scores):
+    summary = {
+        'mean': float(numpy.mean(scores)),
+        'std': float(numpy.std(scores)),
+        'gain_probability': float(numpy.mean(scores > 1))
+    }
+    for percentile, value in zip(SUMMARY_PERCENTILES, numpy.percentile(scores, SUMMARY_PERCENTILES)):
+        summary['p{}'.format(percentile)] = float(value)
+
+    return summary
@@ -0,0 +1,449 @@
+import bz2
+import calendar
+import csv
+import gzip
+import hashlib
+import lzma
+import math
+import mmap
+import os
+import struct
+from array import array
+from glob import glob
+from datetime import datetime, timezone
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy
+
+from giant_dipper.Files import write_file_atomically
+
+# binary tick cache layout: a fixed-size header followed by the timestamp, open, low, and high columns, each stored as
+# little-endian 8-byte values so they can be memory-mapped directly
+TICK_CACHE_MAGIC = b'GDTICKS\x00'
+TICK_CACHE_VERSION = 1
+
+# magic, version, row count, source file size, source file mtime (ns), sha256 of the source file, datetime format
+TICK_CACHE_HEADER = struct.Struct('<8sIQQq32s64s')
+
+# the source file size and mtime within the header, rewritten in place when the source is touched without changing
+TICK_CACHE_SOURCE_STAT = struct.Struct('<Qq')
+TICK_CACHE_SOURCE_STAT_OFFSET = struct.calcsize('<8sIQ')
+
+# longest datetime format that fits in the header
+TICK_CACHE_MAX_DATETIME_FORMAT = 64
+TICK_CACHE_HEADER_SIZE = 256
+TICK_CACHE_COLUMNS = [('timestamps', '<i8'), ('open', '<f8'), ('low', '<f8'), ('high', '<f8')]
+TICK_CACHE_EXTENSION = '.ticks'
+
+COMPRESSED_FILE_OPENERS = {'.gz': gzip.open, '.xz': lzma.open, '.bz2': bz2.open}
+
+# default number of rows per chunk when streaming quotes, about 12 MB of columns
+DEFAULT_STREAM_CHUNK_SIZE = 1 << 18
+
+# prices at or below this are all placed on the same (lowest) grid level
+PRICE_GRID_MINIMUM = 1e-300
+
+# number of price grid levels per step of the price_increment_ratio it's built for, so the grid is as fine relative to
+# every configuration's order spacing
+PRICE_GRID_DIVISIONS = 100
+
+
+# convert a quote date string to epoch seconds; naive dates are treated as UTC, dates with an offset (%z) are
+# converted to UTC
+def parse_epoch_seconds(date, datetime_format):
+    return calendar.timegm(datetime.strptime(date, datetime_format).utctimetuple())
+
+
+# inverse of parse_epoch_seconds, up to normalization: the date is formatted in UTC with every field in its canonical
+# form, so a string that was parsed with an offset (%z) or with unpadded fields doesn't round-trip to the same text
+def format_epoch_seconds(epoch_seconds, datetime_format):
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).strftime(datetime_format)
+
+
+# open a CSV file for reading as text, decompressing it first if it has a .gz, .xz, or .bz2 extension
+def open_csv(csv_file):
+    opener = COMPRESSED_FILE_OPENERS.get(os.path.splitext(csv_file)[1], open)
+    return opener(csv_file, 'rt', newline='')
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.digest()
+
+
+# Columnar store of per-minute quotes: contiguous float64 arrays for the open, low, and high prices and an int64 array
+# of epoch timestamps, all indexed by minute
+class TickData:
+    def __init__(self, timestamps, opens, lows, highs):
+        self.timestamps = timestamps
+        self.open = opens
+        self.low = lows
+        self.high = highs
+
+        # memory-mapped file or shared memory block backing the arrays, if any
+        self.buffer = None
+        # tick data this holds the first rows of (see head), whose range index and price grid are shared with it
+        self.prefix_of = None
+        self._range_index = None
+        self._price_grids = {}
+        self._content_hash = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    # grid levels of the lows and highs, scaled by the given multipliers, on the grid for price_increment_ratio (see
+    # PRICE_GRID_DIVISIONS); built the first time it's requested and then kept for everything reading this data with
+    # the same ratio, e.g. every sweep trial pairing that ratio with other settings
+    def price_grid(self, price_increment_ratio, low_multiplier=1, high_multiplier=1):
+        if self.prefix_of is not None:
+            return self.prefix_of.price_grid(price_increment_ratio, low_multiplier, high_multiplier)
+
+        key = (price_increment_ratio, low_multiplier, high_multiplier)
+        if key not in self._price_grids:
+            self._price_grids[key] = PriceGrid(pow(price_increment_ratio, 1 / PRICE_GRID_DIVISIONS), self.low,
+                                               self.high, low_multiplier, high_multiplier)
+
+        return self._price_grids[key]
+
+    # the first number of rows, sharing this data's arrays along with its range index and price grid, which cover
+    # these rows the same way
+    def head(self, rows):
+        if rows >= len(self):
+            return self
+
+        head = TickData(self.timestamps[:rows], self.open[:rows], self.low[:rows], self.high[:rows])
+        head.prefix_of = self.prefix_of or self
+
+        return head
+
+    # index over the low and high columns for range queries, built the first time it's needed
+    def range_index(self):
+        if self.prefix_of is not None:
+            return self.prefix_of.range_index()
+
+        if self._range_index is None:
+            self._range_index = RangeIndex(self.low, self.high)
+
+        return self._range_index
+
+    # combine each run of the given number of minutes into a single row with the first row's timestamp and open price
+    # and the run's lowest low and highest high; the final row may cover fewer minutes
+    def resample(self, minutes):
+        starts = numpy.arange(0, len(self), minutes)
+        full_starts = starts[:len(self) // minutes]
+        range_index = self.range_index()
+        lows = range_index.lowest_of_runs(full_starts, minutes)
+        highs = range_index.highest_of_runs(full_starts, minutes)
+        if len(starts) > len(full_starts):
+            lows = numpy.append(lows, range_index.lowest(starts[-1], len(self)))
+            highs = numpy.append(highs, range_index.highest(starts[-1], len(self)))
+
+        return TickData(
+            timestamps=self.timestamps[starts],
+            opens=self.open[starts],
+            lows=lows,
+            highs=highs
+        )
+
+    # parse every row of the CSV file once, see CSVFileOrderService for the required headings
+    @classmethod
+    def from_csv(cls, csv_file, csv_datetime_format):
+        with open_csv(csv_file) as file:
+            reader = csv.reader(file)
+            return cls.from_rows(reader, next(reader), csv_datetime_format)
+
+    # parse rows from a CSV reader with the given headings, stopping after max_rows rows if set
+    @classmethod
+    def from_rows(cls, reader, headings, csv_datetime_format, max_rows=None):
+        timestamps = array('q')
+        opens = array('d')
+        lows = array('d')
+        highs = array('d')
+
+        date_index = headings.index('date')
+        open_index = headings.index('open')
+        low_index = headings.index('low')
+        high_index = headings.index('high')
+
+        for row in reader:
+            if not row:
+                continue
+
+            timestamps.append(parse_epoch_seconds(row[date_index], csv_datetime_format))
+            opens.append(float(row[open_index]))
+            lows.append(float(row[low_index]))
+            highs.append(float(row[high_index]))
+            if len(timestamps) == max_rows:
+                break
+
+        return cls(
+            timestamps=numpy.frombuffer(timestamps, dtype=numpy.int64),
+            opens=numpy.frombuffer(opens, dtype=numpy.float64),
+            lows=numpy.frombuffer(lows, dtype=numpy.float64),
+            highs=numpy.frombuffer(highs, dtype=numpy.float64)
+        )
+
+    # memory-map a cache file written by write_cache, the arrays are read-only views into the shared page cache
+    @classmethod
+    def from_cache(cls, cache_file):
+        with open(cache_file, 'rb') as file:
+            return cls.from_buffer(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    # attach to a shared memory block created by to_shared_memory in another process
+    @classmethod
+    def from_shared_memory(cls, name):
+        return cls.from_buffer(SharedMemory(name=name))
+
+    # build array views onto a buffer (or an object with a buf attribute, like SharedMemory) laid out like a cache file,
+    # the buffer is kept alive as long as the tick data is
+    @classmethod
+    def from_buffer(cls, buffer):
+        data = buffer.buf if isinstance(buffer, SharedMemory) else buffer
+        rows = read_cache_header(data)[1]
+        columns = {}
+        offset = TICK_CACHE_HEADER_SIZE
+        for name, dtype in TICK_CACHE_COLUMNS:
+            columns[name] = numpy.frombuffer(data, dtype=dtype, count=rows, offset=offset)
+            offset += rows * numpy.dtype(dtype).itemsize
+
+        tick_data = cls(
+            timestamps=columns['timestamps'],
+            opens=columns['open'],
+            lows=columns['low'],
+            highs=columns['high']
+        )
+        tick_data.buffer = buffer
+
+        return tick_data
+
+    # load from the binary cache for this CSV file, (re)converting the CSV first if the cache is missing or stale
+    @classmethod
+    def from_csv_cached(cls, csv_file, csv_datetime_format, cache_file=None):
+        cache_file = cache_file or csv_file + TICK_CACHE_EXTENSION
+        if not tick_cache_is_current(cache_file, csv_file, csv_datetime_format):
+            convert_csv(csv_file, csv_datetime_format, cache_file)
+
+        return cls.from_cache(cache_file)
+
+    # sha256 of the columns of the first number of rows (all rows by default), identifying the quotes regardless of
+    # where they were loaded from
+    def content_hash(self, rows=None):
+        if rows is None or rows >= len(self):
+            if self._content_hash is None:
+                self._content_hash = self._hash_rows(len(self))
+
+            return self._content_hash
+
+        return self._hash_rows(rows)
+
+    def _hash_rows(self, rows):
+        digest = hashlib.sha256()
+        for name, dtype in TICK_CACHE_COLUMNS:
+            digest.update(numpy.ascontiguousarray(getattr(self, name)[:rows], dtype=dtype).tobytes())
+
+        return digest.hexdigest()
+
+    # copy the columns into a new shared memory block, laid out like a cache file, that other processes can attach to
+    # by name using from_shared_memory; the caller owns the block and must close and unlink it when done
+    def to_shared_memory(self):
+        column_size = len(self) * 8
+        shared_memory = SharedMemory(create=True, size=TICK_CACHE_HEADER_SIZE + column_size * len(TICK_CACHE_COLUMNS))
+        TICK_CACHE_HEADER.pack_into(shared_memory.buf, 0, TICK_CACHE_MAGIC, TICK_CACHE_VERSION, len(self), 0, 0, b'',
+                                    b'')
+
+        offset = TICK_CACHE_HEADER_SIZE
+        for name, dtype in TICK_CACHE_COLUMNS:
+            shared_memory.buf[offset:offset + column_size] = \
+                numpy.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes()
+            offset += column_size
+
+        return shared_memory
+
+    # write the columns to a binary cache file, replacing the file atomically so concurrent readers never see a
+    # partial write
+    def write_cache(self, cache_file, source_file, csv_datetime_format, source_hash=None):
+        source_stat = os.stat(source_file)
+        header = TICK_CACHE_HEADER.pack(
+            TICK_CACHE_MAGIC,
+            TICK_CACHE_VERSION,
+            len(self),
+            source_stat.st_size,
+            source_stat.st_mtime_ns,
+            source_hash or file_sha256(source_file),
+            encode_datetime_format(csv_datetime_format)
+        )
+
+        write_file_atomically(cache_file, [header.ljust(TICK_CACHE_HEADER_SIZE, b'\x00')] + [
+            numpy.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes() for name, dtype in TICK_CACHE_COLUMNS
+        ])
+
+
+# Sparse table over the low and high columns, answering the lowest low or highest high of any range of minutes with
+# two lookups. Level k holds the extremes of every run of 2^k minutes; levels are only built once a range long enough
+# to need them is queried, so coarse ticks of a few minutes only add a few columns' worth of memory.
+class RangeIndex:
+    def __init__(self, lows, highs):
+        self.lows = [lows]
+        self.highs = [highs]
+
+    # the level covering at least half of a range of the given length, building levels as needed
+    def _level(self, length):
+        level = int(length).bit_length() - 1
+        while len(self.lows) <= level:
+            width = 1 << (len(self.lows) - 1)
+            self.lows.append(numpy.minimum(self.lows[-1][:-width], self.lows[-1][width:]))
+            self.highs.append(numpy.maximum(self.highs[-1][:-width], self.highs[-1][width:]))
+
+        return level
+
+    # lowest low of the minutes in [start, end)
+    def lowest(self, start, end):
+        level = self._level(end - start)
+        lows = self.lows[level]
+        return min(lows.item(start), lows.item(end - (1 << level)))
+
+    # highest high of the minutes in [start, end)
+    def highest(self, start, end):
+        level = self._level(end - start)
+        highs = self.highs[level]
+        return max(highs.item(start), highs.item(end - (1 << level)))
+
+    # lowest low of the runs of the given length beginning at each of the starts
+    def lowest_of_runs(self, starts, length):
+        level = self._level(length)
+        lows = self.lows[level]
+        return numpy.minimum(lows[starts], lows[starts + length - (1 << level)])
+
+    # highest high of the runs of the given length beginning at each of the starts
+    def highest_of_runs(self, starts, length):
+        level = self._level(length)
+        highs = self.highs[level]
+        return numpy.maximum(highs[starts], highs[starts + length - (1 << level)])
+
+
+# Integer levels of prices on a log-space grid with the given ratio between levels: level k covers the prices from
+# ratio^k up to ratio^(k + 1). Computed logarithms can be off by a tiny fraction of a level, so two prices are only
+# known to be ordered when their levels are more than one apart; comparing levels is a conservative prefilter in front
+# of comparing the prices themselves.
+class PriceGrid:
+    def __init__(self, ratio, lows, highs, low_multiplier=1, high_multiplier=1):
+        self.log_ratio = math.log(ratio)
+        self.multipliers = (low_multiplier, high_multiplier)
+        self.low_levels = self.levels(lows * low_multiplier)
+        self.high_levels = self.levels(highs * high_multiplier)
+
+    def levels(self, prices):
+        return numpy.floor(numpy.log(numpy.maximum(prices, PRICE_GRID_MINIMUM)) / self.log_ratio).astype(numpy.int64)
+
+    def level(self, price):
+        return math.floor(math.log(max(price, PRICE_GRID_MINIMUM)) / self.log_ratio)
+
+
+# the datetime format as stored in a tick cache header, formats too long to fit are rejected rather than truncated
+def encode_datetime_format(datetime_format):
+    encoded = datetime_format.encode()
+    if len(encoded) > TICK_CACHE_MAX_DATETIME_FORMAT:
+        raise Exception('Datetime format is too long for the tick cache, must be at most {} bytes: {}'.format(
+            TICK_CACHE_MAX_DATETIME_FORMAT, datetime_format))
+
+    return encoded
+
+
+# parse the header of a tick cache, returns the unpacked header fields after the magic value
+def read_cache_header(buffer):
+    magic, version, rows, source_size, source_mtime_ns, source_hash, datetime_format = \
+        TICK_CACHE_HEADER.unpack_from(buffer)
+    if magic != TICK_CACHE_MAGIC or version != TICK_CACHE_VERSION:
+        raise Exception('Unrecognized tick cache format')
+
+    return version, rows, source_size, source_mtime_ns, source_hash, datetime_format.rstrip(b'\x00').decode()
+
+
+# check whether a cache file was converted from the current contents of the source file; size and modified time are
+# checked first so the source only needs to be hashed if it has been touched since the conversion, and if the hash
+# still matches, the cache is updated with the new modified time so it isn't hashed again next time
+def tick_cache_is_current(cache_file, source_file, csv_datetime_format):
+    if not os.path.exists(cache_file):
+        return False
+
+    with open(cache_file, 'rb') as file:
+        try:
+            version, rows, source_size, source_mtime_ns, source_hash, datetime_format = \
+                read_cache_header(file.read(TICK_CACHE_HEADER.size))
+        except Exception:
+            return False
+
+    if datetime_format != csv_datetime_format:
+        return False
+
+    source_stat = os.stat(source_file)
+    if source_stat.st_size != source_size:
+        return False
+
+    if source_stat.st_mtime_ns == source_mtime_ns:
+        return True
+
+    if file_sha256(source_file) != source_hash:
+        return False
+
+    # best effort, the cache is still current if it can't be updated (e.g. it's read-only)
+    try:
+        with open(cache_file, 'r+b') as file:
+            file.seek(TICK_CACHE_SOURCE_STAT_OFFSET)
+            file.write(TICK_CACHE_SOURCE_STAT.pack(source_stat.st_size, source_stat.st_mtime_ns))
+    except OSError:
+        pass
+
+    return True
+
+
+# one-time conversion of a CSV file into a memory-mappable tick cache, returns the path of the cache file
+def convert_csv(csv_file, csv_datetime_format, cache_file=None):
+    cache_file = cache_file or csv_file + TICK_CACHE_EXTENSION
+    TickData.from_csv(csv_file, csv_datetime_format).write_cache(cache_file, csv_file, csv_datetime_format)
+
+    return cache_file
+
+
+# Lazily reads quotes from a list of CSV files, or a glob pattern matching them (read in sorted order), that together
+# form one continuous series. Files may be compressed (see open_csv), and are parsed in chunks of up to chunk_size rows
+# so only one chunk needs to be held in memory at a time.
+class TickStream:
+    def __init__(self, csv_files, csv_datetime_format, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+        self.csv_files = sorted(glob(csv_files)) if isinstance(csv_files, str) else list(csv_files)
+        self.csv_datetime_format = csv_datetime_format
+        self.chunk_size = chunk_size
+
+    # yield (minute index of the first row, TickData) for each chunk, starting from start_minute; earlier rows are
+    # skipped over without being parsed
+    def chunks(self, start_minute=0):
+        minute_index = 0
+        for csv_file in self.csv_files:
+            with open_csv(csv_file) as file:
+                heading_line = next(file, None)
+                if heading_line is None:
+                    continue
+
+                headings = next(csv.reader([heading_line]))
+                while minute_index < start_minute:
+                    line = next(file, None)
+                    if line is None:
+                        break
+                    if line.strip():
+                        minute_index += 1
+
+                if minute_index < start_minute:
+                    continue
+
+                reader = csv.reader(file)
+                while True:
+                    chunk = TickData.from_rows(reader, headings, self.csv_datetime_format, self.chunk_size)
+                    if not len(chunk):
+                        break
+
+                    yield minute_index, chunk
+                    minute_index += len(chunk)
@@ -0,0 +1,166 @@
+import os
+import random
+import statistics
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from giant_dipper import Sweep
+from giant_dipper.Backtest import Backtest
+
+
+class TrialState:
+    RUNNING = 'running'
+    PRUNED = 'pruned'
+    COMPLETE = 'complete'
+
+
+# a configuration being searched: the objective values reported every report_ticks ticks, and its final metrics once
+# it's complete
+class Trial:
+    def __init__(self, number, config):
+        self.number = number
+        self.config = config
+        self.reports = []
+        self.metrics = None
+        self.state = TrialState.RUNNING
+
+
+# default objective, the account value change percent from BaseStateManager.compute_metrics
+def account_value_change(metrics):
+    return metrics[2]
+
+
+# Prunes a trial when its latest report is below the median of the reports that completed trials made at the same
+# point. Nothing is pruned before warmup_reports reports, or until min_trials trials have completed.
+class MedianPruner:
+    def __init__(self, min_trials=5, warmup_reports=1):
+        self.min_trials = min_trials
+        self.warmup_reports = warmup_reports
+
+    def should_prune(self, trial, trials):
+        report = len(trial.reports) - 1
+        if report < self.warmup_reports:
+            return False
+
+        completed_reports = [other.reports[report] for other in trials
+                             if other.state == TrialState.COMPLETE and len(other.reports) > report]
+        if len(completed_reports) < self.min_trials:
+            return False
+
+        return trial.reports[report] < statistics.median(completed_reports)
+
+
+# Asynchronous successive halving: rungs are placed at min_reports reports, then every reduction_factor times as many.
+# A trial reaching a rung continues only if its report there is in the top 1 / reduction_factor of the reports every
+# trial made at that rung so far.
+class SuccessiveHalvingPruner:
+    def __init__(self, reduction_factor=3, min_reports=1):
+        # rungs have to grow from at least 1 report, otherwise is_rung never reaches a trial's report count
+        if min_reports < 1:
+            raise ValueError('min_reports must be at least 1, got {}'.format(min_reports))
+        if reduction_factor <= 1:
+            raise ValueError('reduction_factor must be greater than 1, got {}'.format(reduction_factor))
+
+        self.reduction_factor = reduction_factor
+        self.min_reports = min_reports
+
+    def is_rung(self, reports):
+        rung = self.min_reports
+        while rung < reports:
+            rung *= self.reduction_factor
+
+        return rung == reports
+
+    def should_prune(self, trial, trials):
+        reports = len(trial.reports)
+        if not self.is_rung(reports):
+            return False
+
+        rung_reports = sorted((other.reports[reports - 1] for other in trials if len(other.reports) >= reports),
+                              reverse=True)
+        if len(rung_reports) < self.reduction_factor:
+            return False
+
+        return trial.reports[-1] < rung_reports[len(rung_reports) // self.reduction_factor - 1]
+
+
+# Random configurations from a search space, a dict of order_manager configuration values to either a list of values
+# to choose from, or a (low, high) range that's sampled uniformly (as integers if both ends are integers). Values
+# that aren't lists or ranges are used as is.
+def sample_configs(search_space, count, seed=None):
+    generator = random.Random(seed)
+    for i in range(count):
+        config = {}
+        for name, values in search_space.items():
+            if isinstance(values, list):
+                config[name] = generator.choice(values)
+            elif isinstance(values, tuple):
+                low, high = values
+                config[name] = generator.randint(low, high) if isinstance(low, int) and isinstance(high, int) \
+                    else generator.uniform(low, high)
+            else:
+                config[name] = values
+
+        yield config
+
+
+# advance a trial's backtest by report_ticks ticks in a worker process, starting it if there's no checkpoint yet;
+# returns a checkpoint to continue from (None once the data runs out) and the metrics so far
+def advance_worker_trial(checkpoint, order_manager_config, report_ticks, minute_increments, cash_holdings_percentage,
+                         csv_datetime_format, start_minute):
+    if checkpoint is None:
+        backtest = Sweep.new_backtest(Sweep.worker_tick_data, order_manager_config, minute_increments,
+                                      cash_holdings_percentage, csv_datetime_format, start_minute)
+    else:
+        backtest = Backtest.from_checkpoint(checkpoint, Sweep.worker_tick_data)
+
+    more_data = backtest.advance(report_ticks)
+    return backtest.checkpoint() if more_data else None, backtest.state_manager.compute_metrics()
+
+
+# Search over order_manager configurations across a pool of worker processes (see Sweep.worker_pool), with early
+# pruning of losing trials.
+#
+# Each trial's backtest runs report_ticks ticks at a time. After each, the objective of its compute_metrics() values
+# is reported and, if a pruner is provided (MedianPruner or SuccessiveHalvingPruner), the trial is stopped there if
+# the pruner judges it hopeless compared to the others. Between reports, trials are handed between workers as
+# checkpoints. Complete trials have the same metrics as running their configurations to the end.
+#
+# Yields each Trial once it's complete or pruned. Trials are started in the order of order_manager_configs, which can
+# be a generator such as sample_configs; with processes=1 the search is deterministic.
+def search(tick_data, order_manager_configs, report_ticks, pruner=None, objective=account_value_change,
+           minute_increments=1, cash_holdings_percentage=0.5, csv_datetime_format='%Y-%m-%d %H:%M:%S', start_minute=0,
+           processes=None):
+    configs = iter(order_manager_configs)
+    trials = []
+    running = {}
+    with Sweep.worker_pool(tick_data, processes) as executor:
+        def submit(trial, checkpoint):
+            running[executor.submit(advance_worker_trial, checkpoint, trial.config, report_ticks, minute_increments,
+                                    cash_holdings_percentage, csv_datetime_format, start_minute)] = trial
+
+        def start_next_trial():
+            config = next(configs, None)
+            if config is not None:
+                trials.append(Trial(len(trials), config))
+                submit(trials[-1], None)
+
+        for i in range(processes or os.cpu_count()):
+            start_next_trial()
+
+        while running:
+            done, not_done = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial = running.pop(future)
+                checkpoint, metrics = future.result()
+                trial.reports.append(objective(metrics))
+                if checkpoint is None:
+                    trial.metrics = metrics
+                    trial.state = TrialState.COMPLETE
+                elif pruner is not None and pruner.should_prune(trial, trials):
+                    trial.state = TrialState.PRUNED
+
+                if trial.state == TrialState.RUNNING:
+                    submit(trial, checkpoint)
+                else:
+                    yield trial
+                    start_next_trial()
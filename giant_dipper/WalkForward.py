@@ -0,0 +1,110 @@
+import math
+from concurrent.futures import as_completed
+
+from giant_dipper import Sweep
+from giant_dipper.Tuning import account_value_change
+
+
+# one step of a walk-forward evaluation: configurations are compared over the training minutes
+# [train_start, train_end), and the best is then tested over the following minutes [test_start, test_end)
+class Segment:
+    def __init__(self, train_start, train_end, test_start, test_end):
+        self.train_start = train_start
+        self.train_end = train_end
+        self.test_start = test_start
+        self.test_end = test_end
+
+    def __eq__(self, other):
+        return vars(self) == vars(other)
+
+    def __repr__(self):
+        return 'Segment({train_start}, {train_end}, {test_start}, {test_end})'.format(**vars(self))
+
+
+# consecutive segments over the minutes [start_minute, end_minute): training windows of train_minutes, each followed
+# by a test window of test_minutes, moving forward by step_minutes (test_minutes by default) until the data runs out
+def walk_forward_segments(end_minute, train_minutes, test_minutes, start_minute=0, step_minutes=None):
+    segments = []
+    train_start = start_minute
+    while train_start + train_minutes + test_minutes <= end_minute:
+        train_end = train_start + train_minutes
+        segments.append(Segment(train_start, train_end, train_end, train_end + test_minutes))
+        train_start += step_minutes or test_minutes
+
+    return segments
+
+
+# metrics of a configuration over the minutes [start_minute, end_minute) in a worker process; the backtest starts up
+# to warmup_minutes earlier, so orders and rebalance tracking are established, but only changes in the account after
+# start_minute are measured (see BaseStateManager.compute_metrics_since)
+def run_worker_window(order_manager_config, start_minute, end_minute, warmup_minutes, minute_increments,
+                      cash_holdings_percentage, csv_datetime_format):
+    warmup_start = max(start_minute - warmup_minutes, 0)
+    backtest = Sweep.new_backtest(Sweep.worker_tick_data, order_manager_config, minute_increments,
+                                  cash_holdings_percentage, csv_datetime_format, warmup_start, end_minute)
+    backtest.advance(math.ceil((start_minute - warmup_start) / minute_increments))
+    baseline_account_values = backtest.state_manager.account_values()
+    backtest.run(event_driven=True)
+
+    return backtest.state_manager.compute_metrics_since(baseline_account_values)
+
+
+# Walk-forward evaluation of order_manager configurations over the given segments (see walk_forward_segments). Every
+# configuration is backtested on every training and test window, all concurrently across a pool of worker processes
+# (see Sweep.worker_pool), each window warmed up over the warmup_minutes before it.
+#
+# For each segment, the configuration with the best objective over the training window is selected, and its metrics
+# over the test window are its out-of-sample result. Returns a dict of:
+# * "segments" - for each segment, a dict of the "segment", the "train" and "test" metrics of every configuration, and
+#   the index of the "selected" configuration
+# * "configs" - for each configuration, a dict of the "config", its "test" metrics over every segment, the number of
+#   times it was "selected", and its account value changes over the test windows compounded into "compounded_change"
+# * "compounded_change" - the account value changes of the selected configurations over their test windows compounded
+def walk_forward(tick_data, order_manager_configs, segments, warmup_minutes=0, objective=account_value_change,
+                 minute_increments=1, cash_holdings_percentage=0.5, csv_datetime_format='%Y-%m-%d %H:%M:%S',
+                 processes=None):
+    metrics = {}
+    with Sweep.worker_pool(tick_data, processes) as executor:
+        futures = {}
+        for segment_index, segment in enumerate(segments):
+            for config_index, config in enumerate(order_manager_configs):
+                for window, start_minute, end_minute in [('train', segment.train_start, segment.train_end),
+                                                         ('test', segment.test_start, segment.test_end)]:
+                    futures[executor.submit(run_worker_window, config, start_minute, end_minute, warmup_minutes,
+                                            minute_increments, cash_holdings_percentage, csv_datetime_format)] = \
+                        (segment_index, config_index, window)
+
+        for future in as_completed(futures):
+            metrics[futures[future]] = future.result()
+
+    segment_results = []
+    compounded_change = 1
+    for segment_index, segment in enumerate(segments):
+        train_metrics = [metrics[(segment_index, config_index, 'train')]
+                         for config_index in range(len(order_manager_configs))]
+        test_metrics = [metrics[(segment_index, config_index, 'test')]
+                        for config_index in range(len(order_manager_configs))]
+        selected = max(range(len(order_manager_configs)), key=lambda index: objective(train_metrics[index]))
+        compounded_change *= account_value_change(test_metrics[selected])
+        segment_results.append({
+            'segment': segment,
+            'train': train_metrics,
+            'test': test_metrics,
+            'selected': selected
+        })
+
+    config_results = []
+    for config_index, config in enumerate(order_manager_configs):
+        test_metrics = [segment_result['test'][config_index] for segment_result in segment_results]
+        config_results.append({
+            'config': config,
+            'test': test_metrics,
+            'selected': sum(segment_result['selected'] == config_index for segment_result in segment_results),
+            'compounded_change': math.prod(account_value_change(segment_metrics) for segment_metrics in test_metrics)
+        })
+
+    return {
+        'segments': segment_results,
+        'configs': config_results,
+        'compounded_change': compounded_change
+    }
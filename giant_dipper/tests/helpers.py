@@ -0,0 +1,51 @@
+import numpy
+
+from giant_dipper.OrderManager import OrderManager
+from giant_dipper.OrderServices import CSVFileOrderService
+from giant_dipper.TickData import TickData
+
+# fixtures shared by the tests: configs, random quote data and order managers backtesting over it
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+TEST_CONFIGS = [
+    {'price_increment_ratio': 1.02, 'order_holdings_threshold': 0.2, 'quantity_threshold_ratio': 1.5,
+     'rebalance_interval': 60, 'rebalance_threshold': 0.5},
+    {'price_increment_ratio': 1.01, 'order_holdings_threshold': 0.3, 'quantity_threshold_ratio': 2,
+     'window_duration': 30, 'window_factor': 0.7},
+    {'price_increment_ratio': 1.03, 'order_holdings_threshold': 0.5, 'quantity_threshold_ratio': 1.2,
+     'rebalance_interval': 30},
+    {'price_increment_ratio': 1.05, 'order_holdings_threshold': 0.2, 'quantity_threshold_ratio': 1.5,
+     'rebalance_interval': 100, 'rebalance_threshold': 0.3, 'window_duration': 20}
+]
+
+
+# random walk of minute quotes, rounded like real quote data
+def random_tick_data(minutes, seed=1, volatility=0.003):
+    random = numpy.random.default_rng(seed)
+    opens = 0.07 * numpy.exp(numpy.cumsum(random.normal(0, volatility, minutes)))
+    closes = numpy.append(opens[1:], opens[-1])
+    highs = numpy.maximum(opens, closes) * (1 + numpy.abs(random.normal(0, volatility / 2, minutes)))
+    lows = numpy.minimum(opens, closes) * (1 - numpy.abs(random.normal(0, volatility / 2, minutes)))
+
+    return TickData(
+        timestamps=1609459200 + 60 * numpy.arange(minutes, dtype=numpy.int64),
+        opens=numpy.round(opens, 6),
+        lows=numpy.round(lows, 6),
+        highs=numpy.round(highs, 6)
+    )
+
+
+TEST_TICK_DATA = random_tick_data(20000)
+
+
+def order_manager(config, state_manager, minute_increments=1, tick_data=None, start_minute=0, tick_stream=None,
+                  price_grid_ratio=None, end_minute=None):
+    return OrderManager.from_config(
+        order_service=CSVFileOrderService(None, minute_increments, 0.5, DATETIME_FORMAT, start_minute=start_minute,
+                                          tick_data=tick_data or TEST_TICK_DATA, tick_stream=tick_stream,
+                                          price_grid_ratio=price_grid_ratio, end_minute=end_minute),
+        state_manager=state_manager,
+        order_manager_config=config,
+        silent=True
+    )
@@ -0,0 +1,56 @@
+import asyncio
+from unittest import TestCase
+
+from giant_dipper.AsyncOrderServices import AsyncLocalOrderService
+from giant_dipper.Backtest import Backtest
+from giant_dipper.OrderManager import run_order_managers
+from giant_dipper.StateManagers import InMemoryStateManager
+from giant_dipper.tests.helpers import TEST_CONFIGS, TEST_TICK_DATA, order_manager
+
+
+# order manager over the test quotes, through an async order service
+def async_order_manager(config, minutes):
+    om = order_manager(config, InMemoryStateManager(), tick_data=TEST_TICK_DATA.head(minutes))
+    om.order_service = AsyncLocalOrderService(om.order_service)
+
+    return om
+
+
+# run all the order managers at every tick until their quotes run out, as Backtest.run does one at a time
+async def run_to_end(order_managers):
+    while True:
+        failures = await run_order_managers(order_managers)
+        for failure in failures:
+            if failure is not None:
+                raise failure
+
+        if not all([om.order_service.order_service.tick() for om in order_managers]):
+            return
+
+
+class AsyncOrderServicesTest(TestCase):
+    def test_run_async(self):
+        for replace_after_cancel in [False, True]:
+            async_order_managers = [async_order_manager(config, 5000) for config in TEST_CONFIGS]
+            for async_om in async_order_managers:
+                async_om.replace_after_cancel = replace_after_cancel
+            asyncio.run(run_to_end(async_order_managers))
+
+            for config, async_om in zip(TEST_CONFIGS, async_order_managers):
+                sync_om = order_manager(config, InMemoryStateManager(), tick_data=TEST_TICK_DATA.head(5000))
+                sync_om.replace_after_cancel = replace_after_cancel
+                Backtest(sync_om).run()
+
+                self.assertEqual(sync_om.state_manager.compute_metrics(), async_om.state_manager.compute_metrics())
+                self.assertEqual(sync_om.state_manager.open_orders, async_om.state_manager.open_orders)
+
+    def test_run_order_managers_failure(self):
+        failing_om = async_order_manager(TEST_CONFIGS[0], 100)
+        failing_om.order_service.order_service.holdings = None
+        om = async_order_manager(TEST_CONFIGS[1], 100)
+
+        # one order manager failing doesn't stop the others
+        failures = asyncio.run(run_order_managers([failing_om, om]))
+        self.assertIsInstance(failures[0], Exception)
+        self.assertIsNone(failures[1])
+        self.assertEqual(2, len(om.state_manager.open_orders))
@@ -0,0 +1,180 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from giant_dipper.Backtest import Backtest, BatchBacktest
+from giant_dipper.RebalanceEstimators import REBALANCE_ESTIMATORS
+from giant_dipper.StateManagers import GraphingStateManager, InMemoryStateManager
+from giant_dipper.TickData import TickStream, format_epoch_seconds
+from giant_dipper.tests.helpers import DATETIME_FORMAT, TEST_CONFIGS, TEST_TICK_DATA, order_manager, random_tick_data
+
+
+class BacktestTest(TestCase):
+    def __assert_same_results__(self, config, minute_increments=1, state_manager_class=InMemoryStateManager):
+        per_tick = order_manager(config, state_manager_class(), minute_increments)
+        event_driven = order_manager(config, state_manager_class(), minute_increments)
+
+        self.assertEqual(Backtest(per_tick).run(), Backtest(event_driven).run(event_driven=True))
+        self.assertEqual(per_tick.state_manager.metrics, event_driven.state_manager.metrics)
+        self.assertEqual(per_tick.state_manager.open_orders, event_driven.state_manager.open_orders)
+        self.assertEqual(per_tick.state_manager.terminal_quantity, event_driven.state_manager.terminal_quantity)
+        self.assertEqual(per_tick.order_service.holdings, event_driven.order_service.holdings)
+        self.assertEqual(per_tick.order_service.buying_power, event_driven.order_service.buying_power)
+        self.assertEqual(per_tick.order_service.minute_index, event_driven.order_service.minute_index)
+
+        return per_tick, event_driven
+
+    def test_event_driven_matches_per_tick(self):
+        for config in TEST_CONFIGS:
+            for minute_increments in [1, 7]:
+                self.__assert_same_results__(config, minute_increments)
+
+    def test_event_driven_graphing(self):
+        per_tick, event_driven = self.__assert_same_results__(TEST_CONFIGS[0],
+                                                              state_manager_class=GraphingStateManager)
+        self.assertEqual(per_tick.state_manager.all_tick_data, event_driven.state_manager.all_tick_data)
+
+    def test_price_grid_matches_exact(self):
+        for config in TEST_CONFIGS:
+            for minute_increments in [1, 7]:
+                exact = order_manager(config, InMemoryStateManager(), minute_increments)
+                gridded = order_manager(config, InMemoryStateManager(), minute_increments,
+                                        price_grid_ratio=config['price_increment_ratio'])
+
+                self.assertEqual(Backtest(exact).run(), Backtest(gridded).run())
+                self.assertEqual(exact.state_manager.metrics, gridded.state_manager.metrics)
+                self.assertEqual(exact.order_service.holdings, gridded.order_service.holdings)
+
+    def test_quiet_ticks_skipped(self):
+        # quiet data with orders far from the price, only the first run and the final tick should be needed
+        om = order_manager({'price_increment_ratio': 1.5, 'order_holdings_threshold': 0.2,
+                            'quantity_threshold_ratio': 1.5}, InMemoryStateManager(),
+                           tick_data=random_tick_data(5000, volatility=0.0001))
+        backtest = Backtest(om)
+        om.run()
+        self.assertEqual(4999, backtest.skip_quiet_ticks())
+        self.assertFalse(om.order_service.tick())
+        self.assertEqual(4999, om.state_manager.metrics['ticks_from_start'])
+
+    def test_batch_matches_single(self):
+        # a rebalance estimate is run through its own Backtest, the rest together
+        configs = TEST_CONFIGS + [dict(TEST_CONFIGS[0], rebalance_estimator=REBALANCE_ESTIMATORS[0]),
+                                  dict(TEST_CONFIGS[0], rebalance_threshold=None),
+                                  dict(TEST_CONFIGS[1], price_increment_ratio=1.003)]
+        for minute_increments in [1, 7]:
+            for block_ticks, min_batch in [(8, 1), (64, 4)]:
+                singles = [order_manager(config, InMemoryStateManager(), minute_increments) for config in configs]
+                single_results = [Backtest(single).run(event_driven=True) for single in singles]
+
+                batched = [order_manager(config, InMemoryStateManager(), minute_increments) for config in configs]
+                self.assertEqual(single_results, BatchBacktest(batched, block_ticks, min_batch).run())
+                for single, batch in zip(singles, batched):
+                    self.assertEqual(single.state_manager.metrics, batch.state_manager.metrics)
+                    self.assertEqual(single.state_manager.open_orders, batch.state_manager.open_orders)
+                    self.assertEqual(single.state_manager.terminal_quantity, batch.state_manager.terminal_quantity)
+                    self.assertEqual(single.order_service.holdings, batch.order_service.holdings)
+                    self.assertEqual(single.order_service.minute_index, batch.order_service.minute_index)
+
+        with self.assertRaises(Exception):
+            BatchBacktest([order_manager(TEST_CONFIGS[0], InMemoryStateManager()),
+                           order_manager(TEST_CONFIGS[1], InMemoryStateManager(), start_minute=10)])
+
+    def test_rebalance_estimator(self):
+        for estimator in REBALANCE_ESTIMATORS:
+            configs = [dict(config, rebalance_estimator=estimator) for config in [TEST_CONFIGS[0], TEST_CONFIGS[3]]]
+            for config in configs:
+                for minute_increments in [1, 7]:
+                    per_tick, event_driven = self.__assert_same_results__(config, minute_increments)
+                    self.assertEqual(estimator, per_tick.state_manager.metrics['rebalance_estimate']['estimator'])
+                    self.assertNotIn('rebalance', per_tick.state_manager.metrics)
+
+                # rebalances happen sooner than when waiting for rebalance_interval prices after the threshold
+                without_estimator = {name: value for name, value in config.items() if name != 'rebalance_estimator'}
+                self.assertNotEqual(Backtest(order_manager(without_estimator, InMemoryStateManager())).run(),
+                                    Backtest(order_manager(config, InMemoryStateManager())).run())
+
+    def test_end_minute(self):
+        for minute_increments in [1, 7]:
+            for event_driven in [False, True]:
+                bounded = order_manager(TEST_CONFIGS[0], InMemoryStateManager(), minute_increments, start_minute=100,
+                                        end_minute=5000)
+                head = order_manager(TEST_CONFIGS[0], InMemoryStateManager(), minute_increments, start_minute=100,
+                                     tick_data=TEST_TICK_DATA.head(5000))
+
+                self.assertEqual(Backtest(head).run(event_driven), Backtest(bounded).run(event_driven))
+                self.assertEqual(head.order_service.minute_index, bounded.order_service.minute_index)
+
+    def test_checkpoint_resume(self):
+        for config in TEST_CONFIGS:
+            for event_driven in [False, True]:
+                uninterrupted = order_manager(config, GraphingStateManager(), 7)
+                expected = Backtest(uninterrupted).run(event_driven)
+
+                backtest = Backtest(order_manager(config, GraphingStateManager(), 7))
+                backtest.advance(1000)
+                checkpoint = backtest.checkpoint()
+                self.assertLess(len(checkpoint), 2000 * 50)
+
+                # the original and any number of restored copies finish identically and independently
+                resumed = [Backtest.from_checkpoint(checkpoint, TEST_TICK_DATA) for i in range(2)] + [backtest.fork()]
+                resumed[0].order_manager.rebalance_threshold = 0.01
+                for copy in [backtest] + resumed[1:]:
+                    self.assertEqual(expected, copy.run(event_driven))
+                    self.assertEqual(uninterrupted.state_manager.metrics, copy.state_manager.metrics)
+                    self.assertEqual(uninterrupted.state_manager.all_tick_data, copy.state_manager.all_tick_data)
+                    self.assertEqual(uninterrupted.order_service.minute_index, copy.order_service.minute_index)
+
+    def test_checkpoint_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_file = os.path.join(directory, 'backtest.checkpoint')
+            expected = Backtest(order_manager(TEST_CONFIGS[1], InMemoryStateManager())).run()
+
+            backtest = Backtest(order_manager(TEST_CONFIGS[1], InMemoryStateManager()))
+            backtest.advance(5000)
+            backtest.save_checkpoint(checkpoint_file)
+            self.assertEqual(['backtest.checkpoint'], os.listdir(directory))
+            self.assertEqual(expected, Backtest.load_checkpoint(checkpoint_file, TEST_TICK_DATA).run())
+
+            # quotes aren't part of the checkpoint
+            with self.assertRaises(Exception):
+                Backtest.load_checkpoint(checkpoint_file)
+
+    def test_streamed_matches_loaded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_file = os.path.join(directory, 'ticks.csv')
+            with open(csv_file, 'w') as file:
+                file.write('date,open,high,low\n')
+                for index in range(len(TEST_TICK_DATA)):
+                    file.write('{},{},{},{}\n'.format(
+                        format_epoch_seconds(TEST_TICK_DATA.timestamps[index], DATETIME_FORMAT),
+                        repr(TEST_TICK_DATA.open[index].item()),
+                        repr(TEST_TICK_DATA.high[index].item()),
+                        repr(TEST_TICK_DATA.low[index].item())
+                    ))
+
+            # with a price grid, a tick's minutes are checked a chunk at a time
+            for minute_increments, price_grid_ratio in [(1, None), (7, None), (7, 1.02)]:
+                for event_driven in [False, True]:
+                    loaded = order_manager(TEST_CONFIGS[0], InMemoryStateManager(), minute_increments,
+                                           start_minute=10)
+                    streamed = order_manager(TEST_CONFIGS[0], InMemoryStateManager(), minute_increments,
+                                             start_minute=10, price_grid_ratio=price_grid_ratio,
+                                             tick_stream=TickStream(csv_file, DATETIME_FORMAT, chunk_size=999))
+
+                    self.assertEqual(Backtest(loaded).run(event_driven), Backtest(streamed).run(event_driven))
+                    self.assertEqual(loaded.state_manager.metrics, streamed.state_manager.metrics)
+                    self.assertEqual(loaded.order_service.minute_index, streamed.order_service.minute_index)
+
+            # streams stop at end_minute
+            bounded = order_manager(TEST_CONFIGS[0], InMemoryStateManager(), end_minute=4321,
+                                    tick_stream=TickStream(csv_file, DATETIME_FORMAT, chunk_size=999))
+            self.assertEqual(Backtest(order_manager(TEST_CONFIGS[0], InMemoryStateManager(),
+                                                    tick_data=TEST_TICK_DATA.head(4321))).run(),
+                             Backtest(bounded).run())
+
+            # streams are reopened where a checkpoint left off
+            backtest = Backtest(order_manager(TEST_CONFIGS[0], InMemoryStateManager(),
+                                              tick_stream=TickStream(csv_file, DATETIME_FORMAT, chunk_size=999)))
+            backtest.advance(1234)
+            self.assertEqual(Backtest(order_manager(TEST_CONFIGS[0], InMemoryStateManager())).run(),
+                             Backtest.from_checkpoint(backtest.checkpoint()).run())
@@ -0,0 +1,204 @@
+import asyncio
+import os
+import tempfile
+from unittest import TestCase
+
+from giant_dipper.AsyncOrderServices import AsyncLocalOrderService
+from giant_dipper.Backtest import Backtest
+from giant_dipper.Daemon import Daemon, DaemonTask, TickSchedule
+from giant_dipper.OrderSides import OrderSide
+from giant_dipper.StateManagers import FileStateManager, InMemoryStateManager
+from giant_dipper.tests.helpers import TEST_CONFIGS, order_manager
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+# stands in for a RobinHoodSession, counting its logins
+class FakeSession:
+    def __init__(self):
+        self.rejected = False
+        self.logins = 0
+
+    def ensure_logged_in(self):
+        if self.rejected:
+            self.rejected = False
+            self.logins += 1
+        return True
+
+    def take_auth_seconds(self):
+        return 0.0
+
+
+# moves a CSV service on to its next quote before every run but the first, stopping the daemon after the given number
+# of runs
+class TickingStore:
+    def __init__(self, order_service, daemon, runs):
+        self.order_service = order_service
+        self.daemon = daemon
+        self.runs = runs
+        self.refreshes = 0
+
+    def refresh(self):
+        self.order_service.tick()
+        self.refreshes += 1
+        if self.refreshes == self.runs - 1:
+            self.daemon.stop()
+
+    def state_data(self):
+        return None
+
+    def write_state(self, data):
+        pass
+
+
+# order manager over the test quotes through an async service, keeping its state in files in the given directory
+def load_order_manager(config, directory):
+    om = order_manager(config, FileStateManager(os.path.join(directory, 'orders.yml'),
+                                                os.path.join(directory, 'historical_orders.yml')))
+    om.order_service = AsyncLocalOrderService(om.order_service)
+
+    return om
+
+
+class DaemonTest(TestCase):
+    def test_tick_schedule(self):
+        clock = FakeClock(100)
+        schedule = TickSchedule(10, clock)
+
+        clock.now = 103
+        self.assertEqual((7, 0), schedule.next_tick())
+
+        # ticks stay on the schedule however long each takes
+        clock.now = 110.5
+        self.assertEqual((9.5, 0), schedule.next_tick())
+
+        # a tick that runs past the next ones skips to the latest that's due
+        clock.now = 145
+        self.assertEqual((0, 1), schedule.next_tick())
+        self.assertEqual(4, schedule.tick)
+
+        with self.assertRaises(Exception):
+            TickSchedule(0)
+
+    def test_run(self):
+        daemon = Daemon([], interval=0.001)
+        with tempfile.TemporaryDirectory() as directory:
+            om = load_order_manager(TEST_CONFIGS[1], directory)
+            ticking_store = TickingStore(om.order_service.order_service, daemon, 300)
+            daemon.tasks.append(DaemonTask(lambda: (om, [om.state_manager, ticking_store])))
+            asyncio.run(daemon.run())
+
+            backtest_om = order_manager(TEST_CONFIGS[1], InMemoryStateManager(), end_minute=300)
+            Backtest(backtest_om).run()
+            self.assertEqual(backtest_om.state_manager.compute_metrics(), om.state_manager.compute_metrics())
+
+            # the state files are written after the last tick
+            saved_state = FileStateManager(os.path.join(directory, 'orders.yml'),
+                                           os.path.join(directory, 'historical_orders.yml'))
+            self.assertEqual(om.state_manager.open_orders, saved_state.open_orders)
+            self.assertEqual(om.state_manager.metrics, saved_state.metrics)
+
+    def test_reload_after_failure(self):
+        with tempfile.TemporaryDirectory() as directory:
+            loaded = []
+
+            # the order service stands in for the brokerage, which keeps its orders when the order manager is reloaded
+            def load():
+                loaded.append(load_order_manager(TEST_CONFIGS[0], directory))
+                if len(loaded) > 1:
+                    loaded[-1].order_service = loaded[0].order_service
+                return loaded[-1], [loaded[-1].state_manager]
+
+            daemon = Daemon([DaemonTask(load)])
+            ticks = []
+
+            async def run_ticks():
+                failures = [await daemon.tick()]
+                ticks.append(loaded[0].state_manager.metrics['ticks_from_start'])
+                loaded[0].state_manager.metrics = None
+                failures.append(await daemon.tick())
+                failures.append(await daemon.tick())
+                await daemon.written()
+                return failures
+
+            failures = asyncio.run(run_ticks())
+            self.assertEqual([None], failures[0])
+            self.assertIsInstance(failures[1][0], Exception)
+            self.assertEqual([None], failures[2])
+
+            # loaded again from the state written after the first tick
+            self.assertEqual(2, len(loaded))
+            self.assertEqual(ticks[0] + 1, loaded[1].state_manager.metrics['ticks_from_start'])
+
+    def test_retry_after_rejected_token(self):
+        with tempfile.TemporaryDirectory() as directory:
+            session = FakeSession()
+            loaded = []
+
+            def load():
+                loaded.append(load_order_manager(TEST_CONFIGS[0], directory))
+                return loaded[-1], [loaded[-1].state_manager]
+
+            other_om = load_order_manager(TEST_CONFIGS[1], os.path.join(directory, 'other'))
+            daemon = Daemon([DaemonTask(load), DaemonTask(lambda: (other_om, []))], session=session)
+
+            # Robinhood rejects the token part way through the first run
+            async def rejected_quote():
+                session.rejected = True
+                raise Exception('401 Client Error: Unauthorized')
+
+            loaded[0].order_service.get_quote = rejected_quote
+
+            async def run_tick():
+                failures = await daemon.tick()
+                await daemon.written()
+                return failures
+
+            # logged in again, and run again from its files in the same tick; the others only run once
+            self.assertEqual([None, None], asyncio.run(run_tick()))
+            self.assertEqual(1, session.logins)
+            self.assertEqual(2, len(loaded))
+            self.assertEqual(0, other_om.state_manager.metrics['ticks_from_start'])
+            self.assertEqual(2, len(loaded[1].state_manager.open_orders))
+
+    def test_write_state_after_partial_failure(self):
+        with tempfile.TemporaryDirectory() as directory:
+            om = load_order_manager(dict(TEST_CONFIGS[0], replace_after_cancel=True), directory)
+            daemon = Daemon([DaemonTask(lambda: (om, [om.state_manager]))])
+
+            async def run_tick():
+                failures = await daemon.tick()
+                await daemon.written()
+                return failures
+
+            self.assertEqual([None], asyncio.run(run_tick()))
+            open_orders = dict(om.state_manager.open_orders)
+
+            # both orders are replaced, but the buy order's cancel fails
+            cancel_order = om.order_service.cancel_order
+
+            async def failing_cancel(order_id):
+                if order_id == open_orders[OrderSide.BUY].id:
+                    raise Exception('Cancel failed')
+                return await cancel_order(order_id)
+
+            om.order_service.cancel_order = failing_cancel
+            for order in open_orders.values():
+                order.force_replace = True
+
+            failures = asyncio.run(run_tick())
+            self.assertIsInstance(failures[0], Exception)
+
+            # the new sell order is written, the buy order is left to the next run
+            saved_state = FileStateManager(os.path.join(directory, 'orders.yml'),
+                                           os.path.join(directory, 'historical_orders.yml'))
+            self.assertNotEqual(open_orders[OrderSide.SELL].id, saved_state.open_orders[OrderSide.SELL].id)
+            self.assertEqual(om.state_manager.open_orders[OrderSide.SELL].id,
+                             saved_state.open_orders[OrderSide.SELL].id)
+            self.assertEqual(open_orders[OrderSide.BUY].id, saved_state.open_orders[OrderSide.BUY].id)
@@ -1,10 +1,15 @@
+import asyncio
 import math
+import random
+import time
 from unittest import TestCase
 
-from giant_dipper.OrderManager import OrderManager
+from giant_dipper.OrderManager import MAX_LADDER_STEPS, OrderManager
+from giant_dipper.Orders import Order
 from giant_dipper.OrderSides import OrderSide
 from giant_dipper.OrderStatuses import OrderStatus
 from giant_dipper.StateManagers import InMemoryStateManager
+from giant_dipper.tests.helpers import TEST_CONFIGS, order_manager as backtest_order_manager
 
 
 class FakeOrderService:
@@ -22,6 +27,40 @@ class FakeOrderService:
         return 1
 
 
+# async service whose every call waits until the given number of calls are waiting together, so they only return if
+# they're all awaited at once
+class GatheringOrderService:
+    def __init__(self, holdings, buying_power, parties):
+        self.order_service = FakeOrderService(holdings, buying_power)
+        self.parties = parties
+        self.arrived = 0
+        self.all_arrived = None
+
+    async def gathered(self, value):
+        # created on the running event loop
+        if self.all_arrived is None:
+            self.all_arrived = asyncio.Event()
+
+        self.arrived += 1
+        if self.arrived == self.parties:
+            self.all_arrived.set()
+        await self.all_arrived.wait()
+
+        return value
+
+    async def get_holdings(self):
+        return await self.gathered(self.order_service.get_holdings())
+
+    async def get_buying_power(self):
+        return await self.gathered(self.order_service.get_buying_power())
+
+    async def get_quote(self):
+        return await self.gathered(self.order_service.get_quote())
+
+    async def get_order_info(self, order_id):
+        return await self.gathered(Order(id=order_id, state=OrderStatus.OPEN))
+
+
 def order_manager(holdings=10000, buying_power=10000, order_holding_threshold=0.25, terminal_sell_quantity=None,
                   terminal_buy_quantity=None, window_duration=5):
     om = OrderManager(
@@ -43,21 +82,21 @@ def set_order_attributes(om, side, window_size=None, window_duration_remaining=N
                          rh_order_status=None):
     orders = om.state_manager.open_orders
     if not orders:
-        orders = {OrderSide.BUY: {}, OrderSide.SELL: {}}
+        orders = {OrderSide.BUY: Order(), OrderSide.SELL: Order()}
         om.state_manager.open_orders = orders
 
-    order = orders.get(side, {})
+    order = orders.get(side, Order())
     orders[side] = order
 
     if window_size:
-        order['window_size'] = window_size
+        order.window_size = window_size
     if window_duration_remaining:
-        order['window_duration_remaining'] = window_duration_remaining
+        order.window_duration_remaining = window_duration_remaining
     if force_replace:
-        order['force_replace'] = force_replace
+        order.force_replace = force_replace
     if rh_order_status:
-        om.rh_orders = om.rh_orders or {OrderSide.BUY: {}, OrderSide.SELL: {}}
-        om.rh_orders[side]['state'] = rh_order_status
+        om.rh_orders = om.rh_orders or {OrderSide.BUY: Order(), OrderSide.SELL: Order()}
+        om.rh_orders[side].state = rh_order_status
 
     return om
 
@@ -89,6 +128,24 @@ class OrderManagerTest(TestCase):
         self.__assert_applied_multiplier__(0.35048095, 0.64951905, 0.25, 1.5)
         self.__assert_applied_multiplier__(0.4375, 0.5625, 0.25, 2)
 
+    def test_ladder_step(self):
+        om = order_manager()
+        step = om.ladder_step(1.9)
+        self.assertIs(step, om.ladder_step(1.9))
+        self.assertEqual(pow(1.1, 1.9), step.price_ratios[OrderSide.SELL])
+        self.assertEqual(pow(1 / 1.1, 1.9), step.price_ratios[OrderSide.BUY])
+        self.assertEqual(om.apply_multiplier_to_ratio(0.1, 1.9)[0], step.order_ratio)
+        self.assertEqual(om.apply_multiplier_to_ratio(0.25, 1.9),
+                         (step.total_threshold, step.complementary_total_threshold))
+        self.assertEqual(om.apply_multiplier_to_ratio(0.25, 0.9)[0], step.stepped_down_total_threshold)
+        self.assertIsNone(om.ladder_step(1).stepped_down_total_threshold)
+
+        # the ladder stops growing once full, further steps are still computed
+        for window_size in range(MAX_LADDER_STEPS * 2):
+            om.ladder_step(om.multiplier_for_window(window_size))
+        self.assertEqual(MAX_LADDER_STEPS, len(om.ladder))
+        self.assertEqual(pow(1.1, 1000), om.ladder_step(1000).price_ratios[OrderSide.SELL])
+
     def test_total_holdings(self):
         self.assertEqual(20000, order_manager().total_holdings(1))
         self.assertEqual(30000, order_manager().total_holdings(0.5))
@@ -353,3 +410,123 @@ class OrderManagerTest(TestCase):
                                       base_price=base_price,
                                       window_size=0,
                                       window_duration=None)
+
+    def test_get_next_order_details_matches_iterative(self):
+        generator = random.Random(15)
+        for i in range(500):
+            side = generator.choice([OrderSide.BUY, OrderSide.SELL])
+            base_price = math.exp(generator.uniform(-3, 3))
+            window_size = generator.randint(0, 5)
+            holdings = generator.choice([0, 10, 10000])
+            buying_power = generator.choice([0, 10, 10000])
+            terminal_sell_quantity = generator.choice([None, 500])
+            terminal_buy_quantity = generator.choice([None, 500])
+
+            closed_form = order_manager(holdings, buying_power, terminal_sell_quantity=terminal_sell_quantity,
+                                        terminal_buy_quantity=terminal_buy_quantity)
+            iterative = order_manager(holdings, buying_power, terminal_sell_quantity=terminal_sell_quantity,
+                                      terminal_buy_quantity=terminal_buy_quantity)
+            self.assertEqual(iterative.get_next_order_details_iterative(side, base_price, window_size),
+                             closed_form.get_next_order_details(side, base_price, window_size))
+            self.assertEqual(vars(iterative.state_manager), vars(closed_form.state_manager))
+
+    def test_get_next_order_details_without_quantity(self):
+        # with nothing to sell, a sell far below the current price takes a single quantity calculation rather than one
+        # per window size stepped through
+        om = order_manager(holdings=0, terminal_sell_quantity=500)
+        quantity_calls = []
+        next_quantity = om.next_quantity
+        om.next_quantity = lambda *args: quantity_calls.append(args) or next_quantity(*args)
+
+        base_price, price, quantity, price_ratio, window_size = om.get_next_order_details(OrderSide.SELL, 0.001, 0)
+        self.assertEqual(0, quantity)
+        self.assertGreater(window_size, 10)
+        self.assertEqual(1, len(quantity_calls))
+        self.assertEqual(500, om.state_manager.terminal_quantity[OrderSide.SELL])
+
+    def test_get_next_order_details_without_price_increment(self):
+        # every window size gives the same price, as get_next_order_details_iterative finds
+        om = order_manager()
+        om.sell_ratio = om.buy_ratio = 1
+        for side in [OrderSide.BUY, OrderSide.SELL]:
+            self.assertEqual(om.get_next_order_details_iterative(side, 1, 2), om.get_next_order_details(side, 1, 2))
+            self.assertEqual(1, om.get_next_order_details(side, 1, 2)[1])
+
+    def test_async_fetch(self):
+        om = OrderManager(
+            order_service=GatheringOrderService(10, 20, 5),
+            state_manager=InMemoryStateManager(),
+            price_increment_ratio=1.1,
+            order_quantity_ratio=0.1,
+            order_holdings_threshold=0.25,
+            silent=True,
+            fetch_timeout=5
+        )
+        om.state_manager.open_orders = {OrderSide.SELL: Order(id=1), OrderSide.BUY: Order(id=2)}
+
+        # all five calls are waiting at once, otherwise the first would wait until the fetch times out
+        asyncio.run(om.cache_service_values_async())
+        self.assertLessEqual(om.service_values_as_of, time.time())
+        self.assertEqual((1, 10, 20), (om.current_price, om.current_holdings, om.current_buying_power))
+        self.assertEqual({OrderSide.SELL: Order(id=1, state=OrderStatus.OPEN),
+                          OrderSide.BUY: Order(id=2, state=OrderStatus.OPEN)}, om.rh_orders)
+
+        # only run_async can await an async service
+        with self.assertRaisesRegex(Exception, 'run_async'):
+            om.cache_service_values()
+
+        # a call short, so the calls wait until the fetch times out
+        om.order_service = GatheringOrderService(10, 20, 6)
+        om.fetch_timeout = 0.05
+        with self.assertRaisesRegex(Exception, 'Timed out'):
+            asyncio.run(om.cache_service_values_async())
+
+    def test_replace_after_cancel(self):
+        for replace_after_cancel in [False, True]:
+            om = backtest_order_manager(TEST_CONFIGS[1], InMemoryStateManager())
+            om.replace_after_cancel = replace_after_cancel
+            om.run()
+
+            open_order = om.state_manager.open_orders[OrderSide.BUY]
+            rh_order = om.rh_orders[OrderSide.BUY]
+            base_price = open_order.base_price * 0.99
+            om.place_order(OrderSide.BUY, base_price, open_order.price * 0.99, open_order.quantity, 0)
+
+            buy_order = om.state_manager.open_orders[OrderSide.BUY]
+            self.assertEqual(OrderStatus.CANCELLED, rh_order.state)
+            self.assertEqual(base_price, buy_order.base_price)
+            if replace_after_cancel:
+                # the replacement is placed right away
+                self.assertNotEqual(open_order.id, buy_order.id)
+                self.assertEqual(OrderStatus.OPEN, om.rh_orders[OrderSide.BUY].state)
+            else:
+                # the replacement waits for the next run
+                self.assertIs(open_order, buy_order)
+                self.assertIs(rh_order, om.rh_orders[OrderSide.BUY])
+
+    def test_replace_after_cancel_config(self):
+        self.assertFalse(backtest_order_manager(TEST_CONFIGS[1], InMemoryStateManager()).replace_after_cancel)
+        self.assertTrue(backtest_order_manager(dict(TEST_CONFIGS[1], replace_after_cancel=True),
+                                               InMemoryStateManager()).replace_after_cancel)
+
+    def test_cancel_not_confirmed(self):
+        om = backtest_order_manager(dict(TEST_CONFIGS[1], replace_after_cancel=True), InMemoryStateManager())
+        om.run()
+
+        # the service's wait for the cancel runs out, so it reports the order as still open
+        order_service = om.order_service
+        order_service.cancel_order = order_service.get_order_info
+        open_order = om.state_manager.open_orders[OrderSide.BUY]
+        base_price = open_order.base_price * 0.99
+        om.place_order(OrderSide.BUY, base_price, open_order.price * 0.99, open_order.quantity, 0)
+
+        # the order is kept, to be replaced on the next run
+        self.assertIs(open_order, om.state_manager.open_orders[OrderSide.BUY])
+        self.assertTrue(open_order.force_replace)
+        self.assertEqual(base_price, open_order.base_price)
+        self.assertEqual(OrderStatus.OPEN, order_service.get_order_info(open_order.id).state)
+
+        del order_service.cancel_order
+        order_service.tick()
+        om.run()
+        self.assertNotEqual(open_order.id, om.state_manager.open_orders[OrderSide.BUY].id)
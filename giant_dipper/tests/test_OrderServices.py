@@ -0,0 +1,39 @@
+import io
+from contextlib import redirect_stdout
+from unittest import TestCase
+from unittest.mock import patch
+
+from giant_dipper.Orders import Order
+from giant_dipper.OrderServices import RobinHoodOrderService, cancel_poll_delays, robinhood_order
+from giant_dipper.OrderStatuses import OrderStatus
+
+
+class OrderServicesTest(TestCase):
+    def test_cancel_poll_delays(self):
+        self.assertEqual([0.25, 0.5, 1, 1.25], list(cancel_poll_delays(3)))
+
+        delays = list(cancel_poll_delays(30))
+        self.assertEqual(30, sum(delays))
+        self.assertEqual(2, max(delays))
+
+    def test_robinhood_order(self):
+        self.assertEqual(Order(id='abc', state=OrderStatus.OPEN),
+                         robinhood_order({'id': 'abc', 'state': OrderStatus.OPEN, 'currency_pair_id': 'xyz'}))
+
+        # the errors of a failed order aren't kept in the Order, so they're printed
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(Order(), robinhood_order({'non_field_errors': ['Insufficient holdings.']}))
+        self.assertIn('Insufficient holdings.', output.getvalue())
+
+    @patch('giant_dipper.OrderServices.sleep')
+    @patch('robin_stocks.robinhood.get_crypto_order_info')
+    @patch('robin_stocks.robinhood.cancel_crypto_order')
+    def test_cancel_order_timeout(self, cancel_crypto_order, get_crypto_order_info, sleep):
+        get_crypto_order_info.return_value = {'id': 'abc', 'state': OrderStatus.OPEN}
+
+        # the order is returned as it is once the wait runs out, rather than failing the run
+        order = RobinHoodOrderService('DOGE', cancel_timeout=3).cancel_order('abc')
+        self.assertEqual(Order(id='abc', state=OrderStatus.OPEN), order)
+        cancel_crypto_order.assert_called_once_with('abc')
+        self.assertEqual(3, sum(args[0] for args, kwargs in sleep.call_args_list))
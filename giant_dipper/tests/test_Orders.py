@@ -0,0 +1,66 @@
+import os
+import pickle
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+from giant_dipper.Orders import Order
+from giant_dipper.OrderSides import OrderSide
+from giant_dipper.OrderStatuses import OrderStatus
+from giant_dipper.StateManagers import FileStateManager
+
+
+class OrdersTest(TestCase):
+    def test_dict_round_trip(self):
+        # shaped like a RobinHood order, values that aren't fields are left out
+        rh_order = {
+            'id': 'abc-123',
+            'side': OrderSide.BUY,
+            'price': '0.05',
+            'quantity': '100.00000000',
+            'state': OrderStatus.FILLED,
+            'rounded_executed_notional': '5.00',
+            'last_transaction_at': datetime(2021, 5, 1, 12, 30),
+            'currency_pair_id': 'xyz-789',
+            'executions': [{'quantity': '100.00000000'}]
+        }
+        order = Order.from_dict(rh_order)
+        self.assertEqual('abc-123', order.id)
+        self.assertEqual(OrderStatus.FILLED, order.state)
+        self.assertIsNone(order.base_price)
+        del rh_order['currency_pair_id'], rh_order['executions']
+        self.assertEqual(rh_order, order.to_dict())
+        self.assertEqual(order, Order.from_dict(order.to_dict()))
+        self.assertIsNone(Order.from_dict(None))
+
+        # failed RobinHood orders have no id, only errors
+        self.assertEqual(Order(), Order.from_dict({'non_field_errors': ['Insufficient holdings.']}))
+
+    def test_equality(self):
+        order = Order(id=1, price=0.5, state=OrderStatus.OPEN)
+        self.assertEqual(Order(id=1, price=0.5, state=OrderStatus.OPEN), order)
+        self.assertNotEqual(Order(id=1, price=0.5, state=OrderStatus.CANCELLED), order)
+        self.assertNotEqual(order.to_dict(), order)
+
+        # compared by value while they're updated in place, so they can't be hashed
+        with self.assertRaises(TypeError):
+            hash(order)
+
+    def test_pickle(self):
+        order = Order(id=1, side=OrderSide.SELL, price=0.5, base_price=0.45, quantity=10.0, window_size=1,
+                      window_duration_remaining=3)
+        self.assertEqual(order, pickle.loads(pickle.dumps(order)))
+
+    def test_file_state_manager(self):
+        with tempfile.TemporaryDirectory() as directory:
+            orders_file = os.path.join(directory, 'orders.yml')
+            state_manager = FileStateManager(orders_file, os.path.join(directory, 'historical_orders.yml'))
+            state_manager.open_orders = {
+                OrderSide.BUY: Order(id=2, price=0.45, base_price=0.5, quantity=10.0, window_size=0,
+                                     window_duration_remaining=0)
+            }
+            state_manager.save(silent=True)
+
+            loaded_state_manager = FileStateManager(orders_file, os.path.join(directory, 'historical_orders.yml'))
+            self.assertIsInstance(loaded_state_manager.open_orders[OrderSide.BUY], Order)
+            self.assertEqual(state_manager.open_orders, loaded_state_manager.open_orders)
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from giant_dipper.ResultCache import ResultCache, result_key
+from giant_dipper.tests.helpers import TEST_CONFIGS, random_tick_data
+
+TEST_SUMMARY = {'ticks_from_start': 100, 'buy': {'count': 3, 'order_value': 12.5, 'quantity': 170}}
+
+
+class ResultCacheTest(TestCase):
+    def test_get_and_put(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file = os.path.join(directory, 'results.sqlite')
+            result_cache = ResultCache(cache_file)
+            self.assertIsNone(result_cache.get('a'))
+
+            result_cache.put('a', (-12.5, 300, 0.99871, 1.1), TEST_SUMMARY)
+            self.assertEqual(((-12.5, 300, 0.99871, 1.1), TEST_SUMMARY), result_cache.get('a'))
+            result_cache.close()
+
+            # results persist
+            result_cache = ResultCache(cache_file)
+            self.assertEqual(((-12.5, 300, 0.99871, 1.1), TEST_SUMMARY), result_cache.get('a'))
+            result_cache.close()
+
+    def test_least_recently_used_evicted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result_cache = ResultCache(os.path.join(directory, 'results.sqlite'), max_bytes=400)
+            for key in ['a', 'b', 'c']:
+                result_cache.put(key, (1, 2, 3, 4), TEST_SUMMARY)
+            self.assertEqual(3, len(result_cache))
+
+            result_cache.get('a')
+            result_cache.put('d', (1, 2, 3, 4), TEST_SUMMARY)
+            self.assertEqual(3, len(result_cache))
+            self.assertIsNone(result_cache.get('b'))
+            for key in ['a', 'c', 'd']:
+                self.assertIsNotNone(result_cache.get(key))
+            result_cache.close()
+
+    def test_result_key(self):
+        tick_data = random_tick_data(100)
+        key = result_key(tick_data, TEST_CONFIGS[1], 1, 0.5)
+
+        # equivalent configurations share a key
+        equivalent_config = dict(TEST_CONFIGS[1], quantity_threshold_ratio=2.0, rebalance_interval=None)
+        self.assertEqual(key, result_key(random_tick_data(100), equivalent_config, 1, 0.5))
+
+        for other_key in [result_key(tick_data, TEST_CONFIGS[0], 1, 0.5),
+                          result_key(tick_data, TEST_CONFIGS[1], 2, 0.5),
+                          result_key(tick_data, TEST_CONFIGS[1], 1, 0.4),
+                          result_key(tick_data, TEST_CONFIGS[1], 1, 0.5, start_minute=1),
+                          result_key(random_tick_data(100, seed=2), TEST_CONFIGS[1], 1, 0.5)]:
+            self.assertNotEqual(key, other_key)
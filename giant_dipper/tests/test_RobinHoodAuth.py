@@ -0,0 +1,130 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import call, patch
+
+import requests
+import robin_stocks
+import yaml
+
+from giant_dipper.RobinHoodAuth import LOGIN_EXPIRATION_SECS, ROBIN_STOCKS_PICKLE_NAME, RobinHoodSession, \
+    SESSION_EXPIRATION_MARGIN
+
+
+class RobinHoodAuthTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.session_file = os.path.join(self.directory.name, 'session.yml')
+
+        # credentials without a Robinhood login, so nothing is sent to Robinhood
+        self.credentials_file = os.path.join(self.directory.name, 'credentials.yml')
+        with open(self.credentials_file, 'w') as credentials_file:
+            yaml.safe_dump({}, credentials_file)
+
+        self.session = RobinHoodSession(self.credentials_file, self.session_file)
+
+    def tearDown(self):
+        self.session.close()
+        self.assertNotIn(self.session.check_response, robin_stocks.robinhood.helper.SESSION.hooks['response'])
+        robin_stocks.robinhood.helper.SESSION.headers.pop('Authorization', None)
+        robin_stocks.robinhood.helper.set_login_state(False)
+        self.directory.cleanup()
+
+    def write_credentials(self, credentials):
+        with open(self.credentials_file, 'w') as credentials_file:
+            yaml.safe_dump({'robinhood': credentials}, credentials_file)
+
+    def write_session(self, expires_at):
+        with open(self.session_file, 'w') as session_file:
+            yaml.safe_dump({'token_type': 'Bearer', 'access_token': 'abc', 'expires_at': expires_at}, session_file)
+
+    def test_reuse_session(self):
+        self.write_session(time.time() + 2 * SESSION_EXPIRATION_MARGIN)
+
+        self.assertTrue(self.session.ensure_logged_in())
+        self.assertEqual('Bearer abc', robin_stocks.robinhood.helper.SESSION.headers['Authorization'])
+        self.assertGreater(self.session.take_auth_seconds(), 0)
+
+        # nothing more to do until the token expires or is rejected
+        self.assertTrue(self.session.ensure_logged_in())
+        self.assertEqual(0, self.session.take_auth_seconds())
+
+    def test_expired_session(self):
+        self.write_session(time.time() + SESSION_EXPIRATION_MARGIN / 2)
+
+        self.assertFalse(self.session.ensure_logged_in())
+        self.assertNotIn('Authorization', robin_stocks.robinhood.helper.SESSION.headers)
+
+    def test_rejected_session(self):
+        self.write_session(time.time() + 2 * SESSION_EXPIRATION_MARGIN)
+        self.assertTrue(self.session.ensure_logged_in())
+
+        response = requests.Response()
+        response.status_code = 401
+        self.session.check_response(response)
+
+        self.assertFalse(os.path.exists(self.session_file))
+        self.assertFalse(self.session.ensure_logged_in())
+
+    def test_response_hook(self):
+        hooks = robin_stocks.robinhood.helper.SESSION.hooks['response']
+        self.assertEqual(1, hooks.count(self.session.check_response))
+
+        other_session = RobinHoodSession(self.credentials_file, self.session_file)
+        other_session.close()
+        other_session.close()
+        self.assertEqual(1, hooks.count(self.session.check_response))
+        self.assertNotIn(other_session.check_response, hooks)
+
+    @patch('time.sleep')
+    @patch('robin_stocks.robinhood.login')
+    def test_login(self, login, sleep):
+        self.write_credentials({'username': 'user', 'password': 'pass', 'otp_secret': 'JBSWY3DPEHPK3PXP'})
+        login.side_effect = [
+            Exception('Robinhood is down'),
+            None,
+            {'token_type': 'Bearer', 'access_token': 'new', 'expires_in': 4 * SESSION_EXPIRATION_MARGIN}
+        ]
+
+        # robin_stocks' own session file holds the token from the last login, which mustn't be handed back again
+        pickle_file = os.path.join(self.directory.name, 'robinhood{}.pickle'.format(ROBIN_STOCKS_PICKLE_NAME))
+        with open(pickle_file, 'wb'):
+            pass
+
+        login_time = time.time()
+        self.assertTrue(self.session.ensure_logged_in())
+        self.assertFalse(os.path.exists(pickle_file))
+        self.assertEqual([call(2), call(4)], sleep.call_args_list)
+        self.assertEqual('Bearer new', robin_stocks.robinhood.helper.SESSION.headers['Authorization'])
+
+        self.assertEqual(3, login.call_count)
+        for args, kwargs in login.call_args_list:
+            self.assertEqual(('user', 'pass', LOGIN_EXPIRATION_SECS), args)
+            self.assertRegex(kwargs['mfa_code'], r'^\d{6}$')
+            self.assertEqual(self.directory.name, kwargs['pickle_path'])
+            self.assertEqual(ROBIN_STOCKS_PICKLE_NAME, kwargs['pickle_name'])
+
+        # the expiry is that of the token issued
+        with open(self.session_file) as session_file:
+            session = yaml.safe_load(session_file)
+        self.assertEqual('new', session['access_token'])
+        self.assertGreaterEqual(session['expires_at'], login_time + 4 * SESSION_EXPIRATION_MARGIN)
+        self.assertLessEqual(session['expires_at'], time.time() + 4 * SESSION_EXPIRATION_MARGIN)
+
+    @patch('time.sleep')
+    @patch('robin_stocks.robinhood.login')
+    def test_login_failure(self, login, sleep):
+        self.write_credentials({'username': 'user', 'password': 'pass'})
+        login.return_value = None
+
+        self.assertFalse(self.session.ensure_logged_in())
+        self.assertEqual([call(2), call(4)], sleep.call_args_list)
+        self.assertEqual(3, login.call_count)
+        self.assertIsNone(login.call_args.kwargs['mfa_code'])
+        self.assertFalse(os.path.exists(self.session_file))
+
+    @patch('robin_stocks.robinhood.login')
+    def test_no_login_credentials(self, login):
+        self.assertFalse(self.session.ensure_logged_in())
+        login.assert_not_called()
@@ -0,0 +1,135 @@
+import os
+import pickle
+import tempfile
+from unittest import TestCase
+
+import numpy
+
+from giant_dipper.Backtest import Backtest
+from giant_dipper.RebalanceEstimators import RebalanceEstimator
+from giant_dipper.StateManagers import GraphingStateManager, InMemoryStateManager, TICK_COLUMNS
+from giant_dipper.tests.helpers import TEST_CONFIGS, order_manager
+
+
+# records the account value after every tick, as account_values() gives it
+class AccountValueStateManager(InMemoryStateManager):
+    def __init__(self):
+        super().__init__()
+        self.all_account_values = []
+
+    def record_base_metrics(self, coin_price, holdings, buying_power):
+        super().record_base_metrics(coin_price, holdings, buying_power)
+        self.all_account_values.append(self.account_values()[5])
+
+
+class StateManagersTest(TestCase):
+    def test_max_drawdown(self):
+        for config in TEST_CONFIGS:
+            state_manager = AccountValueStateManager()
+            Backtest(order_manager(config, state_manager)).run()
+
+            peak_account_value = 0
+            max_drawdown = 0
+            for account_value in state_manager.all_account_values:
+                peak_account_value = max(peak_account_value, account_value)
+                max_drawdown = max(max_drawdown, 1 - account_value / peak_account_value)
+
+            self.assertEqual(peak_account_value, state_manager.metrics['peak_account_value'])
+            self.assertEqual(max_drawdown, state_manager.metrics['max_drawdown'])
+            self.assertGreater(max_drawdown, 0)
+
+            # the event-driven backtest records quiet ticks in bulk, with the same results
+            event_driven = InMemoryStateManager()
+            Backtest(order_manager(config, event_driven)).run(event_driven=True)
+            self.assertEqual(state_manager.metrics, event_driven.metrics)
+
+    def test_account_values_after_orders(self):
+        state_manager = InMemoryStateManager()
+        Backtest(order_manager(TEST_CONFIGS[0], state_manager)).run()
+
+        # order totals kept up as orders are recorded match those built from the metrics
+        self.assertIsNotNone(state_manager.order_totals)
+        account_values = state_manager.account_values()
+        state_manager.order_totals = None
+        self.assertEqual(account_values, state_manager.account_values())
+
+    def test_rebalance_estimate(self):
+        prices = numpy.random.default_rng(2).uniform(0.5, 1.5, 250)
+        for estimator in [RebalanceEstimator.ROLLING, RebalanceEstimator.EMA]:
+            state_manager = InMemoryStateManager()
+            for count, price in enumerate(prices.tolist()):
+                state_manager.record_rebalance_price(price, 60, estimator)
+                if count < 59:
+                    self.assertIsNone(state_manager.rebalance_price_estimate(60, estimator))
+
+            if estimator == RebalanceEstimator.ROLLING:
+                self.assertEqual(sum(prices[-60:].tolist()) / 60, state_manager.rebalance_price_estimate(60, estimator))
+                self.assertEqual(60, len(state_manager.metrics['rebalance_estimate']['prices']))
+            else:
+                expected = prices[0]
+                for price in prices[1:].tolist():
+                    expected += 2 / 61 * (price - expected)
+                self.assertEqual(expected, state_manager.rebalance_price_estimate(60, estimator))
+
+            # recording quiet ticks in bulk gives the same estimate
+            for chunk_sizes in [[250], [10, 200, 40], [70, 1, 179]]:
+                quiet_state_manager = InMemoryStateManager()
+                for chunk in numpy.split(prices, numpy.cumsum(chunk_sizes)[:-1]):
+                    quiet_state_manager.record_quiet_rebalance_ticks(chunk, 60, estimator)
+                self.assertEqual(state_manager.metrics['rebalance_estimate'],
+                                 quiet_state_manager.metrics['rebalance_estimate'])
+
+    def test_graphing_recorder(self):
+        state_manager = GraphingStateManager(capacity=100)
+        Backtest(order_manager(TEST_CONFIGS[0], state_manager)).run(event_driven=True)
+        self.assertEqual(20000, state_manager.tick_count)
+
+        all_tick_data = state_manager.all_tick_data
+        self.assertEqual(20000, len(all_tick_data))
+        for tick in [0, 12345, 19999]:
+            tick_data = all_tick_data[tick]
+            self.assertEqual(tick_data['holdings'] * tick_data['coin_price'] + tick_data['buying_power'],
+                             tick_data['account_value'])
+
+        fill_columns = state_manager.fill_columns()
+        self.assertEqual(len(state_manager.fills), len(fill_columns['fill_tick']))
+        self.assertGreater(len(state_manager.fills), 0)
+        for tick, for_rebalance, order in state_manager.fills:
+            self.assertIs(order, all_tick_data[tick]['filled_order'])
+            self.assertEqual(for_rebalance, all_tick_data[tick]['rebalance'])
+
+        # checkpoints leave out the room for more ticks
+        copy = pickle.loads(pickle.dumps(state_manager))
+        self.assertEqual(20000, len(copy.columns['coin_price']))
+        self.assertEqual(all_tick_data, copy.all_tick_data)
+
+    def test_graphing_downsample(self):
+        state_manager = GraphingStateManager()
+        Backtest(order_manager(TEST_CONFIGS[1], state_manager)).run(event_driven=True)
+        coin_prices = state_manager.tick_columns()['coin_price']
+
+        downsampled = state_manager.downsampled(500)
+        self.assertLessEqual(len(downsampled['tick']), 500)
+        self.assertEqual(coin_prices.min(), downsampled['coin_price'].min())
+        self.assertEqual(coin_prices.max(), downsampled['coin_price'].max())
+        self.assertTrue((coin_prices[downsampled['tick']] == downsampled['coin_price']).all())
+
+        # the lowest and highest price within every stretch of ticks are kept
+        bucket_size = -(-len(coin_prices) // 250)
+        for start in range(0, len(coin_prices), bucket_size):
+            kept = downsampled['tick'][(downsampled['tick'] >= start) & (downsampled['tick'] < start + bucket_size)]
+            self.assertEqual(coin_prices[start:start + bucket_size].max(), coin_prices[kept].max())
+            self.assertEqual(coin_prices[start:start + bucket_size].min(), coin_prices[kept].min())
+
+        with tempfile.TemporaryDirectory() as directory:
+            npz_file = os.path.join(directory, 'ticks.npz')
+            state_manager.save_npz(npz_file, max_points=500)
+            with numpy.load(npz_file) as saved:
+                self.assertTrue((downsampled['tick'] == saved['tick']).all())
+                self.assertTrue((state_manager.fill_columns()['fill_price'] == saved['fill_price']).all())
+
+            npy_directory = os.path.join(directory, 'ticks')
+            state_manager.save_npy(npy_directory)
+            for column in TICK_COLUMNS:
+                saved = numpy.load(os.path.join(npy_directory, column + '.npy'), mmap_mode='r')
+                self.assertTrue(numpy.array_equal(state_manager.tick_columns()[column], saved, equal_nan=True))
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from giant_dipper.Backtest import Backtest
+from giant_dipper.OrderManager import OrderManager
+from giant_dipper.OrderServices import CSVFileOrderService
+from giant_dipper.ResultCache import ResultCache
+from giant_dipper.StateManagers import InMemoryStateManager
+from giant_dipper.Sweep import config_checkpoint_file, config_file, load_end_state, run_config, run_sweep
+from giant_dipper.TickData import TickData
+from giant_dipper.tests.helpers import DATETIME_FORMAT, TEST_CONFIGS, random_tick_data
+
+
+class SweepTest(TestCase):
+    def test_run_sweep(self):
+        tick_data = random_tick_data(5000)
+        expected = [run_config(tick_data, config, 1, 0.5, DATETIME_FORMAT) for config in TEST_CONFIGS]
+
+        results = list(run_sweep(tick_data, TEST_CONFIGS, csv_datetime_format=DATETIME_FORMAT, processes=2))
+        self.assertEqual(len(TEST_CONFIGS), len(results))
+        for config, metrics in results:
+            self.assertEqual(expected[TEST_CONFIGS.index(config)], metrics)
+
+    def test_resume_from_checkpoint(self):
+        tick_data = random_tick_data(5000)
+        expected = run_config(tick_data, TEST_CONFIGS[0], 1, 0.5, DATETIME_FORMAT)
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint_file = config_checkpoint_file(directory, tick_data, TEST_CONFIGS[0], 1, 0.5, DATETIME_FORMAT)
+            self.assertNotEqual(checkpoint_file,
+                                config_checkpoint_file(directory, tick_data, TEST_CONFIGS[1], 1, 0.5, DATETIME_FORMAT))
+
+            # a backtest interrupted part of the way through
+            order_service = CSVFileOrderService(None, 1, 0.5, DATETIME_FORMAT, tick_data=tick_data)
+            backtest = Backtest(OrderManager.from_config(order_service, InMemoryStateManager(), TEST_CONFIGS[0],
+                                                         silent=True))
+            backtest.advance(2000)
+            backtest.save_checkpoint(checkpoint_file)
+
+            results = list(run_sweep(tick_data, TEST_CONFIGS[:1], csv_datetime_format=DATETIME_FORMAT, processes=1,
+                                     checkpoint_directory=directory))
+            self.assertEqual([(TEST_CONFIGS[0], expected)], results)
+            self.assertFalse(os.path.exists(checkpoint_file))
+
+    def test_extend_appended_data(self):
+        tick_data = random_tick_data(6000)
+        for minute_increments in [1, 7]:
+            for event_driven in [False, True]:
+                with tempfile.TemporaryDirectory() as directory:
+                    for rows in [2000, 3001, 3001, 4500, 6000]:
+                        prefix = TickData(tick_data.timestamps[:rows], tick_data.open[:rows], tick_data.low[:rows],
+                                          tick_data.high[:rows])
+                        for config in TEST_CONFIGS:
+                            self.assertEqual(
+                                run_config(prefix, config, minute_increments, 0.5, DATETIME_FORMAT,
+                                           event_driven=event_driven),
+                                run_config(prefix, config, minute_increments, 0.5, DATETIME_FORMAT,
+                                           event_driven=event_driven, state_directory=directory)
+                            )
+
+                    # the end state only carries over to quotes that extend the ones it covered
+                    state_file = config_file(directory, '.state', TEST_CONFIGS[0], minute_increments, 0.5,
+                                             DATETIME_FORMAT, 0)
+                    self.assertIsNotNone(load_end_state(state_file, tick_data))
+                    changed = TickData(tick_data.timestamps, tick_data.open, tick_data.low * 0.99, tick_data.high)
+                    self.assertIsNone(load_end_state(state_file, changed))
+                    self.assertIsNone(load_end_state(state_file, random_tick_data(5000)))
+
+    def test_result_cache(self):
+        tick_data = random_tick_data(5000)
+        expected = {config['price_increment_ratio']: run_config(tick_data, config, 1, 0.5, DATETIME_FORMAT)
+                    for config in TEST_CONFIGS}
+        with tempfile.TemporaryDirectory() as directory:
+            result_cache = ResultCache(os.path.join(directory, 'results.sqlite'))
+            self.assertEqual(expected[1.02], run_config(tick_data, TEST_CONFIGS[0], 1, 0.5, DATETIME_FORMAT,
+                                                        result_cache=result_cache))
+            self.assertEqual(1, len(result_cache))
+
+            for sweep in range(2):
+                results = list(run_sweep(tick_data, TEST_CONFIGS, csv_datetime_format=DATETIME_FORMAT, processes=2,
+                                         result_cache=result_cache))
+                self.assertEqual(len(TEST_CONFIGS), len(results))
+                for config, metrics in results:
+                    self.assertEqual(expected[config['price_increment_ratio']], metrics)
+                self.assertEqual(len(TEST_CONFIGS), len(result_cache))
+
+            # every configuration is cached now, so only the cached results are read
+            self.assertEqual(TEST_CONFIGS[0], results[0][0])
+            result_cache.close()
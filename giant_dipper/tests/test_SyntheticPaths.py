@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+import numpy
+
+from giant_dipper.Backtest import Backtest
+from giant_dipper.SyntheticPaths import BlockBootstrap, distribution_summary, score_configs
+from giant_dipper.StateManagers import InMemoryStateManager
+from giant_dipper.tests.helpers import TEST_CONFIGS, order_manager, random_tick_data
+
+TEST_HISTORY = random_tick_data(2000)
+
+
+class SyntheticPathsTest(TestCase):
+    def test_block_bootstrap(self):
+        bootstrap = BlockBootstrap(TEST_HISTORY, block_minutes=30)
+        paths = list(bootstrap.paths(5, 100, seed=1, batch_size=2))
+        self.assertEqual(5, len(paths))
+
+        historical_returns = TEST_HISTORY.open[1:] / TEST_HISTORY.open[:-1]
+        for path, same_seed_path in zip(paths, bootstrap.paths(5, 100, seed=1, batch_size=2)):
+            self.assertEqual(100, len(path))
+            self.assertEqual(TEST_HISTORY.open[0], path.open[0])
+            self.assertEqual(60, path.timestamps[1] - path.timestamps[0])
+            self.assertTrue((path.low <= path.open).all() and (path.open <= path.high).all())
+            self.assertEqual(path.open.tolist(), same_seed_path.open.tolist())
+
+            # moves are taken from the history in blocks of consecutive minutes
+            returns = path.open[1:30] / path.open[:29]
+            history_indexes = [numpy.abs(historical_returns - move).argmin() for move in returns]
+            self.assertTrue(numpy.allclose(returns, historical_returns[history_indexes]))
+            self.assertEqual(list(range(history_indexes[0], history_indexes[0] + 29)), history_indexes)
+
+        self.assertNotEqual(paths[0].open.tolist(), next(bootstrap.paths(1, 100, seed=2)).open.tolist())
+
+    def test_score_configs(self):
+        scores = score_configs(TEST_HISTORY, TEST_CONFIGS[:2], 6, 500, block_minutes=30, seed=3, processes=2,
+                               batch_size=4)
+        self.assertEqual((2, 6), scores.shape)
+
+        paths = BlockBootstrap(TEST_HISTORY, block_minutes=30).paths(6, 500, seed=3, batch_size=4)
+        for path_index, path in enumerate(paths):
+            for config_index, config in enumerate(TEST_CONFIGS[:2]):
+                metrics = Backtest(order_manager(config, InMemoryStateManager(), tick_data=path)).run()
+                self.assertEqual(metrics[2], scores[config_index, path_index])
+
+    def test_distribution_summary(self):
+        summary = distribution_summary(numpy.array([0.8, 0.9, 1.0, 1.1, 1.2]))
+        self.assertAlmostEqual(1.0, summary['mean'])
+        self.assertAlmostEqual(1.0, summary['p50'])
+        self.assertAlmostEqual(0.4, summary['gain_probability'])
+        self.assertAlmostEqual(0.82, summary['p5'])
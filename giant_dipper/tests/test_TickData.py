@@ -0,0 +1,174 @@
+import gzip
+import lzma
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy
+
+from giant_dipper.TickData import PRICE_GRID_DIVISIONS, TICK_CACHE_HEADER, TickData, TickStream, convert_csv, \
+    format_epoch_seconds, read_cache_header, tick_cache_is_current
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def write_csv(directory, rows, file_name='ticks.csv'):
+    csv_file = os.path.join(directory, file_name)
+    with open(csv_file, 'w') as file:
+        file.write('unix,date,symbol,open,high,low,close\n')
+        for date, open_price, high, low in rows:
+            file.write('0,{},DOGE/USD,{},{},{},0\n'.format(date, open_price, high, low))
+
+    return csv_file
+
+
+TEST_ROWS = [
+    ('2021-01-01 00:00:00', '0.0712', '0.0715', '0.0701'),
+    ('2021-01-01 00:01:00', '0.0709', '0.0711', '0.07'),
+    ('2021-01-01 00:02:00', '0.0703', '0.0720', '0.0699')
+]
+
+
+class TickDataTest(TestCase):
+    def test_from_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tick_data = TickData.from_csv(write_csv(directory, TEST_ROWS), DATETIME_FORMAT)
+
+        self.assertEqual(3, len(tick_data))
+        self.assertEqual('float64', tick_data.open.dtype.name)
+        self.assertEqual('int64', tick_data.timestamps.dtype.name)
+        self.assertEqual([float(row[1]) for row in TEST_ROWS], tick_data.open.tolist())
+        self.assertEqual([float(row[2]) for row in TEST_ROWS], tick_data.high.tolist())
+        self.assertEqual([float(row[3]) for row in TEST_ROWS], tick_data.low.tolist())
+        self.assertEqual(60, tick_data.timestamps[1] - tick_data.timestamps[0])
+
+        # dates can be recovered in their original format
+        self.assertEqual([row[0] for row in TEST_ROWS],
+                         [format_epoch_seconds(timestamp, DATETIME_FORMAT) for timestamp in tick_data.timestamps])
+
+        # other spellings of the same time come back normalized to UTC
+        offset_format = '%Y-%m-%d %H:%M:%S%z'
+        rows = [('2021-1-1 2:00:00+0200',) + TEST_ROWS[0][1:]]
+        with tempfile.TemporaryDirectory() as directory:
+            tick_data = TickData.from_csv(write_csv(directory, rows), offset_format)
+        self.assertEqual('2021-01-01 00:00:00+0000', format_epoch_seconds(tick_data.timestamps[0], offset_format))
+
+    def test_cache_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_file = write_csv(directory, TEST_ROWS)
+            from_csv = TickData.from_csv(csv_file, DATETIME_FORMAT)
+            cache_file = convert_csv(csv_file, DATETIME_FORMAT)
+            from_cache = TickData.from_cache(cache_file)
+
+            self.assertEqual(csv_file + '.ticks', cache_file)
+            for column in ['timestamps', 'open', 'low', 'high']:
+                self.assertEqual(getattr(from_csv, column).tolist(), getattr(from_cache, column).tolist())
+
+    def test_cache_is_current(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_file = write_csv(directory, TEST_ROWS)
+            cache_file = os.path.join(directory, 'other.ticks')
+            self.assertFalse(tick_cache_is_current(cache_file, csv_file, DATETIME_FORMAT))
+
+            convert_csv(csv_file, DATETIME_FORMAT, cache_file)
+            self.assertTrue(tick_cache_is_current(cache_file, csv_file, DATETIME_FORMAT))
+            self.assertFalse(tick_cache_is_current(cache_file, csv_file, '%Y-%m-%dT%H:%M:%S'))
+
+            # touching the file without changing its contents falls back to the hash
+            os.utime(csv_file, ns=(0, 0))
+            self.assertTrue(tick_cache_is_current(cache_file, csv_file, DATETIME_FORMAT))
+
+            # and the cache takes the new modified time, so the next check doesn't hash it again
+            with open(cache_file, 'rb') as file:
+                self.assertEqual(0, read_cache_header(file.read(TICK_CACHE_HEADER.size))[3])
+
+            write_csv(directory, TEST_ROWS[:2])
+            self.assertFalse(tick_cache_is_current(cache_file, csv_file, DATETIME_FORMAT))
+
+            # a stale cache is rebuilt on load
+            self.assertEqual(2, len(TickData.from_csv_cached(csv_file, DATETIME_FORMAT, cache_file)))
+
+            # formats too long for the header can't be cached
+            with self.assertRaises(Exception):
+                TickData.from_csv(csv_file, DATETIME_FORMAT).write_cache(cache_file, csv_file, '%Y' * 33)
+            self.assertEqual(2, len(TickData.from_cache(cache_file)))
+
+    def test_stream_chunks(self):
+        rows = [('2021-01-01 00:{:02d}:00'.format(minute), str(1 + minute / 100), str(1.5 + minute / 100),
+                 str(0.5 + minute / 100)) for minute in range(25)]
+        with tempfile.TemporaryDirectory() as directory:
+            expected = TickData.from_csv(write_csv(directory, rows, 'all.csv'), DATETIME_FORMAT)
+
+            # monthly-style files, compressed in different formats, named so they sort in order
+            for file_name, file_rows, opener in [('part1.csv.gz', rows[:10], gzip.open),
+                                                 ('part2.csv.xz', rows[10:18], lzma.open),
+                                                 ('part3.csv', rows[18:], open)]:
+                with open(write_csv(directory, file_rows, 'source.csv'), 'rb') as source, \
+                        opener(os.path.join(directory, file_name), 'wb') as target:
+                    target.write(source.read())
+
+            stream = TickStream(os.path.join(directory, 'part*'), DATETIME_FORMAT, chunk_size=4)
+            for start_minute in [0, 3, 10, 12, 24]:
+                chunk_starts = []
+                opens = []
+                for chunk_start, chunk in stream.chunks(start_minute):
+                    self.assertLessEqual(len(chunk), 4)
+                    self.assertEqual(start_minute + len(opens), chunk_start)
+                    chunk_starts.append(chunk_start)
+                    opens.extend(chunk.open.tolist())
+
+                self.assertEqual(expected.open.tolist()[start_minute:], opens)
+                self.assertEqual(start_minute, chunk_starts[0])
+
+    def test_range_index(self):
+        random = numpy.random.default_rng(1)
+        lows = random.random(300)
+        highs = lows + random.random(300)
+        tick_data = TickData(numpy.arange(300, dtype=numpy.int64), lows, lows, highs)
+        range_index = tick_data.range_index()
+        for start, end in random.integers(0, 300, (500, 2)):
+            start, end = min(start, end), max(start, end) + 1
+            self.assertEqual(lows[start:end].min(), range_index.lowest(start, end))
+            self.assertEqual(highs[start:end].max(), range_index.highest(start, end))
+
+    def test_resample(self):
+        random = numpy.random.default_rng(2)
+        lows = random.random(100)
+        tick_data = TickData(60 * numpy.arange(100, dtype=numpy.int64), lows + 0.5, lows, lows + 1)
+        for minutes in [1, 5, 7, 60, 100]:
+            resampled = tick_data.resample(minutes)
+            self.assertEqual(len(range(0, 100, minutes)), len(resampled))
+            for row, start in enumerate(range(0, 100, minutes)):
+                self.assertEqual(60 * start, resampled.timestamps[row])
+                self.assertEqual(tick_data.open[start], resampled.open[row])
+                self.assertEqual(lows[start:start + minutes].min(), resampled.low[row])
+                self.assertEqual(tick_data.high[start:start + minutes].max(), resampled.high[row])
+
+    def test_price_grid(self):
+        random = numpy.random.default_rng(3)
+        prices = numpy.exp(random.normal(-3, 1, 1000))
+        tick_data = TickData(numpy.arange(1000, dtype=numpy.int64), prices, prices, prices)
+        price_grid = tick_data.price_grid(1.01)
+        self.assertIs(price_grid, tick_data.price_grid(1.01))
+
+        level_ratio = pow(1.01, 1 / PRICE_GRID_DIVISIONS)
+        for price, level in zip(prices.tolist(), price_grid.low_levels.tolist()):
+            self.assertEqual(price_grid.level(price), level)
+            self.assertLessEqual(level_ratio ** (level - 1), price)
+            self.assertLess(price, level_ratio ** (level + 2))
+
+        # a grid is kept for each ratio and multipliers
+        coarse_grid = tick_data.price_grid(1.05)
+        scaled_grid = tick_data.price_grid(1.01, 2, 2)
+        self.assertIsNot(price_grid, coarse_grid)
+        self.assertIsNot(price_grid, scaled_grid)
+        self.assertIs(price_grid, tick_data.price_grid(1.01))
+        self.assertIs(scaled_grid, tick_data.price_grid(1.01, 2, 2))
+        self.assertNotEqual(coarse_grid.low_levels.tolist(), price_grid.low_levels.tolist())
+        self.assertEqual([scaled_grid.level(price * 2) for price in prices.tolist()], scaled_grid.low_levels.tolist())
+
+        # the first rows share the grid and range index rather than building their own
+        head = tick_data.head(500)
+        self.assertIs(scaled_grid, head.price_grid(1.01, 2, 2))
+        self.assertIs(tick_data.range_index(), head.head(100).range_index())
+        self.assertEqual(prices[:500].min(), head.range_index().lowest(0, len(head)))
@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+from giant_dipper.Sweep import run_config
+from giant_dipper.Tuning import MedianPruner, SuccessiveHalvingPruner, Trial, TrialState, sample_configs, search
+from giant_dipper.tests.helpers import DATETIME_FORMAT, TEST_CONFIGS, random_tick_data
+
+SEARCH_SPACE = {
+    'price_increment_ratio': (1.005, 1.05),
+    'order_holdings_threshold': [0.2, 0.3, 0.5],
+    'quantity_threshold_ratio': (1.1, 2.0),
+    'rebalance_interval': (10, 200)
+}
+
+
+def trial_with_reports(number, reports, state=TrialState.RUNNING):
+    trial = Trial(number, {})
+    trial.reports = reports
+    trial.state = state
+
+    return trial
+
+
+class TuningTest(TestCase):
+    def test_sample_configs(self):
+        configs = list(sample_configs(dict(SEARCH_SPACE, window_factor=0.7), 50, seed=1))
+        self.assertEqual(configs, list(sample_configs(dict(SEARCH_SPACE, window_factor=0.7), 50, seed=1)))
+        for config in configs:
+            self.assertTrue(1.005 <= config['price_increment_ratio'] <= 1.05)
+            self.assertIn(config['order_holdings_threshold'], [0.2, 0.3, 0.5])
+            self.assertIsInstance(config['rebalance_interval'], int)
+            self.assertEqual(0.7, config['window_factor'])
+
+    def test_search_without_pruning(self):
+        tick_data = random_tick_data(3000)
+        trials = list(search(tick_data, TEST_CONFIGS, 500, csv_datetime_format=DATETIME_FORMAT, processes=2))
+        self.assertEqual(len(TEST_CONFIGS), len(trials))
+        for trial in trials:
+            self.assertEqual(TrialState.COMPLETE, trial.state)
+            self.assertEqual(run_config(tick_data, trial.config, 1, 0.5, DATETIME_FORMAT), trial.metrics)
+            self.assertEqual(6, len(trial.reports))
+            self.assertEqual(trial.metrics[2], trial.reports[-1])
+
+    def test_search_with_pruning(self):
+        tick_data = random_tick_data(3000)
+        configs = list(sample_configs(SEARCH_SPACE, 12, seed=2))
+        trials = list(search(tick_data, configs, 300, pruner=MedianPruner(min_trials=2), processes=1,
+                             csv_datetime_format=DATETIME_FORMAT))
+
+        self.assertEqual(configs, [trial.config for trial in trials])
+        pruned = [trial for trial in trials if trial.state == TrialState.PRUNED]
+        self.assertTrue(pruned)
+        for trial in trials[:2]:
+            self.assertEqual(TrialState.COMPLETE, trial.state)
+        for trial in pruned:
+            self.assertLess(len(trial.reports), 10)
+            self.assertIsNone(trial.metrics)
+        for trial in trials:
+            if trial.state == TrialState.COMPLETE:
+                self.assertEqual(run_config(tick_data, trial.config, 1, 0.5, DATETIME_FORMAT), trial.metrics)
+
+    def test_median_pruner(self):
+        pruner = MedianPruner(min_trials=2, warmup_reports=1)
+        trials = [trial_with_reports(0, [1.0, 1.2, 1.3], TrialState.COMPLETE),
+                  trial_with_reports(1, [1.0, 1.0, 1.1], TrialState.COMPLETE),
+                  trial_with_reports(2, [0.5, 1.05], TrialState.PRUNED)]
+
+        self.assertFalse(pruner.should_prune(trial_with_reports(3, [0.1]), trials))
+        self.assertFalse(pruner.should_prune(trial_with_reports(3, [0.1, 1.1]), trials))
+        self.assertTrue(pruner.should_prune(trial_with_reports(3, [0.1, 1.09]), trials))
+        self.assertFalse(MedianPruner(min_trials=3).should_prune(trial_with_reports(3, [0.1, 0.1]), trials))
+
+    def test_successive_halving_pruner(self):
+        pruner = SuccessiveHalvingPruner(reduction_factor=2, min_reports=1)
+        self.assertEqual([1, 2, 4, 8], [reports for reports in range(1, 10) if pruner.is_rung(reports)])
+
+        trials = [trial_with_reports(number, [value]) for number, value in enumerate([1.0, 0.9, 1.1])]
+        self.assertFalse(pruner.should_prune(trials[0], trials[:1]))
+        self.assertTrue(pruner.should_prune(trials[1], trials[:2]))
+        self.assertTrue(pruner.should_prune(trials[0], trials))
+        self.assertFalse(pruner.should_prune(trials[2], trials))
+        self.assertFalse(pruner.should_prune(trial_with_reports(3, [0.1, 0.1, 0.1]), trials))
+
+        for reduction_factor, min_reports in [(2, 0), (1, 1), (0.5, 1)]:
+            with self.assertRaises(ValueError):
+                SuccessiveHalvingPruner(reduction_factor=reduction_factor, min_reports=min_reports)
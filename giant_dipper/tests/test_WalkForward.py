@@ -0,0 +1,48 @@
+import math
+from unittest import TestCase
+
+from giant_dipper.Backtest import Backtest
+from giant_dipper.StateManagers import InMemoryStateManager
+from giant_dipper.WalkForward import Segment, walk_forward, walk_forward_segments
+from giant_dipper.tests.helpers import DATETIME_FORMAT, TEST_CONFIGS, order_manager, random_tick_data
+
+
+class WalkForwardTest(TestCase):
+    def test_walk_forward_segments(self):
+        self.assertEqual([Segment(0, 100, 100, 130), Segment(30, 130, 130, 160), Segment(60, 160, 160, 190)],
+                         walk_forward_segments(200, 100, 30))
+        self.assertEqual([Segment(10, 110, 110, 140), Segment(60, 160, 160, 190)],
+                         walk_forward_segments(200, 100, 30, start_minute=10, step_minutes=50))
+        self.assertEqual([], walk_forward_segments(120, 100, 30))
+
+    def test_walk_forward(self):
+        tick_data = random_tick_data(4000)
+        segments = walk_forward_segments(len(tick_data), 1500, 800)
+        results = walk_forward(tick_data, TEST_CONFIGS, segments, warmup_minutes=300, processes=2,
+                               csv_datetime_format=DATETIME_FORMAT)
+
+        self.assertEqual(3, len(results['segments']))
+        for segment_result in results['segments']:
+            train_changes = [metrics[2] for metrics in segment_result['train']]
+            self.assertEqual(train_changes.index(max(train_changes)), segment_result['selected'])
+            self.assertEqual(len(TEST_CONFIGS), len(segment_result['test']))
+
+        self.assertEqual(len(segments), sum(config_result['selected'] for config_result in results['configs']))
+        self.assertAlmostEqual(math.prod(segment_result['test'][segment_result['selected']][2]
+                                         for segment_result in results['segments']), results['compounded_change'])
+
+        # the first training window has no warm-up, so it's measured like a backtest of just that window
+        first_segment = results['segments'][0]
+        for config, metrics in zip(TEST_CONFIGS, first_segment['train']):
+            om = order_manager(config, InMemoryStateManager(), tick_data=tick_data.head(1500))
+            self.assertEqual(Backtest(om).run(), metrics)
+
+        # later windows only measure the account's change after the warm-up
+        config = TEST_CONFIGS[1]
+        om = order_manager(config, InMemoryStateManager(), tick_data=tick_data.head(3100), start_minute=2000)
+        backtest = Backtest(om)
+        backtest.advance(300)
+        baseline_account_values = om.state_manager.account_values()
+        backtest.run()
+        self.assertEqual(om.state_manager.compute_metrics_since(baseline_account_values),
+                         results['segments'][1]['test'][1])
@@ -13,7 +13,7 @@ setup(
     name='giant_dipper',
     version='0.1.3',
     packages=['giant_dipper'],
-    install_requires=['robin-stocks', 'PyYAML', 'pyotp'],
+    install_requires=['robin-stocks', 'PyYAML', 'pyotp', 'numpy'],
     url='https://github.com/wheaney/giant-dipper',
     license='GPL-3.0-only',
     author='Wayne Heaney',